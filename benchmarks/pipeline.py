@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+Times each stage of uploading and reading a FG on a laptop,
+driving 'fg.create_fg', 'fg.upload_fg' and 'fg.read_features'
+against moto's in-process S3 and Glue, with the lambda handler invoked
+in-process and the local engine in place of Athena.
+Upload stages are read from the spans the client and the lambda record.
+
+    python benchmarks/pipeline.py --sizes 1000 100000 --output results.json
+    python benchmarks/pipeline.py --baseline results.json
+
+Schema inference and parquet encoding use spark when a java runtime is found,
+else pyarrow stands in for them, the rest of the upload path unchanged.
+With a baseline, stages slower than it by more than the tolerance are reported
+and the exit status is 1.
+Needs the package installed, eg "pip install -e .", and moto, a dev dependency.
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+CLIENT, APP, ENTITY = "bench", "pipeline", "user"
+DAYS = 30
+START_SECS = 1_561_939_200  # 2019-07-01 UTC
+LAMBDA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "featurestore",
+    "lambda",
+    "lambda.py",
+)
+
+# "stage@rows" -> {"secs", "rows_per_sec"}
+Results = Dict[str, Dict[str, float]]
+
+# stage -> the span timing it, summed over partitions
+UPLOAD_STAGES = {
+    "partition": "fg.partition",
+    "schema_inference": "fg.schema_inference",
+    "parquet_encode": "fg.parquet_encode",
+    "s3_upload": "fg.s3_upload",
+    # the lambda round trip, committing the upload without copying its files
+    "lambda_commit": "fg.lambda",
+    "partition_registration": "lambda.glue_add_partitions",
+    "manifest_commit": "lambda.manifest",
+}
+
+
+def frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "uid": rng.integers(0, 1_000_000, rows),
+            "ts": START_SECS + rng.integers(0, DAYS * 86400, rows),
+            "score": rng.random(rows),
+            "name": rng.choice(["a", "bb", "ccc"], rows),
+        }
+    )
+
+
+@contextmanager
+def timed(results: Results, stage: str, rows: int) -> Iterator[None]:
+    started = time.perf_counter()
+    yield
+    record(results, stage, rows, time.perf_counter() - started)
+
+
+def record(results: Results, stage: str, rows: int, secs: float) -> None:
+    results[f"{stage}@{rows}"] = {"secs": secs, "rows_per_sec": rows / secs}
+    print(f"{stage:>24} {rows:>9} rows : {secs:8.3f}s")
+
+
+def run_size(rows: int, encoder: str, work_dir: str, results: Results) -> None:
+    from featurestore.clients import aws_s3, fg, instrumentation
+
+    version = f"n{rows}"
+    df = frame(rows)
+
+    created, _ = fg.create_fg(
+        CLIENT, APP, ENTITY, version, "ts", "s", pandas_df=df.head(100)
+    )
+    assert created, "create_fg failed"
+
+    collector = instrumentation.add_exporter(instrumentation.MemoryCollector())
+    try:
+        with timed(results, "upload", rows):
+            uploaded, response = fg.upload_fg(CLIENT, APP, ENTITY, version, df)
+        assert uploaded, f"upload_fg failed {response}"
+        for stage, span_name in UPLOAD_STAGES.items():
+            secs = sum(s.secs for s in collector.by_name(span_name))
+            suffix = f"_{encoder}" if span_name in _ENCODER_SPANS else ""
+            record(results, f"{stage}{suffix}", rows, secs)
+    finally:
+        instrumentation.remove_exporter(collector)
+
+    with timed(results, "read_local", rows):
+        read = fg.read_features(
+            CLIENT, APP, ENTITY, version, START_SECS, START_SECS + DAYS * 86400
+        )
+        assert read is not None and len(read[0]) == rows, "local read failed"
+
+    # an athena result csv, read back as read_fg would
+    result_key = f"{fg.S3_STAGE_QUERY_FOLDER}/{version}/{fg._uuid()}.csv"
+    result_csv = os.path.join(work_dir, f"result-{version}.csv")
+    df.to_csv(result_csv, index=False)
+    aws_s3.handle(fg.S3_STAGE_BUCKET, result_key).upload_file(result_csv)
+    with timed(results, "read_result_csv", rows):
+        tmp_file = fg._download_from_s3(f"s3://{fg.S3_STAGE_BUCKET}/{result_key}")
+        assert len(pd.read_csv(tmp_file)) == rows
+    os.remove(tmp_file)
+
+
+def run(sizes: Sequence[int], encoder: str) -> Results:
+    # moto intercepts every boto3 client created within it
+    for name in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ[name] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "ap-south-1"
+    # files of the run, including the local engine's cache, stay in work_dir
+    work_dir = tempfile.mkdtemp(prefix="featurestore-bench-")
+    os.environ["FEATURESTORE_LOCAL_CACHE"] = os.path.join(work_dir, "cache")
+    from moto import mock_aws
+
+    from featurestore.clients import aws_glue, aws_s3, fg, spark_utils
+
+    spark_utils.SPARK_WAREHOUSE = os.path.join(work_dir, "spark")
+    results: Results = {}
+    try:
+        with mock_aws(), _in_process_lambda(_load_lambda()):
+            aws_s3._s3().create_bucket(
+                Bucket=fg.S3_BUCKET,
+                CreateBucketConfiguration={"LocationConstraint": "ap-south-1"},
+            )
+            aws_glue._glue().create_database(DatabaseInput={"Name": fg.GLUE_DB_NAME})
+            fg.LOCAL_READ_MAX_BYTES = sys.maxsize
+            # the client and lambda log every call at info
+            logging.getLogger().setLevel(logging.WARNING)
+            with _arrow_encoding() if encoder == "arrow" else _no_patch():
+                for rows in sizes:
+                    run_size(rows, encoder, work_dir, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results: Results, baseline: Results, tolerance: float) -> List[str]:
+    """stages of results slower than the baseline by more than tolerance"""
+    regressions = []
+    for key in sorted(results.keys() & baseline.keys()):
+        ratio = results[key]["secs"] / baseline[key]["secs"]
+        if ratio > tolerance:
+            regressions.append(f"{key} took {ratio:.2f}x the baseline")
+    return regressions
+
+
+def _load_lambda() -> Any:
+    spec = importlib.util.spec_from_file_location("featurestore_lambda", LAMBDA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# spans timing stages done by spark, or pyarrow standing in for it
+_ENCODER_SPANS = {"fg.schema_inference", "fg.parquet_encode"}
+
+
+@contextmanager
+def _in_process_lambda(lambda_fn: Any) -> Iterator[None]:
+    """routes the client's lambda invocations to the handler, run in-process"""
+    from featurestore.clients import aws_lambda
+
+    def invoke(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # a json round trip, as the lambda runtime would do
+        event = json.loads(json.dumps(payload))
+        result = lambda_fn.handler(event, None)
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "Payload": io.BytesIO(json.dumps(result).encode("utf-8")),
+        }
+
+    original, aws_lambda.invoke = aws_lambda.invoke, invoke
+    try:
+        yield
+    finally:
+        aws_lambda.invoke = original
+
+
+@contextmanager
+def _arrow_encoding() -> Iterator[None]:
+    """pyarrow in place of spark, to infer the schema and encode parquet"""
+    import pyarrow as pa
+
+    from featurestore.clients import arrow_utils, fg
+
+    def get_schema(pandas_df: pd.DataFrame) -> Dict[str, str]:
+        arrow_schema = pa.Schema.from_pandas(pandas_df, preserve_index=False)
+        return arrow_utils.hive_schema(arrow_schema)
+
+    def encode(
+        pandas_df: pd.DataFrame,
+        schema: Dict[str, str],
+        fpath: str,
+        bucketing: Optional[Tuple[str, int]],
+    ) -> List[Tuple[Optional[int], str]]:
+        assert bucketing is None, "bucketed FGs need spark"
+        os.makedirs(fpath)
+        pq = os.path.join(fpath, "part-00000.parquet")
+        pandas_df.to_parquet(pq, index=False)
+        return [(None, pq)]
+
+    originals = fg._get_pandas_schema, fg._encode_parquet
+    fg._get_pandas_schema, fg._encode_parquet = get_schema, encode
+    try:
+        yield
+    finally:
+        fg._get_pandas_schema, fg._encode_parquet = originals
+
+
+@contextmanager
+def _no_patch() -> Iterator[None]:
+    yield
+
+
+def _meta(encoder: str) -> Dict[str, Any]:
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "encoder": encoder,
+        "at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="results json of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--no-spark", action="store_true")
+    args = parser.parse_args()
+
+    use_spark = not args.no_spark and shutil.which("java") is not None
+    encoder = "spark" if use_spark else "arrow"
+    results = run(args.sizes, encoder)
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": _meta(encoder), "results": results}, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
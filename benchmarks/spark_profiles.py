@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares pandas <-> spark conversion time across spark session profiles.
+Each profile runs in its own process, as jvm settings are fixed at startup.
+Needs the package installed, eg "pip install -e .", and a java runtime.
+
+    python benchmarks/spark_profiles.py --rows 1000000 --profiles local multicore
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "uid": rng.integers(0, 1_000_000, rows),
+            "ts": rng.integers(1_560_000_000, 1_570_000_000, rows),
+            "score": rng.random(rows),
+            "flag": rng.random(rows) > 0.5,
+            "name": rng.choice(["a", "bb", "ccc"], rows),
+        }
+    )
+
+
+def run_profile(profile: str, rows: int) -> dict:
+    from featurestore.clients import spark_utils
+
+    spark_utils.set_profile(profile)
+    df = frame(rows)
+    schema = {
+        "uid": "bigint",
+        "ts": "bigint",
+        "score": "double",
+        "flag": "boolean",
+        "name": "string",
+    }
+    # warm up the jvm
+    spark_utils.pandas2spark(df.head(100)).count()
+
+    timings = {}
+    started = time.perf_counter()
+    inferred = spark_utils.pandas2spark(df)
+    inferred.count()
+    timings["pandas2spark_inferred"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    hinted = spark_utils.pandas2spark(df, schema)
+    hinted.count()
+    timings["pandas2spark_schema"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    hinted.toPandas()
+    timings["toPandas"] = time.perf_counter() - started
+
+    return {"profile": profile, "rows": rows, "secs": timings}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--profiles", nargs="+", default=["local", "multicore"])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_profile(args.child, args.rows)))
+        return
+
+    for profile in args.profiles:
+        cmd = [sys.executable, __file__, "--rows", str(args.rows), "--child", profile]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        secs = ", ".join(f"{k} {v:.2f}s" for k, v in result["secs"].items())
+        print(f"{profile:>8} {args.rows} rows : {secs}")
+
+
+if __name__ == "__main__":
+    main()
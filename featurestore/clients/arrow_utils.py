@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, Sequence, Tuple
+
+from . import str_utils
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+Schema = Dict[str, Any]
+
+
+@lru_cache(maxsize=None)
+def _primitive_hive_types() -> Sequence[Tuple[Callable[[Any], bool], str]]:
+    import pyarrow as pa
+
+    return [
+        (pa.types.is_boolean, "boolean"),
+        (pa.types.is_int8, "tinyint"),
+        (pa.types.is_int16, "smallint"),
+        (pa.types.is_int32, "int"),
+        (pa.types.is_int64, "bigint"),
+        (pa.types.is_uint8, "smallint"),
+        (pa.types.is_uint16, "int"),
+        (pa.types.is_uint32, "bigint"),
+        (pa.types.is_uint64, "decimal(20,0)"),
+        (pa.types.is_float16, "float"),
+        (pa.types.is_float32, "float"),
+        (pa.types.is_float64, "double"),
+        (pa.types.is_string, "string"),
+        (pa.types.is_large_string, "string"),
+        # all null columns, as typed by a sample
+        (pa.types.is_null, "string"),
+        (pa.types.is_binary, "binary"),
+        (pa.types.is_large_binary, "binary"),
+        (pa.types.is_fixed_size_binary, "binary"),
+        (pa.types.is_date, "date"),
+        (pa.types.is_timestamp, "timestamp"),
+    ]
+
+
+def hive_schema(arrow_schema: pa.Schema) -> Schema:
+    """
+    hive schema, as "describe table" would list it, of the arrow schema,
+    with top level column names sanitised
+    """
+    schema = [
+        (str_utils.sanitise(field.name), hive_type(field.type))
+        for field in arrow_schema
+    ]
+
+    cols = [col for col, _ in schema]
+    assert len(cols) == len(
+        set(cols)
+    ), f"Schema has duplicate column names after sanitization {cols}"
+
+    return dict(schema)
+
+
+def hive_type(arrow_type: pa.DataType) -> str:
+    import pyarrow as pa
+
+    if pa.types.is_dictionary(arrow_type):
+        return hive_type(arrow_type.value_type)
+    if pa.types.is_decimal(arrow_type):
+        return f"decimal({arrow_type.precision},{arrow_type.scale})"
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return f"array<{hive_type(arrow_type.value_type)}>"
+    if pa.types.is_map(arrow_type):
+        key, item = hive_type(arrow_type.key_type), hive_type(arrow_type.item_type)
+        return f"map<{key},{item}>"
+    if pa.types.is_struct(arrow_type):
+        fields = [
+            f"{arrow_type[i].name}:{hive_type(arrow_type[i].type)}"
+            for i in range(arrow_type.num_fields)
+        ]
+        return f"struct<{','.join(fields)}>"
+
+    for matches, name in _primitive_hive_types():
+        if matches(arrow_type):
+            return name
+
+    raise ValueError(f"Unsupported arrow type {arrow_type}")
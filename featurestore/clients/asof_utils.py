@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from . import ist_utils, partition_utils, str_utils
+
+ROW_ID_COL: str = "spine_row_id"
+RANK_COL: str = "asof_rank"
+
+
+class FeatureRef(NamedTuple):
+    """
+    Columns of a FG to be joined onto a spine,
+    key is the entity column present in both the spine and the FG,
+    max_age_secs bounds how stale a joined feature row may be, unbounded if absent
+    """
+
+    client: str
+    app: str
+    entity: str
+    version: str
+    key: str
+    columns: Sequence[str]
+    max_age_secs: Optional[int] = None
+
+
+# (feature ref, glue table name, fg time_col, fg time_col_unit)
+ResolvedRef = Tuple[FeatureRef, str, str, str]
+
+
+def feature_alias(ref: FeatureRef, col: str) -> str:
+    """name of a joined feature column in the training set"""
+    return str_utils.sanitise(f"{ref.entity}_{ref.version}") + "__" + col
+
+
+def finer_unit(unit_a: str, unit_b: str) -> str:
+    divisors = ist_utils.EPOCH_DIVISORS
+    return unit_a if divisors[unit_a] >= divisors[unit_b] else unit_b
+
+
+def scaled(expr: str, unit: str, target_unit: str) -> str:
+    """sql expression converting an epoch expr in unit to the finer target_unit"""
+    factor = ist_utils.EPOCH_DIVISORS[target_unit] // ist_utils.EPOCH_DIVISORS[unit]
+    return expr if factor == 1 else f"({expr} * {factor})"
+
+
+def asof_query(
+    spine_table: str,
+    spine_time_col: str,
+    spine_time_unit: str,
+    spine_range: Tuple[int, int],
+    refs: Sequence[ResolvedRef],
+) -> str:
+    """
+    Single Athena query joining each spine row with the latest row of every FG,
+    at or before the spine row time.
+    spine_range is the [start, end) epoch secs of the spine times,
+    used to prune the FG partitions.
+    """
+    ctes = [f"spine AS (SELECT * FROM {spine_table})"]
+    selects = ["spine.*"]
+    joins: List[str] = []
+    for i, resolved in enumerate(refs):
+        ref = resolved[0]
+        alias = f"f{i}"
+        ranked = _ranked_features(
+            resolved, spine_time_col, spine_time_unit, spine_range
+        )
+        ctes.append(f"{alias} AS ({ranked})")
+        selects.extend(f"{alias}.{c} AS {feature_alias(ref, c)}" for c in ref.columns)
+        joins.append(
+            f"LEFT JOIN {alias} ON spine.{ROW_ID_COL} = {alias}.{ROW_ID_COL}"
+            f" AND {alias}.{RANK_COL} = 1"
+        )
+
+    return (
+        "WITH " + ",\n".join(ctes) + "\n"
+        f"SELECT {', '.join(selects)} FROM spine\n" + "\n".join(joins) + ";"
+    )
+
+
+def _ranked_features(
+    resolved: ResolvedRef,
+    spine_time_col: str,
+    spine_time_unit: str,
+    spine_range: Tuple[int, int],
+) -> str:
+    ref, table, fg_time_col, fg_time_unit = resolved
+    unit = finer_unit(spine_time_unit, fg_time_unit)
+    fg_time = scaled(f"t.{fg_time_col}", fg_time_unit, unit)
+    spine_time = scaled(f"s.{spine_time_col}", spine_time_unit, unit)
+
+    conditions = [
+        _partition_predicate(ref, spine_range, "t"),
+        f"{fg_time} <= {spine_time}",
+    ]
+    if ref.max_age_secs is not None:
+        max_age = ist_utils.from_epoch_secs(ref.max_age_secs, unit)
+        conditions.append(f"{fg_time} > {spine_time} - {max_age}")
+
+    cols = ", ".join(f"t.{col}" for col in ref.columns)
+    return (
+        f"SELECT s.{ROW_ID_COL}, {cols}, row_number() OVER ("
+        f"PARTITION BY s.{ROW_ID_COL} ORDER BY {fg_time} DESC) AS {RANK_COL}"
+        f" FROM spine s JOIN {table} t ON s.{ref.key} = t.{ref.key}"
+        f" WHERE {' AND '.join(conditions)}"
+    )
+
+
+def _partition_predicate(
+    ref: FeatureRef, spine_range: Tuple[int, int], alias: str
+) -> str:
+    start_secs, end_secs = spine_range
+    if ref.max_age_secs is None:
+        return partition_utils.partition_upto_predicate(end_secs, alias)
+
+    lookback_start = start_secs - ref.max_age_secs
+    return partition_utils.partition_predicate(lookback_start, end_secs, alias)
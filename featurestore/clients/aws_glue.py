@@ -1,44 +1,178 @@
 import logging
 import re
-from typing import Any, Dict, Sequence, Tuple
-
-import boto3
-
-from . import spark_utils
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence, Tuple
+
+from . import (
+    arrow_utils,
+    aws_s3,
+    csv_utils,
+    instrumentation,
+    parquet_utils,
+    spark_utils,
+)
 
 Schema = Dict[str, Any]
 
 PARTITION_RE = re.compile(r"/y=(\d{4})/m=(\d{2})/d=(\d{2})")
 
-glueClient = boto3.client("glue")
+MAX_WORKERS: int = 8
 
-logging.basicConfig(
-    format="%(asctime)s - %(message)s", level=logging.INFO, datefmt="%d-%b-%y %H:%M:%S"
-)
+FORMAT_PARQUET: str = "parquet"
+FORMAT_CSV: str = "csv"
+
+# years whose y/m/d partitions Athena projects, unless supplied
+PROJECTION_YEARS: Tuple[int, int] = (2015, 2035)
+
+PARTITION_KEYS = [
+    {"Name": "y", "Type": "string"},
+    {"Name": "m", "Type": "string"},
+    {"Name": "d", "Type": "string"},
+]
+
+
+_client_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    # clients are created on first use, not on import
+    if name == "glueClient":
+        return _glue()
+    raise AttributeError(f"module {__name__} has no attribute {name}")
 
 
-def register_table(db: str, table: str, s3_file_path: str) -> Dict[str, Any]:
+def _glue() -> Any:
+    # clients are thread safe, but creating them may race
+    with _client_lock:
+        client = globals().get("glueClient")
+        if client is None:
+            import boto3
+
+            client = globals()["glueClient"] = boto3.session.Session().client("glue")
+    return client
+
+
+def register_table(
+    db: str,
+    table: str,
+    s3_file_path: str,
+    use_spark: bool = False,
+    schema_hint: spark_utils.SchemaHint = None,
+) -> Dict[str, Any]:
     """
     Registers a glue table using pre-existing data from s3.
-    s3_data_path must be "s3://" path to a spark compatible parquet/csv file.
-    db must exist and table non existent
+    s3_data_path must be "s3://" path to a spark compatible parquet/csv file,
+    the csv may be gzip or zstd compressed, eg ".csv.gz".
+    db must exist and table non existent.
+    The schema is read from just the parquet footer, or inferred from a sample
+    of the head of the csv, unless use_spark, which downloads and loads the file.
+    With use_spark, a csv is typed by the schema_hint, if given,
+    a FG schema.json or a glue column list, parsing it once without inference.
     :param db:
     :param table:
     :param s3_file_path:
+    :param use_spark:
+    :param schema_hint:
     :return:
     """
     parsed = extract_y_m_d(s3_file_path)
     s3_data_folder = parsed[0]
+    data_format = _data_format(s3_file_path)
 
-    df = spark_utils.read(s3_file_path)
-    schema = spark_utils.get_schema(df)
+    if use_spark:
+        df = spark_utils.read(s3_file_path, schema_hint)
+        schema = spark_utils.get_schema(df)
+    else:
+        schema = file_schema(s3_file_path)
 
-    response = create_table(db, table, s3_data_folder, schema)
+    response = create_table(db, table, s3_data_folder, schema, data_format=data_format)
     return response
 
 
+def register_dataset(
+    db: str, table: str, s3_root: str, max_workers: int = MAX_WORKERS
+) -> Dict[str, Any]:
+    """
+    Registers a glue table, and all its partitions, using a pre-existing dataset
+    laid out as "<s3_root>/y=1111/m=11/d=11/" folders of parquet/csv files.
+    Partitions are discovered by listing years, months and days concurrently,
+    the schema is read from one file, and the partitions are added in
+    parallel batches, logging progress.
+    db must exist and table non existent
+    :param db:
+    :param table:
+    :param s3_root: "s3://" path of the folder holding the "y=" folders
+    :param max_workers:
+    :return: the create table response, partition count and failed partitions
+    """
+    s3_root = s3_root.rstrip("/") + "/"
+    bucket, prefix = aws_s3.parse_url(s3_root)
+    partitions = discover_partitions(bucket, prefix, max_workers)
+    assert partitions, f"No y=/m=/d= partitions found under {s3_root}"
+
+    sample_file = _sample_file(bucket, partitions)
+    data_format = _data_format(sample_file)
+    schema = file_schema(sample_file)
+    table_response = create_table(db, table, s3_root, schema, data_format=data_format)
+
+    partition_paths = [f"s3://{bucket}/{partition}" for partition in partitions]
+    responses = add_partitions(
+        db, table, partition_paths, schema, data_format, max_workers
+    )
+    errors = [error for response in responses for error in response.get("Errors", [])]
+    return {"table": table_response, "partitions": len(partitions), "errors": errors}
+
+
+def discover_partitions(
+    bucket: str, prefix: str, max_workers: int = MAX_WORKERS
+) -> Sequence[str]:
+    """
+    sorted "<prefix>y=1111/m=11/d=11/" keys of the partition folders under prefix,
+    listing only folder prefixes, one listing per year and per month concurrently
+    :param bucket:
+    :param prefix: must end with "/"
+    :param max_workers:
+    :return:
+    """
+
+    def sub_folders(parent: str, name: str) -> List[str]:
+        folders = aws_s3.ls_prefixes(bucket, parent)
+        return [f for f in folders if f[len(parent) :].startswith(name)]  # noqa: E203
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        years = sub_folders(prefix, "y=")
+        months = pool.map(lambda year: sub_folders(year, "m="), years)
+        months_flat = [month for found in months for month in found]
+        days = pool.map(lambda month: sub_folders(month, "d="), months_flat)
+        partitions = [day for found in days for day in found]
+
+    return sorted(p for p in partitions if PARTITION_RE.search("/" + p))
+
+
+def file_schema(s3_file_path: str) -> Schema:
+    """
+    hive schema of the parquet/csv file at the "s3://" path,
+    fetching only its parquet footer or the head of the csv
+    :param s3_file_path:
+    :return:
+    """
+    bucket, key = aws_s3.parse_url(s3_file_path)
+    if _data_format(s3_file_path) == FORMAT_CSV:
+        arrow_schema = csv_utils.read_schema(bucket, key)
+    else:
+        arrow_schema = parquet_utils.read_schema(bucket, key)
+    return arrow_utils.hive_schema(arrow_schema)
+
+
 def create_table(
-    db: str, table: str, s3_data_path: str, schema: Schema
+    db: str,
+    table: str,
+    s3_data_path: str,
+    schema: Schema,
+    partitioned: bool = True,
+    data_format: str = FORMAT_PARQUET,
 ) -> Dict[str, Any]:
     """
     Create a table in Glue,
@@ -49,10 +183,22 @@ def create_table(
     :param table:
     :param s3_data_path:
     :param schema:
+    :param partitioned: if the data is laid out in y/m/d partitions
+    :param data_format: "parquet" or "csv" with a header line
     :return:
     """
-    params = create_table_params(db, table, s3_data_path, schema)
-    response = glueClient.create_table(**params)
+    params = create_table_params(
+        db, table, s3_data_path, schema, partitioned, data_format
+    )
+    with instrumentation.span("glue.create_table", table=f"{db}.{table}"):
+        response = _glue().create_table(**params)
+        instrumentation.count("retries", retries(response))
+    logging.info(response)
+    return response
+
+
+def delete_table(db: str, table: str) -> Dict[str, Any]:
+    response = _glue().delete_table(DatabaseName=db, Name=table)
     logging.info(response)
     return response
 
@@ -61,32 +207,75 @@ GLUE_PARTITION_ADD_BATCH_SIZE: int = 99
 
 
 def add_partitions(
-    db: str, table: str, s3_data_paths: Sequence[str], schema: Schema = None
+    db: str,
+    table: str,
+    s3_data_paths: Sequence[str],
+    schema: Schema = None,
+    data_format: str = FORMAT_PARQUET,
+    max_workers: int = 1,
 ) -> Sequence[Dict[str, Any]]:
     """
     Adds partitions present in s3 to preexisting table in Glue,
     Add 99 partitions at a time to sidestep boto3 restriction.
     Partition paths must contain the "y=1111/m=11/d=11" substring.
+    Batches are sent from max_workers threads, logging progress and throughput.
     :param db:
     :param table:
     :param s3_data_paths:
     :param schema:
-    :return:
+    :param data_format: "parquet" or "csv" with a header line
+    :param max_workers:
+    :return: responses in the order of the batches
     """
-    responses = []
     count = len(s3_data_paths)
-    for i in range(0, count, GLUE_PARTITION_ADD_BATCH_SIZE):
-        paths = s3_data_paths[i : i + GLUE_PARTITION_ADD_BATCH_SIZE]  # noqa: E203
-        params = add_partitions_params(db, table, paths, schema)
-        response = glueClient.batch_create_partition(**params)
-        responses.append(response)
-
+    batches = [
+        s3_data_paths[i : i + GLUE_PARTITION_ADD_BATCH_SIZE]  # noqa: E203
+        for i in range(0, count, GLUE_PARTITION_ADD_BATCH_SIZE)
+    ]
+    started = time.monotonic()
+    lock = threading.Lock()
+    done = [0]
+
+    def add(paths: Sequence[str]) -> Dict[str, Any]:
+        params = add_partitions_params(db, table, paths, schema, data_format)
+        response = _glue().batch_create_partition(**params)
+        with lock:
+            done[0] += len(paths)
+            rate = done[0] / max(time.monotonic() - started, 1e-6)
+            logging.info(
+                f"Added {done[0]}/{count} partitions to {db}.{table}, "
+                f"{rate:.1f} partitions/sec, "
+                f"{len(response.get('Errors', []))} failed in batch"
+            )
+        return response
+
+    with instrumentation.span("glue.add_partitions", table=f"{db}.{table}") as stage:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            responses = list(pool.map(add, batches))
+        stage.count("partitions", count)
+        stage.count("retries", sum(map(retries, responses)))
+        stage.count("errors", sum(len(r.get("Errors", [])) for r in responses))
     return responses
 
 
+def retries(response: Dict[str, Any]) -> int:
+    """number of times boto3 retried the request of the response"""
+    return response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+
 def create_table_params(
-    db: str, table: str, s3_data_path: str, schema: Schema
+    db: str,
+    table: str,
+    s3_data_path: str,
+    schema: Schema,
+    partitioned: bool = True,
+    data_format: str = FORMAT_PARQUET,
+    projection: Dict[str, str] = None,
 ) -> Dict[str, Any]:
+    """
+    :param projection: table properties projecting the partitions,
+     see projection_properties
+    """
     cols = _extract_cols(schema)
 
     params = {
@@ -94,28 +283,66 @@ def create_table_params(
         "TableInput": {
             "Name": table,
             "TableType": "EXTERNAL_TABLE",
-            "StorageDescriptor": _storage_descriptor(cols, s3_data_path),
-            "PartitionKeys": [
-                {"Name": "y", "Type": "string"},
-                {"Name": "m", "Type": "string"},
-                {"Name": "d", "Type": "string"},
-            ],
+            "StorageDescriptor": _storage_descriptor(cols, s3_data_path, data_format),
+            "PartitionKeys": PARTITION_KEYS if partitioned else [],
         },
     }
+    table_props: Dict[str, str] = dict(projection or {})
+    if data_format == FORMAT_CSV:
+        table_props["skip.header.line.count"] = "1"
+    if table_props:
+        params["TableInput"]["Parameters"] = table_props
 
     return params
 
 
+def projection_properties(
+    s3_data_path: str, years: Tuple[int, int] = PROJECTION_YEARS
+) -> Dict[str, str]:
+    """
+    Table properties for Athena to compute the y/m/d partitions of the data path
+    from the query predicate, instead of listing them from Glue,
+    so partitions never need adding and planning does not grow with their count.
+    Partitions of dates outside the inclusive years range are never read.
+    :param s3_data_path: "s3://" folder holding the y=/m=/d= folders
+    :param years: first and last year
+    :return:
+    """
+    location = s3_data_path.rstrip("/")
+    return {
+        "projection.enabled": "true",
+        "projection.y.type": "integer",
+        "projection.y.range": f"{years[0]},{years[1]}",
+        "projection.y.digits": "4",
+        "projection.m.type": "integer",
+        "projection.m.range": "1,12",
+        "projection.m.digits": "2",
+        "projection.d.type": "integer",
+        "projection.d.range": "1,31",
+        "projection.d.digits": "2",
+        "storage.location.template": f"{location}/y=${{y}}/m=${{m}}/d=${{d}}/",
+    }
+
+
 def add_partitions_params(
-    db: str, table: str, s3_data_paths: Sequence[str], schema: Schema = None
+    db: str,
+    table: str,
+    s3_data_paths: Sequence[str],
+    schema: Schema = None,
+    data_format: str = FORMAT_PARQUET,
 ) -> Dict[str, Any]:
     cols = [] if schema is None else _extract_cols(schema)
-    partitions = list(map(lambda it: _partitions(cols, it), s3_data_paths))
+    partitions = list(map(lambda it: _partitions(cols, it, data_format), s3_data_paths))
     params = {"DatabaseName": db, "TableName": table, "PartitionInputList": partitions}
 
     return params
 
 
+def add_columns_params(db: str, table: str, schema: Schema) -> Dict[str, Any]:
+    """columns of schema to append to the table, see the lambda EVOLVE action"""
+    return {"DatabaseName": db, "TableName": table, "Columns": _extract_cols(schema)}
+
+
 def extract_y_m_d(s3_data_path: str) -> Tuple[str, str, Sequence[str]]:
     assert s3_data_path.startswith("s3://"), "Not a valid s3 uri"
 
@@ -129,19 +356,24 @@ def extract_y_m_d(s3_data_path: str) -> Tuple[str, str, Sequence[str]]:
     raise ValueError("Not a valid s3 partition path")
 
 
-def _partitions(cols: Sequence[Dict[str, str]], s3location: str):
+def _partitions(
+    cols: Sequence[Dict[str, str]], s3location: str, data_format: str = FORMAT_PARQUET
+):
     parsed = extract_y_m_d(s3location)
     partition_values = parsed[2]
     partition_folder = parsed[1]
     return {
         "Values": partition_values,
-        "StorageDescriptor": _storage_descriptor(cols, partition_folder),
+        "StorageDescriptor": _storage_descriptor(cols, partition_folder, data_format),
     }
 
 
 def _storage_descriptor(
-    cols: Sequence[Dict[str, str]], s3location: str
+    cols: Sequence[Dict[str, str]], s3location: str, data_format: str = FORMAT_PARQUET
 ) -> Dict[str, Any]:
+    if data_format == FORMAT_CSV:
+        return _csv_storage_descriptor(cols, s3location)
+
     return {
         "Columns": cols,
         "Location": s3location,
@@ -158,3 +390,46 @@ def _storage_descriptor(
 
 def _extract_cols(schema: Schema) -> Sequence[Dict[str, str]]:
     return [{"Name": k, "Type": v} for k, v in schema.items()]
+
+
+def _csv_storage_descriptor(
+    cols: Sequence[Dict[str, str]], s3location: str
+) -> Dict[str, Any]:
+    return {
+        "Columns": cols,
+        "Location": s3location,
+        "InputFormat": "org.apache.hadoop.mapred.TextInputFormat",
+        "OutputFormat": "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+        "SerdeInfo": {
+            "Name": "SERDE",
+            "SerializationLibrary": "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe",
+            "Parameters": {"field.delim": ",", "serialization.format": ","},
+        },
+        "Parameters": {"classification": "csv", "typeOfData": "file"},
+    }
+
+
+def _sample_file(bucket: str, partitions: Sequence[str]) -> str:
+    """s3 url of the first data file found in the latest partitions"""
+    for partition in reversed(partitions):
+        for item in aws_s3.iter_objects(bucket, partition):
+            if _is_data_file(item.key):
+                return f"s3://{bucket}/{item.key}"
+    raise ValueError(f"No parquet/csv files found in {len(partitions)} partitions")
+
+
+def _is_data_file(s3_file_path: str) -> bool:
+    try:
+        return bool(_data_format(s3_file_path))
+    except ValueError:
+        return False
+
+
+def _data_format(s3_file_path: str) -> str:
+    # athena reads gzip and zstd compressed csvs, like 'spark_utils.read'
+    if spark_utils._strip_compression(s3_file_path).endswith(".csv"):
+        return FORMAT_CSV
+    elif s3_file_path.endswith(".parquet"):
+        return FORMAT_PARQUET
+    else:
+        raise ValueError("Unsupported File Format")
@@ -1,18 +1,40 @@
 # -*- coding: utf-8 -*-
 
+import threading
 from json import dumps as json_ser
 from typing import Any, Dict
 
-import boto3
+from . import instrumentation
 
-lambdaClient = boto3.client("lambda")
+_client_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    # clients are created on first use, not on import
+    if name == "lambdaClient":
+        return _lambda()
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+
+def _lambda() -> Any:
+    # clients are thread safe, but creating them may race
+    with _client_lock:
+        client = globals().get("lambdaClient")
+        if client is None:
+            import boto3
+
+            session = boto3.session.Session()
+            client = globals()["lambdaClient"] = session.client("lambda")
+    return client
 
 
 def invoke(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    response = lambdaClient.invoke(
+    response = _lambda().invoke(
         FunctionName=endpoint,
         InvocationType="RequestResponse",
         Payload=json_ser(payload),
     )
+    retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    instrumentation.count("retries", retries)
 
     return response
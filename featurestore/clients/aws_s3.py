@@ -1,29 +1,163 @@
 # -*- coding: utf-8 -*-
 
-from typing import Optional, Sequence, Tuple
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Sequence, Tuple
 from urllib.parse import urlparse
 
-import boto3
+from . import instrumentation
 
-s3resource = boto3.resource("s3")
+MAX_WORKERS: int = 8
+
+# boto3 resources are not thread safe, so each thread has its own,
+# while listings share a client, which is
+_local = threading.local()
+_client_lock = threading.Lock()
+
+
+class S3Object(NamedTuple):
+    key: str
+    size: int
+    etag: str
+    mtime: datetime
+
+
+def __getattr__(name: str) -> Any:
+    # clients are created on first use, not on import
+    if name == "s3resource":
+        return _s3()
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+
+def _s3() -> Any:
+    """s3 resource of the calling thread"""
+    resource = getattr(_local, "resource", None)
+    if resource is None:
+        import boto3
+
+        # the default session is not thread safe either
+        resource = _local.resource = boto3.session.Session().resource("s3")
+    return resource
+
+
+def _client() -> Any:
+    """s3 client shared by all threads"""
+    with _client_lock:
+        client = globals().get("s3client")
+        if client is None:
+            import boto3
+
+            client = globals()["s3client"] = boto3.session.Session().client("s3")
+    return client
 
 
 def handle(bucket: str, path: str):
-    return s3resource.Object(bucket, path)
+    return _s3().Object(bucket, path)
 
 
 def ls_files(bucket: str, prefix: Optional[str] = None) -> Sequence[str]:
-    s3bucket = s3resource.Bucket(bucket)
+    return [x.key for x in iter_objects(bucket, prefix or "")]
 
-    if prefix is not None:
-        items = s3bucket.objects.filter(Prefix=prefix)
-    else:
-        items = s3bucket.objects.all()
 
-    rel_paths = map(lambda x: x.key, items)
-    files = filter(lambda x: not x.endswith("/"), rel_paths)
+def ls_sizes(bucket: str, prefix: str) -> Sequence[Tuple[str, int]]:
+    """
+    lists (key, size in bytes) of all the files under prefix
+    :param bucket:
+    :param prefix:
+    :return:
+    """
+    return [(x.key, x.size) for x in iter_objects(bucket, prefix)]
 
-    return list(files)
+
+def ls_stats(bucket: str, prefix: str) -> Sequence[Tuple[str, int, str]]:
+    """
+    lists (key, size in bytes, etag) of all the files under prefix
+    :param bucket:
+    :param prefix:
+    :return:
+    """
+    return [(x.key, x.size, x.etag) for x in iter_objects(bucket, prefix)]
+
+
+def iter_objects(
+    bucket: str,
+    prefix: str = "",
+    start_after: Optional[str] = None,
+    delimiter: Optional[str] = None,
+) -> Iterator[S3Object]:
+    """
+    lazily lists the files under prefix in key order, a page at a time,
+    so callers may stop early without listing the rest
+    :param bucket:
+    :param prefix:
+    :param start_after: resumes listing after this key, eg the last one seen
+    :param delimiter: lists only the files directly under prefix,
+     not those in its sub folders, see ls_prefixes
+    :return:
+    """
+    for page in _pages(bucket, prefix, start_after, delimiter):
+        instrumentation.count("s3_list_pages")
+        for item in page.get("Contents", []):
+            if not item["Key"].endswith("/"):
+                yield S3Object(
+                    item["Key"], item["Size"], item["ETag"], item["LastModified"]
+                )
+
+
+def iter_sharded(
+    bucket: str, shards: Sequence[str], max_workers: int = MAX_WORKERS
+) -> Iterator[S3Object]:
+    """
+    lists the files under each of the disjoint prefix shards concurrently,
+    eg the "y=" folders of a data prefix,
+    yielding each shard's files as soon as its listing completes
+    :param bucket:
+    :param shards:
+    :param max_workers:
+    :return:
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(lambda shard: list(iter_objects(bucket, shard)), shard)
+            for shard in shards
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def exists(bucket: str, prefix: str) -> bool:
+    """if any object exists under prefix, listing at most one key"""
+    response = _client().list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1)
+    return response.get("KeyCount", 0) > 0
+
+
+def ls_prefixes(bucket: str, prefix: str, delimiter: str = "/") -> Iterator[str]:
+    """
+    lazily lists the common prefixes, ie sub folders, directly under prefix,
+    without listing the objects nested within them
+    :param bucket:
+    :param prefix: must end with the delimiter to list its sub folders
+    :param delimiter:
+    :return:
+    """
+    for page in _pages(bucket, prefix, None, delimiter):
+        for common in page.get("CommonPrefixes", []):
+            yield common["Prefix"]
+
+
+def metadata(bucket: str, key: str) -> Optional[Dict[str, str]]:
+    """user metadata of the object, None if it does not exist"""
+    from botocore.exceptions import ClientError
+
+    try:
+        response = _client().head_object(Bucket=bucket, Key=key)
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] in {"404", "NoSuchKey", "NotFound"}:
+            return None
+        raise
+    return response.get("Metadata", {})
 
 
 def parse_url(s3url: str) -> Tuple[str, str]:
@@ -42,6 +176,40 @@ def get_stream(bucket: str, key: str):
     return obj.get()["Body"]
 
 
+def read_range(bucket: str, key: str, byte_range: str) -> Tuple[bytes, int]:
+    """
+    fetches only the bytes of the object in the http range,
+    eg "bytes=0-1023" or the suffix "bytes=-1024"
+    :param bucket:
+    :param key:
+    :param byte_range:
+    :return: (bytes, size in bytes of the whole object)
+    """
+    response = handle(bucket, key).get(Range=byte_range)
+    size = int(response["ContentRange"].rsplit("/", 1)[1])
+    body = response["Body"].read()
+    instrumentation.count("bytes", len(body))
+    return body, size
+
+
 def save_as(bucket: str, key: str, fname: str):
-    obj = handle(bucket, key)
-    obj.download_file(fname)
+    with instrumentation.span("s3.download", key=key) as stage:
+        obj = handle(bucket, key)
+        obj.download_file(fname)
+        stage.count("bytes", os.path.getsize(fname))
+
+
+def _pages(
+    bucket: str,
+    prefix: str,
+    start_after: Optional[str] = None,
+    delimiter: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    if delimiter:
+        params["Delimiter"] = delimiter
+
+    paginator = _client().get_paginator("list_objects_v2")
+    return iter(paginator.paginate(**params))
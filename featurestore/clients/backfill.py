@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import argparse
+import functools
+import glob
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from . import aws_s3, fg, ist_utils, schema_utils
+
+if TYPE_CHECKING:
+    from pandas import DataFrame as Pandas_df
+
+MAX_WORKERS: int = 4
+# 'upload_fg' calls started per second, each one lambda invocation,
+# a Glue batch of partitions and the S3 requests of the files of a task
+UPLOADS_PER_SEC: float = 2.0
+FILE_PATTERNS: Sequence[str] = ("*.parquet", "*.csv")
+
+# a task id -> its rows, the id being a file or folder path, or an iso day
+Loader = Callable[[str], Optional["Pandas_df"]]
+
+
+class BackfillResult(NamedTuple):
+    uploaded: List[str]
+    # completed by a previous run, per the state file
+    skipped: List[str]
+    failed: List[str]
+
+
+class TokenBucket:
+    """
+    Admits rate acquisitions per second on average,
+    with bursts of upto capacity after idling.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """blocks until tokens are available, then takes them"""
+        with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                self._sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed, self._updated = now - self._updated, now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+
+class DayClaims:
+    """
+    Partition days of the FG, each claimed by the task uploading it,
+    shared by the pool's processes via a manager, so no two tasks commit a day.
+    """
+
+    def __init__(self, owners: MutableMapping[str, str], lock: Any):
+        self._owners = owners
+        self._lock = lock
+
+    def claim(self, task: str, days: Set[str]) -> None:
+        """claims the days for task, raising if another task claimed any"""
+        with self._lock:
+            taken = {
+                day: self._owners[day]
+                for day in days
+                if self._owners.get(day, task) != task
+            }
+            if taken:
+                raise ValueError(
+                    f"Backfill task {task} shares days with other tasks {taken},"
+                    " each day must be in the files of a single task"
+                )
+            self._owners.update({day: task for day in days})
+
+
+def backfill(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    tasks: Sequence[str],
+    load: Loader,
+    state_path: str,
+    max_workers: int = MAX_WORKERS,
+    uploads_per_sec: float = UPLOADS_PER_SEC,
+) -> BackfillResult:
+    """
+    Uploads the rows of each task to the FG via 'upload_fg',
+    in a pool of max_workers processes, starting at most uploads_per_sec,
+    to stay within the S3 and Glue request rate limits.
+    load must be picklable, ie a module level function or a partial of one.
+    Each partition day must be in the rows of a single task, as an upload
+    replaces a day, a task holding a day of another one fails before uploading.
+    Completed tasks are checkpointed to the json state file, local or an s3:// url,
+    after each one finishes, so a rerun resumes with the tasks not yet completed.
+    Partitions committed by a crashed upload are skipped on its retry,
+    as uploads are content addressed.
+    """
+    state = load_state(state_path)
+    done: Set[str] = set(state["done"])
+    pending = [task for task in tasks if task not in done]
+    skipped = [task for task in tasks if task in done]
+    uploaded: List[str] = []
+    failed: List[str] = []
+    bucket = TokenBucket(uploads_per_sec)
+    logging.info(f"Backfilling {len(pending)} tasks, {len(skipped)} already done")
+
+    def finish(future: Future, task: str) -> None:
+        try:
+            success = future.result()
+        except Exception:
+            logging.exception(f"Failed backfill task {task}")
+            success = False
+
+        (uploaded if success else failed).append(task)
+        if success:
+            done.add(task)
+        save_state(state_path, {"done": sorted(done), "failed": sorted(failed)})
+        logging.info(f"Backfill task {task} {'done' if success else 'failed'}")
+
+    schema = fg.read_schema(client, app, entity, version)
+    in_flight: Dict[Future, str] = {}
+    with _day_claims() as claims, _executor(max_workers) as pool:
+        upload = functools.partial(
+            _upload_task, client, app, entity, version, schema, load, claims
+        )
+        for task in pending:
+            if len(in_flight) >= max_workers:
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finish(future, in_flight.pop(future))
+            bucket.acquire()
+            in_flight[pool.submit(upload, task)] = task
+
+        for future in list(in_flight):
+            finish(future, in_flight.pop(future))
+
+    return BackfillResult(uploaded, skipped, failed)
+
+
+def file_tasks(source_dir: str, patterns: Sequence[str] = FILE_PATTERNS) -> List[str]:
+    """
+    tasks for 'read_file' of the parquet and csv files under source_dir,
+    the part files of a spark or hive partition folder, like "d=01"
+    or "dt=2019-07-01", are a single task, the folder,
+    any other file is a task of its own
+    """
+    tasks = set()
+    for path in _data_files(source_dir, patterns):
+        folder = os.path.dirname(path)
+        tasks.add(folder if "=" in os.path.basename(folder) else path)
+    return sorted(tasks)
+
+
+def read_file(path: str, patterns: Sequence[str] = FILE_PATTERNS) -> Pandas_df:
+    """rows of the parquet or csv file, or of all such files in the folder"""
+    import pandas as pd
+
+    if os.path.isdir(path):
+        files = [f for f in _data_files(path, patterns) if os.path.dirname(f) == path]
+        return pd.concat([read_file(f) for f in files], ignore_index=True)
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pd.read_parquet(path)
+
+
+def day_tasks(start: date, end: date) -> List[str]:
+    """iso days from start to end, inclusive, each a task for 'day_loader'"""
+    return [
+        (start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)
+    ]
+
+
+def day_loader(generate: Callable[[date], Optional[Pandas_df]]) -> Loader:
+    """loader of iso day tasks, from a module level function of the day"""
+    return functools.partial(_load_day, generate)
+
+
+def load_state(path: str) -> Dict[str, List[str]]:
+    state = {"done": [], "failed": []}
+    if path.startswith("s3://"):
+        bucket, key = aws_s3.parse_url(path)
+        if aws_s3.metadata(bucket, key) is not None:
+            state.update(json.load(aws_s3.get_stream(bucket, key)))
+    elif os.path.exists(path):
+        with open(path) as f:
+            state.update(json.load(f))
+    return state
+
+
+def save_state(path: str, state: Dict[str, List[str]]) -> None:
+    body = json.dumps(state)
+    if path.startswith("s3://"):
+        bucket, key = aws_s3.parse_url(path)
+        aws_s3.handle(bucket, key).put(
+            Body=body, ContentType="application/json; charset=utf-8"
+        )
+        return
+
+    # atomic rename, a crash leaves either the old or the new state
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+def _executor(max_workers: int) -> ProcessPoolExecutor:
+    # spawned, not forked, workers create their own boto3 clients and pools
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+@contextmanager
+def _day_claims() -> Iterator[DayClaims]:
+    with multiprocessing.get_context("spawn").Manager() as manager:
+        yield DayClaims(manager.dict(), manager.Lock())
+
+
+def _upload_task(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    schema: fg.Schema,
+    load: Loader,
+    claims: DayClaims,
+    task: str,
+) -> bool:
+    df = load(task)
+    if df is None or df.empty:
+        logging.info(f"No rows for backfill task {task}")
+        return True
+    claims.claim(task, _partitions(df, schema))
+    success, _ = fg.upload_fg(client, app, entity, version, df)
+    return success
+
+
+def _partitions(df: Pandas_df, schema: fg.Schema) -> Set[str]:
+    """y=/m=/d= partitions of the rows, as 'upload_fg' groups them"""
+    time_col = schema[schema_utils.SCHEMA_TIME_COL]
+    unit = schema[schema_utils.SCHEMA_TIME_UNIT]
+    return {
+        ist_utils.to_partition(ist_utils.to_epoch_secs(epoch, unit))
+        for epoch in df[time_col].unique()
+    }
+
+
+def _data_files(folder: str, patterns: Sequence[str]) -> Set[str]:
+    return {
+        path
+        for pattern in patterns
+        for path in glob.glob(os.path.join(folder, "**", pattern), recursive=True)
+    }
+
+
+def _load_day(
+    generate: Callable[[date], Optional[Pandas_df]], task: str
+) -> Optional[Pandas_df]:
+    return generate(date.fromisoformat(task))
+
+
+def _import(name: str) -> Callable[..., Any]:
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def main(argv: Sequence[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Backfill a FG from files, or a function generating each day"
+    )
+    for arg in ["client", "app", "entity", "version"]:
+        parser.add_argument(arg)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--source-dir", help="folder of parquet or csv files")
+    source.add_argument(
+        "--day-fn", help="module:function of a date returning a pandas Df"
+    )
+    parser.add_argument("--start", type=date.fromisoformat, help="first day")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day")
+    parser.add_argument("--state", required=True, help="state file, local or s3://")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--uploads-per-sec", type=float, default=UPLOADS_PER_SEC)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format="%(asctime)s - %(message)s",
+        level=logging.INFO,
+        datefmt="%d-%b-%y %H:%M:%S",
+    )
+
+    if args.source_dir:
+        tasks, load = file_tasks(args.source_dir), read_file
+    else:
+        if not (args.start and args.end):
+            parser.error("--day-fn needs --start and --end")
+        tasks, load = day_tasks(args.start, args.end), day_loader(_import(args.day_fn))
+
+    result = backfill(
+        args.client,
+        args.app,
+        args.entity,
+        args.version,
+        tasks,
+        load,
+        args.state,
+        args.workers,
+        args.uploads_per_sec,
+    )
+    logging.info(
+        f"Uploaded {len(result.uploaded)}, skipped {len(result.skipped)},"
+        f" failed {len(result.failed)}: {result.failed}"
+    )
+    if result.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
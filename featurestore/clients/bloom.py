@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import math
+from hashlib import blake2b
+from typing import Any, Iterable, Tuple
+
+DEFAULT_FP_RATE: float = 0.01
+
+
+class BloomFilter:
+    """
+    Set membership of entity keys, with no false negatives,
+    and false positives at about the rate it was sized for.
+    Keys are hashed by their str, so 7 and "7" are the same key.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits: bytes = None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def sized(cls, capacity: int, fp_rate: float = DEFAULT_FP_RATE) -> "BloomFilter":
+        """empty filter holding capacity keys at the false positive rate"""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    @classmethod
+    def of(cls, keys: Iterable[Any], fp_rate: float = DEFAULT_FP_RATE) -> "BloomFilter":
+        unique = set(map(key_str, keys))
+        bloom = cls.sized(len(unique), fp_rate)
+        for key in unique:
+            bloom.add(key)
+        return bloom
+
+    def add(self, key: Any) -> None:
+        for bit in self._bits(key):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+
+    def might_contain(self, key: Any) -> bool:
+        return all(self.bits[bit >> 3] & (1 << (bit & 7)) for bit in self._bits(key))
+
+    def to_bytes(self) -> bytes:
+        """compact form, eg for the sidecar object of a data file"""
+        return f"{self.num_bits}:{self.num_hashes}:".encode("ascii") + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, encoded: bytes) -> "BloomFilter":
+        num_bits, num_hashes, bits = encoded.split(b":", 2)
+        return cls(int(num_bits), int(num_hashes), bits)
+
+    def _bits(self, key: Any) -> Iterable[int]:
+        # double hashing, Kirsch and Mitzenmacher
+        first, second = _hashes(key)
+        return ((first + i * second) % self.num_bits for i in range(self.num_hashes))
+
+
+def bucket(key: Any, num_buckets: int) -> int:
+    """bucket of the key, stable across processes and python versions"""
+    return _hashes(key)[0] % num_buckets
+
+
+def key_str(key: Any) -> str:
+    if hasattr(key, "item"):
+        # numpy scalar
+        key = key.item()
+    if isinstance(key, float) and key.is_integer():
+        # int keys read back as floats, eg from columns with nulls
+        key = int(key)
+    return str(key)
+
+
+def _hashes(key: Any) -> Tuple[int, int]:
+    digest = blake2b(key_str(key).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from . import aws_s3, fg
+
+MAX_WORKERS: int = 16
+
+DIGITS_RE = re.compile(r"(\d+)")
+
+# (client, app, entity)
+FeatureGroup = Tuple[str, str, str]
+
+# feature group -> naturally sorted versions
+_index: Dict[FeatureGroup, List[str]] = {}
+_index_lock = threading.Lock()
+_index_loaded = False
+
+
+def list_feature_groups(refresh: bool = False) -> Sequence[FeatureGroup]:
+    """
+    All (client, app, entity) feature groups in the store, sorted,
+    served from the in memory index, built on first use or when refresh is set.
+    """
+    if refresh or not _index_loaded:
+        refresh_index()
+    with _index_lock:
+        return sorted(_index)
+
+
+def list_versions(
+    client: str, app: str, entity: str, refresh: bool = False
+) -> Sequence[str]:
+    """
+    Versions of the feature group in natural order, eg v2 before v10,
+    served from the in memory index unless absent or refresh is set.
+    """
+    fg_id = (client, app, entity)
+    with _index_lock:
+        cached = _index.get(fg_id)
+    if cached is not None and not refresh:
+        return list(cached)
+
+    versions = sorted(fg.get_versions(client, app, entity), key=natural_key)
+    with _index_lock:
+        _index[fg_id] = versions
+    return list(versions)
+
+
+def latest_version(
+    client: str, app: str, entity: str, refresh: bool = False
+) -> Optional[str]:
+    versions = list_versions(client, app, entity, refresh)
+    return versions[-1] if versions else None
+
+
+def refresh_index(max_workers: int = MAX_WORKERS) -> None:
+    """
+    Rebuilds the index, listing only the folder prefixes of the store layout,
+    level by level, fanning out across client and app prefixes.
+    """
+    global _index_loaded
+
+    root = fg.S3_ROOT + "/"
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        clients = [(name,) for name in _sub_folders(root)]
+        apps = _expand(pool, clients)
+        fg_ids: List[FeatureGroup] = [(c, a, e) for c, a, e in _expand(pool, apps)]
+        versions = pool.map(lambda it: list_versions(*it, refresh=True), fg_ids)
+        index = dict(zip(fg_ids, versions))
+
+    with _index_lock:
+        _index.clear()
+        _index.update({fg_id: vs for fg_id, vs in index.items() if vs})
+        _index_loaded = True
+    logging.info(f"Indexed {len(_index)} feature groups")
+
+
+def natural_key(version: str) -> Sequence[Union[int, str]]:
+    """sort key comparing the digit runs in the version numerically"""
+    parts = DIGITS_RE.split(version)
+    return [int(part) if i % 2 else part for i, part in enumerate(parts)]
+
+
+def _expand(
+    pool: ThreadPoolExecutor, parents: Sequence[Tuple[str, ...]]
+) -> List[Tuple[str, ...]]:
+    """lists the sub folders of every parent folder concurrently"""
+    prefixes = ["/".join((fg.S3_ROOT,) + parent) + "/" for parent in parents]
+    children = pool.map(_sub_folders, prefixes)
+    return [
+        parent + (child,) for parent, names in zip(parents, children) for child in names
+    ]
+
+
+def _sub_folders(prefix: str) -> List[str]:
+    folders = aws_s3.ls_prefixes(fg.S3_BUCKET, prefix)
+    return [folder[len(prefix) :].rstrip("/") for folder in folders]  # noqa: E203
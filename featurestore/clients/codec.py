@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from typing import Any, Callable, Dict, List, Tuple
+
+# one byte type tag, followed by the payload,
+# ints are zig-zag varints, lengths and counts are varints
+TAG_NONE = b"N"
+TAG_TRUE = b"T"
+TAG_FALSE = b"F"
+TAG_INT = b"i"
+TAG_FLOAT = b"d"
+TAG_STR = b"s"
+TAG_BYTES = b"b"
+TAG_LIST = b"l"
+TAG_MAP = b"m"
+
+FLOAT = struct.Struct("<d")
+
+
+def encode(value: Any) -> bytes:
+    """
+    Compact binary encoding of None, bool, int, float, str, bytes
+    and lists / string keyed dicts of them.
+    Numpy scalars and arrays are unboxed, anything else is encoded as its str.
+    """
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def decode(data: bytes) -> Any:
+    value, end = _decode(memoryview(data), 0)
+    assert end == len(data), f"trailing bytes after offset {end}"
+    return value
+
+
+def _encode(value: Any, out: bytearray) -> None:
+    if hasattr(value, "tolist"):
+        # numpy scalar or array
+        value = value.tolist()
+
+    if value is None:
+        out += TAG_NONE
+    elif isinstance(value, bool):
+        out += TAG_TRUE if value else TAG_FALSE
+    elif isinstance(value, int):
+        out += TAG_INT
+        _put_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif isinstance(value, float):
+        out += TAG_FLOAT + FLOAT.pack(value)
+    elif isinstance(value, (bytes, bytearray)):
+        out += TAG_BYTES
+        _put_bytes(out, bytes(value))
+    elif isinstance(value, (list, tuple)):
+        _encode_list(value, out)
+    elif isinstance(value, dict):
+        _encode_map(value, out)
+    else:
+        out += TAG_STR
+        _put_bytes(out, str(value).encode("utf-8"))
+
+
+def _encode_list(value: Any, out: bytearray) -> None:
+    out += TAG_LIST
+    _put_varint(out, len(value))
+    for item in value:
+        _encode(item, out)
+
+
+def _encode_map(value: Dict[str, Any], out: bytearray) -> None:
+    out += TAG_MAP
+    _put_varint(out, len(value))
+    for key, item in value.items():
+        _put_bytes(out, str(key).encode("utf-8"))
+        _encode(item, out)
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _put_bytes(out: bytearray, value: bytes) -> None:
+    _put_varint(out, len(value))
+    out += value
+
+
+def _get_varint(data: memoryview, pos: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _get_bytes(data: memoryview, pos: int) -> Tuple[bytes, int]:
+    size, pos = _get_varint(data, pos)
+    return bytes(data[pos : pos + size]), pos + size  # noqa: E203
+
+
+def _decode(data: memoryview, pos: int) -> Tuple[Any, int]:
+    tag = bytes(data[pos : pos + 1])  # noqa: E203
+    return DECODERS[tag](data, pos + 1)
+
+
+def _decode_int(data: memoryview, pos: int) -> Tuple[int, int]:
+    raw, pos = _get_varint(data, pos)
+    return (raw >> 1) ^ -(raw & 1), pos
+
+
+def _decode_float(data: memoryview, pos: int) -> Tuple[float, int]:
+    return FLOAT.unpack_from(data, pos)[0], pos + FLOAT.size
+
+
+def _decode_str(data: memoryview, pos: int) -> Tuple[str, int]:
+    raw, pos = _get_bytes(data, pos)
+    return raw.decode("utf-8"), pos
+
+
+def _decode_list(data: memoryview, pos: int) -> Tuple[List[Any], int]:
+    count, pos = _get_varint(data, pos)
+    items = []
+    for _ in range(count):
+        item, pos = _decode(data, pos)
+        items.append(item)
+    return items, pos
+
+
+def _decode_map(data: memoryview, pos: int) -> Tuple[Dict[str, Any], int]:
+    count, pos = _get_varint(data, pos)
+    items = {}
+    for _ in range(count):
+        key, pos = _decode_str(data, pos)
+        items[key], pos = _decode(data, pos)
+    return items, pos
+
+
+DECODERS: Dict[bytes, Callable[[memoryview, int], Tuple[Any, int]]] = {
+    TAG_NONE: lambda data, pos: (None, pos),
+    TAG_TRUE: lambda data, pos: (True, pos),
+    TAG_FALSE: lambda data, pos: (False, pos),
+    TAG_INT: _decode_int,
+    TAG_FLOAT: _decode_float,
+    TAG_STR: _decode_str,
+    TAG_BYTES: _get_bytes,
+    TAG_LIST: _decode_list,
+    TAG_MAP: _decode_map,
+}
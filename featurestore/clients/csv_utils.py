@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from . import aws_s3, spark_utils
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+CSV_SAMPLE_BYTES: int = 64 * 1024
+
+
+def read_schema(
+    bucket: str, key: str, sample_bytes: int = CSV_SAMPLE_BYTES
+) -> pa.Schema:
+    """
+    arrow schema of the csv, from its header and the types inferred
+    from only the first sample_bytes, fetched with a ranged get,
+    or for a compressed csv, eg ".csv.gz", decompressed from the head of its stream
+    :param bucket:
+    :param key:
+    :param sample_bytes:
+    :return:
+    """
+    if key.endswith(spark_utils.COMPRESSED_SUFFIXES):
+        source = aws_s3.get_stream(bucket, key)
+        with source, spark_utils._decompress(key, source) as stream:
+            sample = stream.read(sample_bytes)
+        return sample_schema(sample, complete=len(sample) < sample_bytes)
+
+    sample, size = aws_s3.read_range(bucket, key, f"bytes=0-{sample_bytes - 1}")
+    return sample_schema(sample, complete=len(sample) >= size)
+
+
+def sample_schema(sample: bytes, complete: bool = False) -> pa.Schema:
+    """
+    arrow schema inferred from the head of a csv with a header line,
+    the trailing partial line is dropped unless the sample is the complete file
+    """
+    if not complete:
+        cut = sample.rfind(b"\n")
+        assert cut > 0, "csv sample holds no complete line, increase sample bytes"
+        sample = sample[: cut + 1]
+
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    table = pa_csv.read_csv(pa.BufferReader(sample))
+    return table.schema
@@ -1,28 +1,52 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import annotations
+
 import glob
+import hashlib
 import logging
+import os
+import shutil
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps as json_ser, loads as json_dser
-from os.path import basename
-from typing import Any, Dict, List, Optional, Sequence, Tuple
-
-from botocore.exceptions import ClientError
-from pandas import DataFrame as Pandas_df
-from pandas import read_csv
-from pyspark.sql.dataframe import DataFrame as Spark_df
+from os.path import basename, dirname, getsize
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from . import (
+    asof_utils,
     aws_glue,
+    bloom,
     aws_lambda,
     aws_s3,
+    instrumentation,
     ist_utils,
+    manifest_utils,
+    parquet_utils,
+    partition_utils,
+    query_profiler,
     schema_utils,
     spark_utils,
     str_utils,
 )
 
+# pandas, pyspark and boto3 load on first use, keeping imports fast
+if TYPE_CHECKING:
+    from pandas import DataFrame as Pandas_df
+    from pyspark.sql.dataframe import DataFrame as Spark_df
+
 S3_BUCKET: str = "data-lake"
 S3_ROOT: str = "feature_store"
 
@@ -30,10 +54,15 @@ S3_STAGE_BUCKET: str = S3_BUCKET
 S3_STAGE_ROOT: str = "feature_store_stage"
 S3_STAGE_UPLOAD_FOLDER: str = f"{S3_STAGE_ROOT}/uploads"
 S3_STAGE_QUERY_FOLDER: str = f"{S3_STAGE_ROOT}/queries"
+S3_STAGE_SPINE_FOLDER: str = f"{S3_STAGE_ROOT}/spines"
 
 S3_SCHEMA_FOLDER: str = "schema"
 SCHEMA_FILE: str = "schema.json"
 S3_DATA_FOLDER: str = "data"
+# under the data folder, '_' prefixed so Athena skips it unless a partition points in
+S3_COMMITS_FOLDER: str = "_commits"
+S3_MANIFEST_FOLDER: str = "manifest"
+MANIFEST_FILE: str = "manifest.json"
 
 ACTION_KEY: str = "action"
 ARGS_KEY: str = "args"
@@ -45,33 +74,108 @@ PAYLOAD_KEY: str = "payload"
 QUERY_ID_KEY: str = "query_id"
 QUERY_STATUS_KEY: str = "query_status"
 S3_PATH_KEY: str = "s3_path"
+QUERY_KEY: str = "query"
+STATISTICS_KEY: str = "statistics"
+ENGINE_KEY: str = "engine"
+MANIFEST_KEY: str = "manifest"
+MANIFEST_PATH_KEY: str = "path"
+MANIFEST_PARTITIONS_KEY: str = "partitions"
+MANIFEST_HASHES_KEY: str = "hashes"
+UPLOADS_KEY: str = "uploads"
+NAME_KEY: str = "name"
+# user metadata of the data files, hash of the rows of their partition
+CONTENT_HASH_META: str = "content-hash"
+TRACE_ID_KEY: str = instrumentation.TRACE_ID_KEY
+SPANS_KEY: str = instrumentation.SPANS_KEY
 
 ACTION_CREATE: str = "CREATE"
 ACTION_CREATE_PARTITION: str = "CREATE_PARTITION"
 ACTION_UPLOAD: str = "UPLOAD"
+ACTION_UPLOAD_MANY: str = "UPLOAD_MANY"
 ACTION_DUMP: str = "DUMP"
 ACTION_DUMP_STATUS: str = "DUMP_STATUS"
+ACTION_GC: str = "GC"
+ACTION_EVOLVE: str = "EVOLVE"
 
 STATUS_OK = "OK"
 STATUS_ERROR = "ERROR"
 
+ENGINE_ATHENA: str = "athena"
+ENGINE_LOCAL: str = "local"
+
+# below this many bytes, fetching the parquet directly beats athena queueing and polling
+LOCAL_READ_MAX_BYTES: int = 256 * 1024 * 1024
+
 LAMBDA_ENDPOINT: str = (
     "arn:aws:lambda:ap-south-1:906474297797:function:feature-store-lambda:$LATEST"
 )
 
 GLUE_DB_NAME = "feature_store"
+GLUE_STAGE_DB_NAME = "feature_store_stage"
+
+# uploads are committed within this long, so older uncommitted files are garbage
+GC_GRACE_SECS: int = 24 * 60 * 60
+GC_PREFIX_KEY: str = "prefix"
+GC_BUCKET_KEY: str = "bucket"
+GC_OLDER_THAN_KEY: str = "older_than_ms"
+GC_TABLE_KEY: str = "table"
+
+# FGs validated, and partitions encoded and staged, concurrently by 'upload_many'
+UPLOAD_WORKERS: int = 8
+# FG commits per UPLOAD_MANY invocation are batched upto this many bytes of args,
+# below the 6MB limit of a synchronous lambda payload
+UPLOAD_MANY_MAX_PAYLOAD_BYTES: int = 5 * 1024 * 1024
+
+# files per partition of FGs with an entity key, unless supplied
+DEFAULT_NUM_BUCKETS: int = 8
+# bloom filter sidecars of candidate files 'lookup_features' fetches concurrently
+BLOOM_FETCH_WORKERS: int = 16
+BUCKET_COL: str = "__bucket__"
+
+# spines upto this many rows are joined locally, if every ref bounds its staleness
+LOCAL_SPINE_MAX_ROWS: int = 10000
+# athena's default DML timeout, the staged spine is kept until its query ends
+ASOF_QUERY_TIMEOUT_SECS: int = 30 * 60
+QUERY_POLL_SECS: int = 5
+# 'read_features' awaits its athena query upto this, else returns the query id
+READ_QUERY_TIMEOUT_SECS: int = 5 * 60
+
+PANDAS_HIVE_TYPES = {
+    "int64": "bigint",
+    "int32": "int",
+    "float64": "double",
+    "float32": "float",
+    "bool": "boolean",
+    "object": "string",
+}
 
 Schema = Dict[str, Any]
 Lambda_params = Dict[str, Any]
 Lambda_response = Tuple[bool, Dict[str, Any]]
 Paths = List[Tuple[str, str]]
+Moment = Union[int, datetime]
+# client, app, entity, version
+FgVersion = Tuple[str, str, str, str]
 
 
-logging.basicConfig(
-    format="%(asctime)s - %(message)s", level=logging.INFO, datefmt="%d-%b-%y %H:%M:%S"
-)
+class _PendingUpload(NamedTuple):
+    """a validated upload of a FG, with its partitions not yet committed"""
+
+    ref: FgVersion
+    schema: Schema
+    expected_schema: Schema
+    # time suffix, rows and their content hash
+    partitions: List[Tuple[str, Pandas_df, str]]
+
 
+class _UploadedPartition(NamedTuple):
+    time_suffix: str
+    content_hash: str
+    paths: Paths
+    entries: List[manifest_utils.FileEntry]
 
+
+@instrumentation.traced("fg.create_fg")
 def create_fg(
     client: str,
     app: str,
@@ -81,6 +185,10 @@ def create_fg(
     time_col_unit: str = "ms",
     pandas_df: Pandas_df = None,
     spark_df: Spark_df = None,
+    partition_projection: bool = False,
+    projection_years: Tuple[int, int] = aws_glue.PROJECTION_YEARS,
+    entity_key: str = None,
+    num_buckets: int = DEFAULT_NUM_BUCKETS,
 ) -> Lambda_response:
     """Create a Glue table, queryable via Athena,
      based on schema inferred for the supplied pandas/spark data-frame.
@@ -94,22 +202,38 @@ def create_fg(
      based on which data will be partitioned in s3.
      Time_col_unit is the unit of the epoch, must be one of s, ms, us, ns
      Exactly one of pandas_df or spark_df must be present.
+     With partition_projection, Athena computes the y/m/d partitions
+     of projection_years, first and last inclusive, from the query predicate,
+     so uploads skip registering partitions in Glue,
+     and partitions added via 'add_fg_partition' are ignored.
+     With an entity_key column, uploads hash its values into num_buckets files
+     per partition, sorted by key, each with a bloom filter of its keys
+     in a sidecar object, so 'lookup_features' reads only files that may match.
      """
 
     try:
-        if pandas_df is not None:
-            schema = _get_pandas_schema(pandas_df)
-        elif spark_df is not None:
-            schema = spark_utils.get_schema(spark_df)
-        else:
-            raise ValueError("No DataFrame supplied")
+        with instrumentation.span("fg.schema_inference"):
+            if pandas_df is not None:
+                schema = _get_pandas_schema(pandas_df)
+            elif spark_df is not None:
+                schema = spark_utils.get_schema(spark_df)
+            else:
+                raise ValueError("No DataFrame supplied")
 
         sane_time_col = str_utils.sanitise(time_col)
         schema_utils.validate(schema, sane_time_col, time_col_unit)
-        params = _glue_create_table_params(client, app, entity, version, schema)
+        years = projection_years if partition_projection else None
+        params = _glue_create_table_params(client, app, entity, version, schema, years)
 
         schema[schema_utils.SCHEMA_TIME_COL] = sane_time_col
         schema[schema_utils.SCHEMA_TIME_UNIT] = time_col_unit
+        if partition_projection:
+            schema[schema_utils.SCHEMA_PROJECTED] = True
+        if entity_key is not None:
+            sane_entity_key = str_utils.sanitise(entity_key)
+            schema_utils.validate_entity_key(schema, sane_entity_key, num_buckets)
+            schema[schema_utils.SCHEMA_ENTITY_KEY] = sane_entity_key
+            schema[schema_utils.SCHEMA_NUM_BUCKETS] = num_buckets
 
         rel_path = _s3_schema_rel_path(client, app, entity, version)
 
@@ -131,6 +255,42 @@ def create_fg(
         return False, {}
 
 
+@instrumentation.traced("fg.evolve_fg")
+def evolve_fg(
+    client: str, app: str, entity: str, version: str, columns: Schema
+) -> Lambda_response:
+    """Adds the columns, of name to hive type like bigint or array<string>,
+     to the FG within its version, updating only its Glue table and schema.
+     Later uploads must supply the columns too,
+     while partitions uploaded before read them as nulls.
+     Columns cannot be removed, renamed or retyped, that needs a new version.
+     The revision is recorded in the schema, see 'read_schema'.
+     The lambda adds the columns to the latest table and schema,
+     so concurrent evolves of the version keep each other's columns."""
+
+    try:
+        added = {str_utils.sanitise(col): kind for col, kind in columns.items()}
+        expected_schema = _download_schema(client, app, entity, version)
+        at_ms = ist_utils.current_epoch_millis()
+        schema = schema_utils.evolve(expected_schema, added, at_ms)
+
+        rel_path = _s3_schema_rel_path(client, app, entity, version)
+        prod_path = _s3_abs_path(S3_ROOT, rel_path)
+        stage_path = _s3_abs_path(
+            f"{S3_STAGE_UPLOAD_FOLDER}/{S3_SCHEMA_FOLDER}", f"{rel_path}.{at_ms}"
+        )
+        _upload_schema(schema, aws_s3.handle(S3_STAGE_BUCKET, stage_path))
+
+        db_name, table = _glue_table_props(client, app, entity, version)
+        params = aws_glue.add_columns_params(db_name, table, added)
+        return _invoke_lambda(ACTION_EVOLVE, params, schema, [(stage_path, prod_path)])
+
+    except Exception:
+        logging.exception("Failed to evolve FG")
+        return False, {}
+
+
+@instrumentation.traced("fg.add_fg_partition")
 def add_fg_partition(
     client: str, app: str, entity: str, version: str, partition_suffixes: Sequence[str]
 ) -> Lambda_response:
@@ -147,51 +307,173 @@ def add_fg_partition(
         return False, {}
 
 
+@instrumentation.traced("fg.upload_fg")
 def upload_fg(
     client: str, app: str, entity: str, version: str, pandas_df: Pandas_df
 ) -> Lambda_response:
     """Uploads the pandas Df data,
      and links the newly added partitions into the Glue table.
-     Must match schema specified during create FG call."""
+     Must match schema specified during create FG call.
+     Uploads are content addressed, so retrying one, eg after a lambda timeout,
+     skips partitions already committed with the same rows,
+     and files already staged or copied.
+     Files are written once, to a commit folder of the data prefix,
+     which Athena skips until the lambda points the Glue partitions to it,
+     so committing takes the same time regardless of the data size.
+     Partition projected FGs have a fixed location per partition,
+     so their files are still staged, and copied by the lambda."""
 
     try:
-        schema = _get_pandas_schema(pandas_df)
-        # TODO move download and match schema to lambda,
-        #  need to pass expected schema path as well
-        expected_schema = _download_schema(client, app, entity, version)
-        schema_utils.match(expected_schema, schema)
+        pending = _plan_upload((client, app, entity, version), pandas_df)
+        if not pending.partitions:
+            return True, {STATUS_KEY: STATUS_OK, PAYLOAD_KEY: {}}
 
-        time_col = expected_schema[schema_utils.SCHEMA_TIME_COL]
-        time_col_unit = expected_schema[schema_utils.SCHEMA_TIME_UNIT]
-        df_groups = _groupby_time(pandas_df, time_col, time_col_unit)
+        uploaded = [_upload_partition(pending, *part) for part in pending.partitions]
+        args = _upload_args(pending, uploaded)
+        response = _invoke_lambda(
+            ACTION_UPLOAD,
+            args[PARAMS_KEY],
+            args[SCHEMA_KEY],
+            args[PATHS_KEY],
+            args[MANIFEST_KEY],
+        )
+        return response
 
-        # for each folder in s3 need to add the partitions
-        paths: Paths = []
-        time_suffixes = []
-        for time_suffix in df_groups.groups:
-            group_paths = _upload_df(
-                df_groups.get_group(time_suffix),
-                client,
-                app,
-                entity,
-                version,
-                time_suffix,
-            )
+    except Exception:
+        logging.exception("Failed to upload FG")
+        return False, {}
 
-            paths.extend(group_paths)
-            time_suffixes.append(time_suffix)
 
-        params = _glue_add_partition_params(
-            client, app, entity, version, time_suffixes, schema
+@instrumentation.traced("fg.upload_many")
+def upload_many(
+    uploads: Sequence[Tuple[FgVersion, Pandas_df]], max_workers: int = UPLOAD_WORKERS
+) -> Dict[FgVersion, Lambda_response]:
+    """Uploads the pandas Df of each (client, app, entity, version) FG,
+     like 'upload_fg', but validating all the schemas concurrently,
+     and encoding and staging the partitions of every FG in one pool
+     of max_workers, so the time is bound by the total data,
+     rather than the number of FGs.
+     The FGs are committed by as few lambda invocations
+     as keep each payload within UPLOAD_MANY_MAX_PAYLOAD_BYTES.
+     Returns the response of each FG, a failing FG leaves the others committed,
+     and is retried by uploading it again.
+     Each FG must be uploaded at most once, else every FG fails."""
+
+    refs = [ref for ref, _ in uploads]
+    if len(set(refs)) != len(refs):
+        logging.error("Failed to upload FGs, each FG must be uploaded at most once")
+        return {ref: (False, {}) for ref in refs}
+
+    results: Dict[FgVersion, Lambda_response] = {}
+    trace = instrumentation.trace_id()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        plans = [pool.submit(_try_plan_upload, ref, df, trace) for ref, df in uploads]
+        planned = [future.result() for future in plans]
+        pending = [p for p in planned if p is not None]
+        for ref, plan in zip(refs, planned):
+            if plan is None:
+                results[ref] = False, {}
+            elif not plan.partitions:
+                results[ref] = True, {STATUS_KEY: STATUS_OK, PAYLOAD_KEY: {}}
+
+        futures = {
+            pool.submit(_upload_partition, p, *part, trace): p.ref
+            for p in pending
+            for part in p.partitions
+        }
+        uploaded: Dict[FgVersion, List[_UploadedPartition]] = {}
+        for future, ref in futures.items():
+            try:
+                uploaded.setdefault(ref, []).append(future.result())
+            except Exception:
+                logging.exception(f"Failed to upload FG {ref}")
+                results[ref] = False, {}
+
+    commits = {
+        table_name(*p.ref): p for p in pending if p.partitions and p.ref not in results
+    }
+    if commits:
+        statuses = _commit_many(
+            {name: _upload_args(p, uploaded[p.ref]) for name, p in commits.items()}
         )
-        response = _invoke_lambda(ACTION_UPLOAD, params, schema, paths)
-        return response
+        for name, p in commits.items():
+            status = statuses.get(name)
+            results[p.ref] = (
+                (_lambda_status_ok(status), status) if status else (False, {})
+            )
 
+    instrumentation.count("fgs", len(refs))
+    instrumentation.count("failed_fgs", sum(not ok for ok, _ in results.values()))
+    return {ref: results[ref] for ref in refs}
+
+
+def _commit_many(uploads: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Commits the upload args of each table by UPLOAD_MANY invocations,
+     returns the lambda status of each table it got one for."""
+    args = [dict(upload, **{NAME_KEY: name}) for name, upload in uploads.items()]
+    statuses: Dict[str, Any] = {}
+    for batch in _payload_batches(args, UPLOAD_MANY_MAX_PAYLOAD_BYTES):
+        _, response = _invoke_lambda_args(ACTION_UPLOAD_MANY, {UPLOADS_KEY: batch})
+        statuses.update(response.get(PAYLOAD_KEY) or {})
+    return statuses
+
+
+def _payload_batches(
+    args: List[Dict[str, Any]], max_bytes: int
+) -> List[List[Dict[str, Any]]]:
+    """Splits args into consecutive batches of upto max_bytes serialized,
+     an arg larger than max_bytes is sent in a batch of its own."""
+    batches: List[List[Dict[str, Any]]] = []
+    size = 0
+    for arg in args:
+        arg_size = len(json_ser(arg).encode("utf-8"))
+        if not batches or size + arg_size > max_bytes:
+            batches.append([])
+            size = 0
+        batches[-1].append(arg)
+        size += arg_size
+    return batches
+
+
+@instrumentation.traced("fg.gc_fg")
+def gc_fg(
+    client: str, app: str, entity: str, version: str, grace_secs: int = GC_GRACE_SECS
+) -> Lambda_response:
+    """Deletes the files uploaded for the FG, older than grace_secs,
+     that no Glue partition or the manifest points to,
+     ie uploads which failed before their commit,
+     or partitions since committed at another location."""
+    try:
+        db_name, table = _glue_table_props(client, app, entity, version)
+        prefix = data_prefix(client, app, entity, version) + S3_COMMITS_FOLDER + "/"
+        params = _gc_params(S3_BUCKET, prefix, grace_secs, f"{db_name}.{table}")
+        manifest = {
+            MANIFEST_PATH_KEY: _s3_manifest_path(S3_ROOT, client, app, entity, version)
+        }
+        return _invoke_lambda(ACTION_GC, params, manifest=manifest)
     except Exception:
-        logging.exception("Failed to upload FG")
+        logging.exception("Failed to GC FG")
+        return False, {}
+
+
+@instrumentation.traced("fg.gc_stage")
+def gc_stage(grace_secs: int = GC_GRACE_SECS) -> Lambda_response:
+    """Deletes the staged uploads, schemas and spines older than grace_secs,
+     the lambda deletes those it copies, but older uploads left them behind,
+     as do as-of joins which crashed before removing their spine."""
+    try:
+        for folder in [S3_STAGE_UPLOAD_FOLDER, S3_STAGE_SPINE_FOLDER]:
+            params = _gc_params(S3_STAGE_BUCKET, folder + "/", grace_secs)
+            success, response = _invoke_lambda(ACTION_GC, params)
+            if not success:
+                return success, response
+        return success, response
+    except Exception:
+        logging.exception("Failed to GC stage")
         return False, {}
 
 
+@instrumentation.traced("fg.dump_fg")
 def dump_fg(sql_query: str,) -> Tuple[bool, str, str, Dict[str, Any]]:
     """Invokes User defined sql query on Athena,
      and dumps csv result in S3.
@@ -209,20 +491,31 @@ def dump_fg(sql_query: str,) -> Tuple[bool, str, str, Dict[str, Any]]:
         return False, "", "", {}
 
 
+@instrumentation.traced("fg.read_fg")
 def read_fg(query_id: str) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]]]:
     """Loads result of 'dump_fg' query into a Pandas-Df.
     Might need to poll this if query is long running.
     Might fail, if result is too large to fetch,
     user must download CSV data from S3 in that case,
-    using the query result meta-data provided
+    using the query result meta-data provided.
+    The status carries the Athena statistics of the completed query,
+    like DataScannedInBytes, which are kept in the 'query_profiler' history.
     """
     try:
         query_status = _poll_query_status(query_id)
+        _profile_query(query_id, query_status)
         if _query_success(query_status[QUERY_STATUS_KEY]):
             s3path = query_status[S3_PATH_KEY]
             tmp_file = _download_from_s3(s3path)
             logging.info(f"Saved {s3path}, to local file {tmp_file}")
-            df = read_csv(tmp_file)
+            from pandas import read_csv
+
+            try:
+                with instrumentation.span("fg.csv_parse") as stage:
+                    df = read_csv(tmp_file)
+                    stage.count("rows", len(df))
+            finally:
+                os.remove(tmp_file)
             return df, query_status
         else:
             return None, query_status
@@ -231,11 +524,200 @@ def read_fg(query_id: str) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]
         return None
 
 
+@instrumentation.traced("fg.read_features")
+def read_features(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    start: Moment,
+    end: Moment,
+    columns: Sequence[str] = None,
+    filters: Sequence[partition_utils.Filter] = None,
+) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]]]:
+    """Reads features of the FG whose time_col lies within [start, end),
+     start and end are epoch seconds or datetimes (naive ones taken as IST).
+     Only the y/m/d partitions covering the range are touched.
+     Columns are projected if supplied, else all the FG columns are read.
+     Filters are (column, op, value) tuples which are and-ed together,
+     op must be one of =, !=, <, <=, >, >=, in, not in.
+     Small reads fetch the partition parquet directly, larger ones go through Athena,
+     the engine used is reported in the returned status.
+     An Athena read still running after READ_QUERY_TIMEOUT_SECS returns no rows,
+     'read_fg' of the query id in the status resumes it.
+     """
+    try:
+        start_secs, end_secs = ist_utils.to_epoch(start), ist_utils.to_epoch(end)
+        schema = _download_schema(client, app, entity, version)
+        files = _partition_files(
+            client, app, entity, version, schema, start_secs, end_secs
+        )
+        cols = list(columns) if columns else _data_cols(schema)
+        time_filters = _time_filters(schema, start_secs, end_secs)
+        all_filters = time_filters + list(filters or [])
+
+        if _plan_engine(files) == ENGINE_LOCAL:
+            with instrumentation.span("fg.read_local") as stage:
+                df = parquet_utils.read_keys(
+                    S3_BUCKET, [key for key, _ in files], cols, all_filters
+                )
+                stage.count("files", len(files))
+                stage.count("bytes", sum(size for _, size in files))
+                stage.count("rows", len(df))
+            return df, {QUERY_STATUS_KEY: "SUCCEEDED", ENGINE_KEY: ENGINE_LOCAL}
+
+        table = _glue_table_props(client, app, entity, version)[1]
+        predicate = partition_utils.partition_predicate(start_secs, end_secs)
+        query = _features_query(table, cols, predicate, all_filters)
+        return _read_athena(query, READ_QUERY_TIMEOUT_SECS)
+    except Exception:
+        logging.exception("Failed to read features")
+        return None
+
+
+@instrumentation.traced("fg.lookup_features")
+def lookup_features(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    keys: Sequence[Any],
+    start: Moment,
+    end: Moment,
+    columns: Sequence[str] = None,
+) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]]]:
+    """Reads the rows of the FG whose entity_key is one of keys,
+     and time_col lies within [start, end), as in 'read_features'.
+     The FG must have been created with an entity_key,
+     only files whose bucket, key range and bloom filter may hold a key are fetched,
+     the files read and their bytes are reported in the returned status.
+     """
+    try:
+        start_secs, end_secs = ist_utils.to_epoch(start), ist_utils.to_epoch(end)
+        schema = _download_schema(client, app, entity, version)
+        entity_key = schema.get(schema_utils.SCHEMA_ENTITY_KEY)
+        assert entity_key, "FG was created without an entity_key"
+
+        entries = _partition_entries(
+            client, app, entity, version, schema, start_secs, end_secs
+        )
+        with instrumentation.span("fg.lookup_prune") as stage:
+            num_buckets = schema[schema_utils.SCHEMA_NUM_BUCKETS]
+            bloom_keys = manifest_utils.bloom_candidates(
+                entries, keys, entity_key, num_buckets
+            )
+            blooms = _fetch_blooms(bloom_keys)
+            matched = manifest_utils.prune_by_keys(
+                entries, keys, entity_key, num_buckets, blooms
+            )
+            stage.count("bloom_files", len(bloom_keys))
+            stage.count("files", len(matched))
+            stage.count("pruned_files", len(entries) - len(matched))
+
+        cols = list(columns) if columns else _data_cols(schema)
+        key_filter = (entity_key, "in", list(keys))
+        filters = _time_filters(schema, start_secs, end_secs) + [key_filter]
+        size = manifest_utils.total_bytes(matched)
+        with instrumentation.span("fg.read_local") as stage:
+            df = parquet_utils.read_keys(
+                S3_BUCKET, [entry["key"] for entry in matched], cols, filters
+            )
+            stage.count("files", len(matched))
+            stage.count("bytes", size)
+            stage.count("rows", len(df))
+        return df, {
+            QUERY_STATUS_KEY: "SUCCEEDED",
+            ENGINE_KEY: ENGINE_LOCAL,
+            "files": len(matched),
+            "bytes": size,
+        }
+    except Exception:
+        logging.exception("Failed to lookup features")
+        return None
+
+
+@instrumentation.traced("fg.get_historical_features")
+def get_historical_features(
+    spine_df: Pandas_df,
+    feature_refs: Sequence[asof_utils.FeatureRef],
+    time_col: str = "ts",
+    time_col_unit: str = "s",
+) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]]]:
+    """Point in time correct join of the spine against the referred FGs.
+     Each spine row gets the latest row of every FG, matched on the ref key,
+     whose time is at or before the spine row's time_col epoch in time_col_unit,
+     and not older than the ref max_age_secs if supplied.
+     Joined columns are named as returned by asof_utils.feature_alias.
+     Large spines are staged as a temporary Glue table and joined in one Athena query,
+     small ones, with every ref bounding its max_age_secs, are joined locally.
+     """
+    try:
+        spine = spine_df.assign(**{asof_utils.ROW_ID_COL: range(len(spine_df))})
+        spine_range = (
+            ist_utils.to_epoch_secs(spine_df[time_col].min(), time_col_unit),
+            ist_utils.to_epoch_secs(spine_df[time_col].max(), time_col_unit) + 1,
+        )
+        resolved = list(map(_resolve_feature_ref, feature_refs))
+
+        if _local_spine(spine_df, feature_refs):
+            df = _local_asof_join(spine, resolved, time_col, time_col_unit, spine_range)
+            return df, {QUERY_STATUS_KEY: "SUCCEEDED", ENGINE_KEY: ENGINE_LOCAL}
+
+        return _athena_asof_join(spine, resolved, time_col, time_col_unit, spine_range)
+    except Exception:
+        logging.exception("Failed to get historical features")
+        return None
+
+
+def read_schema(client: str, app: str, entity: str, version: str) -> Schema:
+    """Returns the schema stored for the FG during create FG,
+     including its time_col and time_col_unit"""
+    return _download_schema(client, app, entity, version)
+
+
+def read_manifest(
+    client: str, app: str, entity: str, version: str
+) -> Optional[manifest_utils.Manifest]:
+    """Returns the manifest of partitions, and their files with statistics,
+     committed through 'upload_fg', None if nothing is committed yet"""
+    from botocore.exceptions import ClientError
+
+    path = _s3_manifest_path(S3_ROOT, client, app, entity, version)
+    try:
+        stream = aws_s3.get_stream(S3_BUCKET, path)
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] in {"NoSuchKey", "404"}:
+            return None
+        raise
+    return json_dser(str_utils.stream2str(stream))
+
+
+def data_prefix(client: str, app: str, entity: str, version: str) -> str:
+    """S3 key prefix in S3_BUCKET, under which the FG partitions are committed"""
+    return _s3_data_folder(S3_ROOT, client, app, entity, version) + "/"
+
+
+def partition_prefixes(client: str, app: str, entity: str, version: str) -> List[str]:
+    """
+    year folders of the data prefix, holding the partitions committed
+    by listing, ie not via the manifest
+    """
+    prefix = data_prefix(client, app, entity, version)
+    commits = f"{prefix}{S3_COMMITS_FOLDER}/"
+    return [p for p in aws_s3.ls_prefixes(S3_BUCKET, prefix) if p != commits]
+
+
+def table_name(client: str, app: str, entity: str, version: str) -> str:
+    """Glue table of the FG in the GLUE_DB_NAME db"""
+    return _glue_table_props(client, app, entity, version)[1]
+
+
 def get_versions(client: str, app: str, entity: str) -> Sequence[str]:
     """
     Returns list of all available versions of the given inputs.
     The versions are not sorted, and upto the user to find latest;
-    as version numbers are not standardised yet.
+    as version numbers are not standardised yet,
+    'catalog.latest_version' applies a natural sort.
     :param client:
     :param app:
     :param entity:
@@ -243,10 +725,12 @@ def get_versions(client: str, app: str, entity: str) -> Sequence[str]:
     """
     version = "???"
     path = _s3_schema_path(S3_ROOT, client, app, entity, version)
-    prefix = path.split(f"/{version}")[0]
+    prefix = path.split(f"/{version}")[0] + "/"
 
+    # the schema folder holds just the schema.json of each version,
+    # a version exists once its schema.json does, not any folder left behind
     keys = aws_s3.ls_files(S3_BUCKET, prefix)
-    return _extract_versions(keys, prefix + "/", "/" + SCHEMA_FILE)
+    return _extract_versions(keys, prefix, "/" + SCHEMA_FILE)
 
 
 def _extract_versions(keys: Sequence[str], prefix: str, suffix: str) -> Sequence[str]:
@@ -254,6 +738,242 @@ def _extract_versions(keys: Sequence[str], prefix: str, suffix: str) -> Sequence
     return list(filter(lambda s: "/" not in s, items))
 
 
+def _data_cols(schema: Schema) -> List[str]:
+    return [col for col in schema if col not in schema_utils.META_KEYS]
+
+
+def _time_filters(
+    schema: Schema, start_secs: int, end_secs: int
+) -> List[partition_utils.Filter]:
+    time_col = schema[schema_utils.SCHEMA_TIME_COL]
+    time_col_unit = schema[schema_utils.SCHEMA_TIME_UNIT]
+    return [
+        (time_col, ">=", ist_utils.from_epoch_secs(start_secs, time_col_unit)),
+        (time_col, "<", ist_utils.from_epoch_secs(end_secs, time_col_unit)),
+    ]
+
+
+def _partition_files(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    schema: Schema,
+    start_secs: int,
+    end_secs: int,
+) -> Sequence[Tuple[str, int]]:
+    entries = _partition_entries(
+        client, app, entity, version, schema, start_secs, end_secs
+    )
+    return [(entry["key"], entry["size"]) for entry in entries]
+
+
+def _partition_entries(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    schema: Schema,
+    start_secs: int,
+    end_secs: int,
+) -> List[manifest_utils.FileEntry]:
+    manifest = read_manifest(client, app, entity, version) or {}
+    committed = manifest.get(manifest_utils.PARTITIONS_KEY, {})
+    time_col_unit = schema[schema_utils.SCHEMA_TIME_UNIT]
+    start = ist_utils.from_epoch_secs(start_secs, time_col_unit)
+    end = ist_utils.from_epoch_secs(end_secs, time_col_unit)
+
+    files: List[manifest_utils.FileEntry] = []
+    for time_suffix in partition_utils.partition_suffixes(start_secs, end_secs):
+        if time_suffix in committed:
+            entries = manifest_utils.files(manifest, [time_suffix])
+            files.extend(manifest_utils.prune_by_time(entries, start, end))
+        else:
+            # partitions added outside of upload_fg are absent from the manifest
+            prefix = _s3_data_partition(
+                S3_ROOT, client, app, entity, version, time_suffix
+            )
+            listed = aws_s3.ls_sizes(S3_BUCKET, prefix + "/")
+            files.extend({"key": key, "size": size} for key, size in listed)
+    return files
+
+
+def _fetch_blooms(keys: Sequence[str]) -> Dict[str, bloom.BloomFilter]:
+    """the bloom filter sidecars at keys, fetched concurrently"""
+
+    def fetch(key: str) -> bloom.BloomFilter:
+        return bloom.BloomFilter.from_bytes(aws_s3.get_stream(S3_BUCKET, key).read())
+
+    with ThreadPoolExecutor(max_workers=BLOOM_FETCH_WORKERS) as pool:
+        return dict(zip(keys, pool.map(fetch, keys)))
+
+
+def _plan_engine(files: Sequence[Tuple[str, int]]) -> str:
+    total_bytes = sum(size for _, size in files)
+    return ENGINE_LOCAL if total_bytes <= LOCAL_READ_MAX_BYTES else ENGINE_ATHENA
+
+
+def _features_query(
+    table: str,
+    columns: Sequence[str],
+    predicate: str,
+    filters: Sequence[partition_utils.Filter],
+) -> str:
+    projection = ", ".join(columns)
+    conditions = " AND ".join([predicate, partition_utils.filter_predicate(filters)])
+    return f"select {projection} from {GLUE_DB_NAME}.{table} where {conditions};"
+
+
+def _read_athena(
+    query: str, await_secs: int = 0
+) -> Tuple[Optional[Pandas_df], Dict[str, Any]]:
+    """
+    runs the query, awaiting its end upto await_secs, before reading it,
+    the status always carries the engine, and the query id once started
+    """
+    success, query_id, _, response = dump_fg(query)
+    if not success:
+        return None, {QUERY_STATUS_KEY: "UNKNOWN", ENGINE_KEY: ENGINE_ATHENA}
+    if await_secs:
+        _await_query(query_id, await_secs)
+
+    df, query_status = read_fg(query_id) or (None, {QUERY_STATUS_KEY: "UNKNOWN"})
+    return df, {**query_status, QUERY_ID_KEY: query_id, ENGINE_KEY: ENGINE_ATHENA}
+
+
+def _resolve_feature_ref(ref: asof_utils.FeatureRef) -> asof_utils.ResolvedRef:
+    schema = _download_schema(ref.client, ref.app, ref.entity, ref.version)
+    table = _glue_table_props(ref.client, ref.app, ref.entity, ref.version)[1]
+    return (
+        ref,
+        f"{GLUE_DB_NAME}.{table}",
+        schema[schema_utils.SCHEMA_TIME_COL],
+        schema[schema_utils.SCHEMA_TIME_UNIT],
+    )
+
+
+def _local_spine(
+    spine_df: Pandas_df, feature_refs: Sequence[asof_utils.FeatureRef]
+) -> bool:
+    bounded = all(ref.max_age_secs is not None for ref in feature_refs)
+    return bounded and len(spine_df) <= LOCAL_SPINE_MAX_ROWS
+
+
+def _local_asof_join(
+    spine: Pandas_df,
+    resolved: Sequence[asof_utils.ResolvedRef],
+    time_col: str,
+    time_col_unit: str,
+    spine_range: Tuple[int, int],
+) -> Pandas_df:
+    from pandas import merge_asof
+
+    asof_col = "asof_ns"
+    joined = spine.assign(**{asof_col: _to_nanos(spine[time_col], time_col_unit)})
+    joined = joined.sort_values(asof_col)
+    for ref, _, fg_time_col, fg_time_unit in resolved:
+        features = _read_ref_features(ref, fg_time_col, spine_range)
+        aliases = {col: asof_utils.feature_alias(ref, col) for col in ref.columns}
+        right = features.assign(
+            **{asof_col: _to_nanos(features[fg_time_col], fg_time_unit)}
+        )
+        right = right[[ref.key, asof_col] + list(ref.columns)].rename(columns=aliases)
+        joined = merge_asof(
+            joined,
+            right.sort_values(asof_col),
+            on=asof_col,
+            by=ref.key,
+            # fg time must be strictly newer than spine time - max_age
+            tolerance=ist_utils.from_epoch_secs(ref.max_age_secs, "ns") - 1,
+        )
+
+    joined = joined.sort_values(asof_utils.ROW_ID_COL)
+    return joined.drop(columns=[asof_col, asof_utils.ROW_ID_COL]).reset_index(drop=True)
+
+
+def _read_ref_features(
+    ref: asof_utils.FeatureRef, fg_time_col: str, spine_range: Tuple[int, int]
+) -> Pandas_df:
+    start_secs, end_secs = spine_range
+    columns = [ref.key, fg_time_col] + [
+        c for c in ref.columns if c not in {ref.key, fg_time_col}
+    ]
+    result = read_features(
+        ref.client,
+        ref.app,
+        ref.entity,
+        ref.version,
+        start_secs - ref.max_age_secs,
+        end_secs,
+        columns=columns,
+    )
+    if result is None or result[0] is None:
+        raise ValueError(f"Failed to read features for {ref}")
+    return result[0]
+
+
+def _to_nanos(epochs, time_col_unit: str):
+    factor = ist_utils.EPOCH_DIVISORS["ns"] // ist_utils.EPOCH_DIVISORS[time_col_unit]
+    return epochs.astype("int64") * factor
+
+
+def _athena_asof_join(
+    spine: Pandas_df,
+    resolved: Sequence[asof_utils.ResolvedRef],
+    time_col: str,
+    time_col_unit: str,
+    spine_range: Tuple[int, int],
+) -> Tuple[Optional[Pandas_df], Dict[str, Any]]:
+    table = "spine_" + _uuid().replace("-", "_")
+    folder = f"{S3_STAGE_SPINE_FOLDER}/{table}"
+    _upload_spine(spine, folder)
+
+    location = _glue_s3_partition(S3_STAGE_BUCKET, folder)
+    aws_glue.create_table(
+        GLUE_STAGE_DB_NAME, table, location, _spine_schema(spine), partitioned=False
+    )
+    try:
+        query = asof_utils.asof_query(
+            f"{GLUE_STAGE_DB_NAME}.{table}",
+            time_col,
+            time_col_unit,
+            spine_range,
+            resolved,
+        )
+        # the spine table must outlive the query reading it
+        result = _read_athena(query, ASOF_QUERY_TIMEOUT_SECS)
+    finally:
+        aws_glue.delete_table(GLUE_STAGE_DB_NAME, table)
+        aws_s3.handle(S3_STAGE_BUCKET, _spine_key(folder)).delete()
+
+    df, query_status = result
+    if df is None:
+        return result
+    df = df.sort_values(asof_utils.ROW_ID_COL).drop(columns=[asof_utils.ROW_ID_COL])
+    return df.reset_index(drop=True), query_status
+
+
+def _upload_spine(spine: Pandas_df, folder: str) -> None:
+    local_file = f"/tmp/{basename(folder)}.parquet"
+    spine.to_parquet(local_file, index=False)
+    try:
+        aws_s3.handle(S3_STAGE_BUCKET, _spine_key(folder)).upload_file(local_file)
+    finally:
+        os.remove(local_file)
+
+
+def _spine_key(folder: str) -> str:
+    return f"{folder}/spine.parquet"
+
+
+def _spine_schema(spine: Pandas_df) -> Schema:
+    unsupported = [
+        c for c, t in spine.dtypes.items() if str(t) not in PANDAS_HIVE_TYPES
+    ]
+    assert not unsupported, f"Unsupported column types in spine {unsupported}"
+    return {col: PANDAS_HIVE_TYPES[str(dtype)] for col, dtype in spine.dtypes.items()}
+
+
 def _pause(sec: int) -> None:
     logging.info(f"Pause for {sec} sec ...")
     time.sleep(sec)
@@ -269,18 +989,47 @@ def _query_success(status: str) -> bool:
 
 def _poll_query_status(query_id: str) -> Dict[str, Any]:
     response: Dict[str, Any] = {}
-    for timeout in [5, 10, 15]:
-        # prevent spamming abuse
-        _pause(timeout)
-        response = _query_status(query_id)
-        if _query_completed(response[QUERY_STATUS_KEY]):
-            break
-    else:
-        logging.warning(f"Query {query_id} not yet completed, try later")
+    with instrumentation.span("fg.poll", query_id=query_id) as stage:
+        for timeout in [5, 10, 15]:
+            # prevent spamming abuse
+            _pause(timeout)
+            response = _query_status(query_id)
+            stage.count("polls")
+            if _query_completed(response[QUERY_STATUS_KEY]):
+                break
+        else:
+            logging.warning(f"Query {query_id} not yet completed, try later")
 
     return response
 
 
+def _await_query(query_id: str, timeout_secs: int) -> None:
+    deadline = time.monotonic() + timeout_secs
+    with instrumentation.span("fg.await", query_id=query_id) as stage:
+        while time.monotonic() < deadline:
+            stage.count("polls")
+            if _query_completed(_query_status(query_id)[QUERY_STATUS_KEY]):
+                return
+            _pause(QUERY_POLL_SECS)
+    logging.warning(f"Query {query_id} not completed in {timeout_secs} secs")
+
+
+def _profile_query(query_id: str, query_status: Dict[str, Any]) -> None:
+    statistics = query_status.get(STATISTICS_KEY)
+    if not statistics or not query_status.get(QUERY_KEY):
+        return
+    try:
+        query_profiler.record(
+            query_id,
+            query_status[QUERY_KEY],
+            statistics,
+            GLUE_DB_NAME,
+            query_status[QUERY_STATUS_KEY],
+        )
+    except Exception:
+        logging.warning(f"Failed to profile query {query_id}", exc_info=True)
+
+
 def _query_status(query_id: str) -> Dict[str, Any]:
     success, response = _invoke_lambda(ACTION_DUMP_STATUS, {QUERY_ID_KEY: query_id})
     if success:
@@ -322,6 +1071,14 @@ def _s3_schema_path(root: str, client: str, app: str, entity: str, version: str)
     return "/".join([root, _s3_schema_rel_path(client, app, entity, version)])
 
 
+def _s3_manifest_path(
+    root: str, client: str, app: str, entity: str, version: str
+) -> str:
+    return "/".join(
+        [root, client, app, entity, S3_MANIFEST_FOLDER, version, MANIFEST_FILE]
+    )
+
+
 def _s3_data_file(
     root: str,
     client: str,
@@ -346,6 +1103,118 @@ def _s3_data_folder(root: str, client: str, app: str, entity: str, version: str)
     return "/".join([root, client, app, entity, S3_DATA_FOLDER, version])
 
 
+def _s3_commit_partition(
+    root: str,
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    content_hash: str,
+    time_suffix: str,
+) -> str:
+    return "/".join(
+        [
+            _s3_data_folder(root, client, app, entity, version),
+            S3_COMMITS_FOLDER,
+            content_hash,
+            time_suffix,
+        ]
+    )
+
+
+def _plan_upload(ref: FgVersion, pandas_df: Pandas_df) -> _PendingUpload:
+    """validates the Df against the FG schema, and splits it into the partitions
+    not yet committed with the same rows"""
+    with instrumentation.span("fg.schema_inference") as stage:
+        schema = _get_pandas_schema(pandas_df)
+        stage.count("rows", len(pandas_df))
+    # TODO move download and match schema to lambda,
+    #  need to pass expected schema path as well
+    expected_schema = _download_schema(*ref)
+    schema_utils.match(expected_schema, schema)
+
+    time_col = expected_schema[schema_utils.SCHEMA_TIME_COL]
+    time_col_unit = expected_schema[schema_utils.SCHEMA_TIME_UNIT]
+    with instrumentation.span("fg.partition") as stage:
+        df_groups = _groupby_time(pandas_df, time_col, time_col_unit)
+        stage.count("partitions", len(df_groups.groups))
+
+    committed = _committed_hashes(*ref)
+    partitions = []
+    for time_suffix in df_groups.groups:
+        group_df = df_groups.get_group(time_suffix)
+        content_hash = _content_hash(group_df)
+        if committed.get(time_suffix) == content_hash:
+            logging.info(f"Skipped {time_suffix}, already committed")
+            instrumentation.count("skipped_partitions")
+            continue
+        # partitions committed before content hashes, are checked by listing
+        assert committed.get(time_suffix) is None, f"{time_suffix} holds other data"
+        partitions.append((time_suffix, group_df, content_hash))
+
+    return _PendingUpload(ref, schema, expected_schema, partitions)
+
+
+def _try_plan_upload(
+    ref: FgVersion, pandas_df: Pandas_df, trace_id: Optional[str] = None
+) -> Optional[_PendingUpload]:
+    try:
+        with instrumentation.span("fg.plan_upload", trace_id, fg="/".join(ref)):
+            return _plan_upload(ref, pandas_df)
+    except Exception:
+        logging.exception(f"Failed to upload FG {ref}")
+        return None
+
+
+def _upload_partition(
+    pending: _PendingUpload,
+    time_suffix: str,
+    group_df: Pandas_df,
+    content_hash: str,
+    trace_id: Optional[str] = None,
+) -> _UploadedPartition:
+    # trace_id joins uploads run in pool threads to the caller's trace
+    with instrumentation.span("fg.upload_partition", trace_id, partition=time_suffix):
+        paths, entries = _upload_df(
+            group_df,
+            *pending.ref,
+            time_suffix,
+            pending.expected_schema[schema_utils.SCHEMA_TIME_COL],
+            pending.schema,
+            _bucketing(pending.expected_schema),
+            content_hash,
+            copy_free=not _projected(pending.expected_schema),
+        )
+    return _UploadedPartition(time_suffix, content_hash, paths, entries)
+
+
+def _upload_args(
+    pending: _PendingUpload, uploaded: Sequence[_UploadedPartition]
+) -> Dict[str, Any]:
+    """lambda args committing the uploaded partitions of the FG"""
+    client, app, entity, version = pending.ref
+    commits = {part.time_suffix: part.content_hash for part in uploaded}
+    # projected partitions are found by Athena without registering them
+    params = (
+        None
+        if _projected(pending.expected_schema)
+        else _glue_add_partition_params(
+            client, app, entity, version, list(commits), pending.schema, commits
+        )
+    )
+    manifest = {
+        MANIFEST_PATH_KEY: _s3_manifest_path(S3_ROOT, client, app, entity, version),
+        MANIFEST_PARTITIONS_KEY: {part.time_suffix: part.entries for part in uploaded},
+        MANIFEST_HASHES_KEY: commits,
+    }
+    return {
+        PARAMS_KEY: params,
+        SCHEMA_KEY: pending.schema,
+        PATHS_KEY: [path for part in uploaded for path in part.paths],
+        MANIFEST_KEY: manifest,
+    }
+
+
 def _upload_df(
     pandas_df: Pandas_df,
     client: str,
@@ -353,36 +1222,165 @@ def _upload_df(
     entity: str,
     version: str,
     time_suffix: str,
-) -> Paths:
+    time_col: str,
+    schema: Schema,
+    bucketing: Optional[Tuple[str, int]] = None,
+    content_hash: Optional[str] = None,
+    copy_free: bool = False,
+) -> Tuple[Paths, List[manifest_utils.FileEntry]]:
+    """
+    uploads the partition of the Df, returning the stage to prod paths to copy,
+    and the manifest entries of its files.
+    copy_free uploads write in place, to a commit folder of the data prefix,
+    which the lambda registers as the partition location, with nothing to copy
+    """
 
-    prod_prefix = _s3_data_partition(S3_ROOT, client, app, entity, version, time_suffix)
-    # abort in case that partitions data is already present in prod
-    _assert_folder_absent_s3(S3_BUCKET, prod_prefix)
+    content_hash = content_hash or _content_hash(pandas_df)
+    partition_prefix = _s3_data_partition(
+        S3_ROOT, client, app, entity, version, time_suffix
+    )
+    # abort in case the partition holds other data in prod, not a retry of this
+    _assert_folder_absent_s3(S3_BUCKET, partition_prefix, content_hash)
 
     ts = ist_utils.current_epoch_millis()
-    pq_name = f"_{client}_{app}_{entity}_{ts}"
+    # unique per call, uploads of the same FG may run in parallel
+    pq_name = f"_{client}_{app}_{entity}_{ts}_{_uuid()}"
     local_pq_dir = f"/tmp/{pq_name}"
-    spark_df = spark_utils.pandas2spark(pandas_df)
-    parquet_paths = _save_parquet_local(spark_df, local_pq_dir)
+    with instrumentation.span("fg.parquet_encode") as stage:
+        parquet_files = _encode_parquet(pandas_df, schema, local_pq_dir, bucketing)
+        stage.count("rows", len(pandas_df))
 
-    # avoid clobbering on concurrent/multiple updates
-    folder_id = _uuid()
-    stage_root = f"{S3_STAGE_UPLOAD_FOLDER}/{S3_DATA_FOLDER}/{folder_id}"
-    stage_prefix = _s3_data_partition(
-        stage_root, client, app, entity, version, time_suffix
-    )
+    try:
+        # named by content, so concurrent uploads of other data never clobber,
+        # and retries find what they staged or copied before
+        if copy_free:
+            prod_prefix = _s3_commit_partition(
+                S3_ROOT, client, app, entity, version, content_hash, time_suffix
+            )
+            upload_bucket, upload_prefix = S3_BUCKET, prod_prefix
+        else:
+            stage_root = f"{S3_STAGE_UPLOAD_FOLDER}/{S3_DATA_FOLDER}/{content_hash}"
+            prod_prefix = partition_prefix
+            upload_bucket, upload_prefix = S3_STAGE_BUCKET, _s3_data_partition(
+                stage_root, client, app, entity, version, time_suffix
+            )
+        content_meta = {CONTENT_HASH_META: content_hash}
+
+        paths: Paths = []
+        entries: List[manifest_utils.FileEntry] = []
+
+        def upload(local_path: str, upload_path: str, prod_path: str) -> None:
+            if aws_s3.metadata(S3_BUCKET, prod_path) == content_meta:
+                stage.count("skipped_files")
+            elif (
+                not copy_free
+                and aws_s3.metadata(upload_bucket, upload_path) == content_meta
+            ):
+                stage.count("skipped_files")
+                paths.append((upload_path, prod_path))
+            else:
+                s3obj = aws_s3.handle(upload_bucket, upload_path)
+                s3obj.upload_file(local_path, ExtraArgs={"Metadata": content_meta})
+                if not copy_free:
+                    paths.append((upload_path, prod_path))
+                stage.count("bytes", getsize(local_path))
+
+        with instrumentation.span("fg.s3_upload", partition=time_suffix) as stage:
+            for i, (bucket, pq) in enumerate(parquet_files):
+                part = f"{i:05d}" if bucket is None else f"b{bucket:05d}"
+                fname = f"{content_hash[:16]}-{part}.parquet"
+                upload_path = "/".join([upload_prefix, fname])
+                prod_path = "/".join([prod_prefix, fname])
+
+                entity_key = bucketing[0] if bucketing else None
+                entry = manifest_utils.file_entry(
+                    prod_path, pq, getsize(pq), time_col, entity_key, bucket
+                )
+                upload(pq, upload_path, prod_path)
+                if "bloom" in entry:
+                    # a sidecar, so the manifest and lambda payload stay small
+                    upload(
+                        manifest_utils.local_bloom_path(pq),
+                        manifest_utils.bloom_key(upload_path),
+                        entry["bloom"]["key"],
+                    )
+                entries.append(entry)
+                stage.count("files")
+
+        return paths, entries
+    finally:
+        shutil.rmtree(local_pq_dir, ignore_errors=True)
+
+
+def _content_hash(pandas_df: Pandas_df) -> str:
+    """hash of the rows of the Df, and its column names and types, in order"""
+    from pandas.util import hash_pandas_object
+
+    try:
+        rows = hash_pandas_object(pandas_df, index=False)
+    except TypeError:
+        # nested values, like lists or dicts, are unhashable
+        rows = hash_pandas_object(pandas_df.astype(str), index=False)
 
-    paths: Paths = []
-    for pq in parquet_paths:
-        fname = basename(pq)
-        stage_path = "/".join([stage_prefix, fname])
-        prod_path = "/".join([prod_prefix, fname])
+    columns = [[str(col), str(dtype)] for col, dtype in pandas_df.dtypes.items()]
+    digest = hashlib.sha256(json_ser(columns).encode("utf-8"))
+    digest.update(rows.values.tobytes())
+    return digest.hexdigest()
 
-        s3obj = aws_s3.handle(S3_STAGE_BUCKET, stage_path)
-        s3obj.upload_file(pq)
-        paths.append((stage_path, prod_path))
 
-    return paths
+def _committed_hashes(
+    client: str, app: str, entity: str, version: str
+) -> Dict[str, Optional[str]]:
+    manifest = read_manifest(client, app, entity, version) or {}
+    partitions = manifest.get(manifest_utils.PARTITIONS_KEY, {})
+    return {
+        name: partition.get(manifest_utils.HASH_KEY)
+        for name, partition in partitions.items()
+    }
+
+
+def _gc_params(
+    bucket: str, prefix: str, grace_secs: int, table: str = None
+) -> Lambda_params:
+    older_than_ms = ist_utils.current_epoch_millis() - grace_secs * 1000
+    return {
+        GC_BUCKET_KEY: bucket,
+        GC_PREFIX_KEY: prefix,
+        GC_OLDER_THAN_KEY: older_than_ms,
+        GC_TABLE_KEY: table,
+    }
+
+
+def _projected(schema: Schema) -> bool:
+    return bool(schema.get(schema_utils.SCHEMA_PROJECTED))
+
+
+def _bucketing(schema: Schema) -> Optional[Tuple[str, int]]:
+    entity_key = schema.get(schema_utils.SCHEMA_ENTITY_KEY)
+    if entity_key is None:
+        return None
+    return entity_key, schema[schema_utils.SCHEMA_NUM_BUCKETS]
+
+
+def _encode_parquet(
+    pandas_df: Pandas_df,
+    schema: Schema,
+    fpath: str,
+    bucketing: Optional[Tuple[str, int]],
+) -> List[Tuple[Optional[int], str]]:
+    """local parquet files of the Df, with their entity key bucket if bucketed"""
+    # already inferred from the whole Df, so skip inferring it per partition
+    if bucketing is None:
+        spark_df = spark_utils.pandas2spark(pandas_df, schema)
+        return [(None, pq) for pq in _save_parquet_local(spark_df, fpath)]
+
+    entity_key, num_buckets = bucketing
+    buckets = pandas_df[entity_key].map(lambda key: bloom.bucket(key, num_buckets))
+    spark_df = spark_utils.pandas2spark(
+        pandas_df.assign(**{BUCKET_COL: buckets.astype("int64")}),
+        {**schema, BUCKET_COL: "bigint"},
+    )
+    return _save_bucketed_parquet_local(spark_df, fpath, entity_key)
 
 
 def _uuid() -> str:
@@ -400,12 +1398,26 @@ def _s3_abs_path(root: str, rel_path: str) -> str:
     return f"{root}/{rel_path}"
 
 
-def _assert_folder_absent_s3(bucket: str, prefix: str) -> None:
-    items = aws_s3.ls_files(bucket, prefix)
-    assert len(items) < 1, f"Some objects exist in S3 under {prefix} : {items}"
+def _assert_folder_absent_s3(
+    bucket: str, prefix: str, content_hash: Optional[str] = None
+) -> None:
+    """
+    asserts nothing is under prefix,
+    except files of a partition with the same content hash, ie a retried upload
+    """
+    message = f"Some objects exist in S3 under {prefix}"
+    if content_hash is None:
+        assert not aws_s3.exists(bucket, prefix), message
+        return
+
+    for key in aws_s3.ls_files(bucket, prefix):
+        found = (aws_s3.metadata(bucket, key) or {}).get(CONTENT_HASH_META)
+        assert found == content_hash, message
 
 
 def _assert_absent_s3(s3obj) -> None:
+    from botocore.exceptions import ClientError
+
     not_found = False
     try:
         # list object is costly
@@ -426,8 +1438,7 @@ def _download_schema(client: str, app: str, entity: str, version: str) -> Schema
 def _get_epoch_secs(
     pandas_df: Pandas_df, index: int, time_col: str, time_col_unit: str
 ) -> int:
-    div = {"s": 1, "ms": 1000, "us": 1000000, "ns": 1000000000}
-    return int(pandas_df[time_col].loc[index] / div[time_col_unit])
+    return ist_utils.to_epoch_secs(pandas_df[time_col].loc[index], time_col_unit)
 
 
 def _get_record_s3_folder(
@@ -449,6 +1460,19 @@ def _save_parquet_local(spark_df: Spark_df, fpath: str) -> Sequence[str]:
     return glob.glob(f"{fpath}/*.parquet")
 
 
+def _save_bucketed_parquet_local(
+    spark_df: Spark_df, fpath: str, entity_key: str
+) -> List[Tuple[int, str]]:
+    # a file per bucket, sorted by key for tight key ranges in its statistics
+    sorted_df = spark_df.coalesce(1).sortWithinPartitions(BUCKET_COL, entity_key)
+    sorted_df.write.partitionBy(BUCKET_COL).parquet(fpath)
+    files = []
+    for pq in glob.glob(f"{fpath}/{BUCKET_COL}=*/*.parquet"):
+        bucket = int(basename(dirname(pq)).split("=", 1)[1])
+        files.append((bucket, pq))
+    return sorted(files)
+
+
 def _glue_table_props(
     client: str, app: str, entity: str, version: str
 ) -> Tuple[str, str]:
@@ -463,14 +1487,26 @@ def _glue_s3_partition(bucket: str, s3_folder: str) -> str:
 
 
 def _glue_create_table_params(
-    client: str, app: str, entity: str, version: str, schema: Schema
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    schema: Schema,
+    projection_years: Tuple[int, int] = None,
 ) -> Lambda_params:
     db_name, table_name = _glue_table_props(client, app, entity, version)
     s3_data_path = _glue_s3_partition(
         S3_BUCKET, _s3_data_folder(S3_ROOT, client, app, entity, version)
     )
+    projection = (
+        aws_glue.projection_properties(s3_data_path, projection_years)
+        if projection_years
+        else None
+    )
 
-    params = aws_glue.create_table_params(db_name, table_name, s3_data_path, schema)
+    params = aws_glue.create_table_params(
+        db_name, table_name, s3_data_path, schema, projection=projection
+    )
     return params
 
 
@@ -481,44 +1517,78 @@ def _glue_add_partition_params(
     version: str,
     time_suffixes: Sequence[str],
     schema: Schema = None,
+    commits: Dict[str, str] = None,
 ) -> Lambda_params:
+    """
+    partitions located in their data folder,
+    or the commit folder of their content hash in commits, if present
+    """
     db_name, table_name = _glue_table_props(client, app, entity, version)
-    partitions = list(
-        map(
-            lambda it: _glue_partition_paths(client, app, entity, version, it),
-            time_suffixes,
-        )
-    )
+    commits = commits or {}
+    partitions = [
+        _glue_partition_paths(client, app, entity, version, it, commits.get(it))
+        for it in time_suffixes
+    ]
     return aws_glue.add_partitions_params(db_name, table_name, partitions, schema)
 
 
 def _glue_partition_paths(
-    client: str, app: str, entity: str, version: str, time_suffix: str
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    time_suffix: str,
+    content_hash: Optional[str] = None,
 ) -> str:
-    prod_location = _glue_s3_partition(
-        S3_BUCKET,
-        _s3_data_partition(S3_ROOT, client, app, entity, version, time_suffix),
+    prefix = (
+        _s3_commit_partition(
+            S3_ROOT, client, app, entity, version, content_hash, time_suffix
+        )
+        if content_hash
+        else _s3_data_partition(S3_ROOT, client, app, entity, version, time_suffix)
     )
-    return prod_location
+    return _glue_s3_partition(S3_BUCKET, prefix)
 
 
 def _invoke_lambda(
-    action: str, params: Lambda_params, schema: Schema = None, rel_paths: Paths = None
+    action: str,
+    params: Lambda_params,
+    schema: Schema = None,
+    rel_paths: Paths = None,
+    manifest: Dict[str, Any] = None,
 ) -> Lambda_response:
-    params = {
-        ACTION_KEY: action,
-        ARGS_KEY: {SCHEMA_KEY: schema, PARAMS_KEY: params, PATHS_KEY: rel_paths},
+    args = {
+        SCHEMA_KEY: schema,
+        PARAMS_KEY: params,
+        PATHS_KEY: rel_paths,
+        MANIFEST_KEY: manifest,
     }
+    return _invoke_lambda_args(action, args)
 
-    response = aws_lambda.invoke(LAMBDA_ENDPOINT, params)
 
-    logging.info(f"Lambda response: \n{response}")
-    if _http_ok(response):
-        payload = json_dser(str_utils.stream2str(response["Payload"]))
-        logging.info(f"Lambda response Payload: \n{payload}")
-        return _lambda_status_ok(payload), payload
-    else:
-        return False, {}
+def _invoke_lambda_args(action: str, args: Dict[str, Any]) -> Lambda_response:
+    params = {ACTION_KEY: action, ARGS_KEY: args}
+
+    with instrumentation.span("fg.lambda", action=action):
+        # the lambda times its stages under the caller's trace
+        params[TRACE_ID_KEY] = instrumentation.trace_id()
+        response = aws_lambda.invoke(LAMBDA_ENDPOINT, params)
+
+        logging.info(f"Lambda response: \n{response}")
+        if _http_ok(response):
+            payload = json_dser(str_utils.stream2str(response["Payload"]))
+            logging.info(f"Lambda response Payload: \n{payload}")
+            _record_lambda_spans(payload)
+            return _lambda_status_ok(payload), payload
+        else:
+            return False, {}
+
+
+def _record_lambda_spans(payload: Dict[str, Any]) -> None:
+    for lambda_span in payload.get(SPANS_KEY) or []:
+        instrumentation.record(
+            lambda_span["name"], lambda_span["secs"], lambda_span["counters"]
+        )
 
 
 def _http_ok(response) -> bool:
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TRACE_ENV: str = "FEATURESTORE_TRACE"
+TRACE_ID_KEY: str = "trace_id"
+SPANS_KEY: str = "spans"
+
+
+class Span:
+    """
+    Timing of a stage, with counters like rows, bytes, files and retries,
+    spans nest within the thread, sharing the trace id of the outermost one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attrs: Dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.counters: Dict[str, float] = {}
+        self.started_at = time.time()
+        self.secs = 0.0
+        self.error: Optional[str] = None
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def __repr__(self) -> str:
+        return (
+            f"Span({self.name}, {self.secs * 1000:.1f}ms, trace={self.trace_id}, "
+            f"counters={self.counters}, attrs={self.attrs}, error={self.error})"
+        )
+
+
+Exporter = Callable[[Span], None]
+
+_exporters: List[Exporter] = []
+_local = threading.local()
+
+
+def add_exporter(exporter: Exporter) -> Exporter:
+    """exports every finished span to exporter, returned for later removal"""
+    _exporters.append(exporter)
+    return exporter
+
+
+def remove_exporter(exporter: Exporter) -> None:
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attrs: Any) -> Iterator[Span]:
+    """
+    times the enclosed stage as a child of the current span,
+    or as the root of trace_id, a new trace if absent
+    """
+    current_span = _child(name, trace_id, attrs)
+    stack = _stack()
+    stack.append(current_span)
+    started = time.perf_counter()
+    try:
+        yield current_span
+    except BaseException as ex:
+        current_span.error = type(ex).__name__
+        raise
+    finally:
+        current_span.secs = time.perf_counter() - started
+        stack.pop()
+        _export(current_span)
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """decorates a function to run within a span of name"""
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: float = 1) -> None:
+    """adds to the counter of the current span, if any"""
+    stack = _stack()
+    if stack:
+        stack[-1].count(name, value)
+
+
+def trace_id() -> Optional[str]:
+    stack = _stack()
+    return stack[-1].trace_id if stack else None
+
+
+def record(
+    name: str, secs: float, counters: Optional[Dict[str, float]] = None, **attrs: Any
+) -> None:
+    """
+    exports a span timed elsewhere, eg in the lambda,
+    as a child of the current span
+    """
+    recorded = _child(name, None, attrs)
+    recorded.counters.update(counters or {})
+    recorded.secs = secs
+    _export(recorded)
+
+
+def log_exporter(finished: Span) -> None:
+    logging.info(f"{finished}")
+
+
+class MemoryCollector:
+    """keeps every finished span, eg for tests or notebooks"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._spans: List[Span] = []
+
+    def __call__(self, finished: Span) -> None:
+        with self._lock:
+            self._spans.append(finished)
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def by_name(self, name: str) -> List[Span]:
+        return [s for s in self.spans if s.name == name]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class PrometheusExporter:
+    """aggregates finished spans per name, rendered in prometheus text format"""
+
+    def __init__(self, prefix: str = "featurestore") -> None:
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._spans: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0, 0])
+        self._counters: Dict[Tuple[str, str], float] = defaultdict(float)
+
+    def __call__(self, finished: Span) -> None:
+        with self._lock:
+            aggregate = self._spans[finished.name]
+            aggregate[0] += 1
+            aggregate[1] += finished.secs
+            aggregate[2] += 1 if finished.error else 0
+            for counter, value in finished.counters.items():
+                self._counters[(finished.name, counter)] += value
+
+    def text(self) -> str:
+        lines = [f"# TYPE {self.prefix}_span_seconds summary"]
+        with self._lock:
+            for name, (calls, secs, errors) in sorted(self._spans.items()):
+                label = f'{{span="{name}"}}'
+                lines.append(f"{self.prefix}_span_seconds_count{label} {calls}")
+                lines.append(f"{self.prefix}_span_seconds_sum{label} {secs}")
+                lines.append(f"{self.prefix}_span_errors_total{label} {errors}")
+            for (name, counter), value in sorted(self._counters.items()):
+                label = f'{{span="{name}"}}'
+                lines.append(f"{self.prefix}_{counter}_total{label} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _child(name: str, trace_id: Optional[str], attrs: Dict[str, Any]) -> Span:
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    return Span(name, trace_id, parent.span_id if parent else None, attrs)
+
+
+def _export(finished: Span) -> None:
+    for exporter in list(_exporters):
+        try:
+            exporter(finished)
+        except Exception:
+            logging.exception(f"Failed to export span {finished.name}")
+
+
+if os.environ.get(TRACE_ENV) == "log":
+    add_exporter(log_exporter)
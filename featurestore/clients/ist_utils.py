@@ -2,6 +2,7 @@
 
 import time
 from datetime import datetime
+from typing import Union
 
 import pytz
 
@@ -19,3 +20,29 @@ def to_partition(epoch_secs: int) -> str:
 
 def current_epoch_millis() -> int:
     return int(round(time.time() * 1000))
+
+
+EPOCH_DIVISORS = {"s": 1, "ms": 1000, "us": 1000000, "ns": 1000000000}
+
+
+def to_epoch_secs(epoch: int, unit: str) -> int:
+    return int(epoch / EPOCH_DIVISORS[unit])
+
+
+def to_epoch_millis(epoch: int, unit: str) -> int:
+    return int(epoch * 1000 / EPOCH_DIVISORS[unit])
+
+
+def from_epoch_secs(epoch_secs: int, unit: str) -> int:
+    return int(epoch_secs) * EPOCH_DIVISORS[unit]
+
+
+def to_epoch(moment: Union[int, datetime]) -> int:
+    """
+    epoch seconds of an int epoch or a datetime,
+    naive datetimes are taken to be in IST
+    """
+    if isinstance(moment, datetime):
+        aware = moment if moment.tzinfo else IST.localize(moment)
+        return int(aware.timestamp())
+    return int(moment)
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from . import aws_glue, aws_s3, catalog, fg, instrumentation, manifest_utils
+
+# duckdb is optional, installed with the "local" extra
+if TYPE_CHECKING:
+    import duckdb
+    from pandas import DataFrame as Pandas_df
+
+LOCAL_CACHE_PATH: str = os.environ.get(
+    "FEATURESTORE_LOCAL_CACHE", "/tmp/featurestore-cache"
+)
+MAX_WORKERS: int = 8
+
+PARTITION_COLS: Sequence[str] = ("y", "m", "d")
+# expressions which may appear in a partition predicate
+PREDICATE_CLASSES = {"COMPARISON", "CONJUNCTION", "OPERATOR", "CONSTANT", "BETWEEN"}
+
+SCANNED_BYTES_KEY: str = "scanned_bytes"
+
+# (client, app, entity, version)
+FgVersion = fg.FgVersion
+Ast = Dict[str, Any]
+
+# glue table name -> FG version, filled from the catalog
+_tables: Dict[str, FgVersion] = {}
+
+
+class DataFile(NamedTuple):
+    key: str
+    size: int
+    y: str
+    m: str
+    d: str
+
+
+class QueryPlan(NamedTuple):
+    """files of each FG table a query reads, after partition pruning"""
+
+    tables: Dict[str, List[DataFile]]
+
+    @property
+    def scan_bytes(self) -> int:
+        return sum(f.size for files in self.tables.values() for f in files)
+
+
+@instrumentation.traced("local_engine.query")
+def query(
+    sql_query: str, max_local_bytes: Optional[int] = None
+) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]]]:
+    """Runs the sql query over FG tables, like 'dump_fg' followed by 'read_fg'.
+    Queries whose pruned partitions hold at most max_local_bytes,
+    'fg.LOCAL_READ_MAX_BYTES' if absent, run in process on DuckDB,
+    the rest, or those which cannot be planned locally, go to Athena.
+    The engine used is reported in the returned status.
+    """
+    limit = fg.LOCAL_READ_MAX_BYTES if max_local_bytes is None else max_local_bytes
+    try:
+        plan = plan_query(sql_query)
+    except Exception:
+        logging.warning("Failed to plan query locally, using Athena", exc_info=True)
+        plan = None
+
+    if plan is not None and plan.scan_bytes <= limit:
+        return query_local(sql_query, plan)
+
+    success, query_id, _, _ = fg.dump_fg(sql_query)
+    if not success:
+        return None, {fg.QUERY_STATUS_KEY: "UNKNOWN", fg.ENGINE_KEY: fg.ENGINE_ATHENA}
+    result = fg.read_fg(query_id)
+    if result is None:
+        return None
+    df, query_status = result
+    return df, {**query_status, fg.ENGINE_KEY: fg.ENGINE_ATHENA}
+
+
+def query_local(
+    sql_query: str, plan: Optional[QueryPlan] = None
+) -> Optional[Tuple[Optional[Pandas_df], Dict[str, Any]]]:
+    """Runs the sql query on DuckDB, over the y/m/d parquet layout of its FG tables,
+    fetching only the files of the partitions its predicate selects
+    into the local cache at LOCAL_CACHE_PATH.
+    The query must be valid in both the Athena and DuckDB dialects.
+    """
+    try:
+        plan = plan or plan_query(sql_query)
+        with instrumentation.span("local_engine.fetch") as stage:
+            local_files = _fetch(plan)
+            stage.count("files", sum(len(files) for files in local_files.values()))
+            stage.count("bytes", plan.scan_bytes)
+
+        with instrumentation.span("local_engine.execute") as stage:
+            conn = _connect()
+            try:
+                for table, files in local_files.items():
+                    _register_table(conn, table, files)
+                df = conn.execute(sql_query).df()
+            finally:
+                conn.close()
+            stage.count("rows", len(df))
+
+        return df, {
+            fg.QUERY_STATUS_KEY: "SUCCEEDED",
+            fg.ENGINE_KEY: fg.ENGINE_LOCAL,
+            SCANNED_BYTES_KEY: plan.scan_bytes,
+        }
+    except Exception:
+        logging.exception("Failed to run query locally")
+        return None
+
+
+def plan_query(sql_query: str) -> QueryPlan:
+    """
+    files of every FG table referred as GLUE_DB_NAME.<table> in the query,
+    pruned by the y/m/d terms and-ed into its outermost where clause
+    """
+    statement = _parse(sql_query)
+    refs = list(_base_tables(statement))
+    assert refs, f"Query reads no {fg.GLUE_DB_NAME} tables"
+
+    top_level = {id(ref) for ref in _joined_tables(statement.get("from_table"))}
+    conjuncts = _conjuncts(statement.get("where_clause"))
+    tables: Dict[str, List[DataFile]] = {}
+    for name in sorted({ref["table_name"] for ref in refs}):
+        files = table_files(name)
+        assert files, f"Table {name} has no data"
+        name_refs = [ref for ref in refs if ref["table_name"] == name]
+        if all(id(ref) in top_level for ref in name_refs):
+            terms = [_ref_terms(ref, conjuncts) for ref in name_refs]
+            files = _prune(files, terms)
+        tables[name] = files
+    return QueryPlan(tables)
+
+
+def table_files(table: str) -> List[DataFile]:
+    """
+    committed files of the FG table, from its manifest,
+    else listing its data prefix
+    """
+    client, app, entity, version = resolve_table(table)
+    manifest = fg.read_manifest(client, app, entity, version)
+    if manifest is not None:
+        entries = manifest_utils.files(manifest)
+        return [_data_file(entry["key"], entry["size"]) for entry in entries]
+
+    years = fg.partition_prefixes(client, app, entity, version)
+    listed = aws_s3.iter_sharded(fg.S3_BUCKET, years)
+    return sorted(_data_file(x.key, x.size) for x in listed)
+
+
+def resolve_table(table: str) -> FgVersion:
+    """FG version whose glue table is named table, refreshing the catalog if unknown"""
+    if table not in _tables:
+        for client, app, entity in catalog.list_feature_groups(refresh=True):
+            for version in catalog.list_versions(client, app, entity):
+                name = fg.table_name(client, app, entity, version)
+                _tables[name] = (client, app, entity, version)
+    assert table in _tables, f"Unknown table {fg.GLUE_DB_NAME}.{table}"
+    return _tables[table]
+
+
+def _connect() -> duckdb.DuckDBPyConnection:
+    try:
+        import duckdb
+    except ImportError as ex:
+        raise ImportError(
+            "Local queries need duckdb, pip install featurestore[local]"
+        ) from ex
+
+    conn = duckdb.connect()
+    conn.execute(f"CREATE SCHEMA {fg.GLUE_DB_NAME}")
+    return conn
+
+
+def _register_table(
+    conn: duckdb.DuckDBPyConnection, table: str, files: Sequence[str]
+) -> None:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    partitioning = ds.partitioning(
+        pa.schema([(col, pa.string()) for col in PARTITION_COLS]), flavor="hive"
+    )
+    base_dir = os.path.commonpath(files)
+    base_dir = base_dir[: base_dir.find("/y=")] if "/y=" in base_dir else base_dir
+    # files written before columns were added to the FG read them as nulls
+    schema = pa.unify_schemas(
+        [pq.read_schema(f) for f in files] + [partitioning.schema]
+    )
+    dataset = ds.dataset(
+        list(files),
+        schema=schema,
+        format="parquet",
+        partitioning=partitioning,
+        partition_base_dir=base_dir,
+    )
+    conn.register(f"__{table}", dataset)
+    conn.execute(f"CREATE VIEW {fg.GLUE_DB_NAME}.{table} AS SELECT * FROM __{table}")
+
+
+def _fetch(plan: QueryPlan) -> Dict[str, List[str]]:
+    """local paths of the planned files, downloading those absent from the cache"""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        return {
+            table: list(pool.map(lambda f: _cached(f.key), files))
+            for table, files in plan.tables.items()
+        }
+
+
+def _cached(key: str) -> str:
+    # committed files are never rewritten in place, so a cached copy stays valid
+    local_path = os.path.join(LOCAL_CACHE_PATH, key)
+    if not os.path.exists(local_path):
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        partial = f"{local_path}.{uuid.uuid4()}.partial"
+        aws_s3.save_as(fg.S3_BUCKET, key, partial)
+        os.replace(partial, local_path)
+    return local_path
+
+
+def _data_file(key: str, size: int) -> DataFile:
+    matches = aws_glue.PARTITION_RE.search("/" + key)
+    assert matches, f"{key} is not within a y/m/d partition"
+    return DataFile(key, size, *matches.groups())
+
+
+def _parse(sql_query: str) -> Ast:
+    conn = _connect()
+    try:
+        serialized = conn.execute("SELECT json_serialize_sql(?)", [sql_query])
+        parsed = json.loads(serialized.fetchone()[0])
+    finally:
+        conn.close()
+    assert not parsed["error"], parsed.get("error_message")
+    assert len(parsed["statements"]) == 1, "Expected a single statement"
+    return parsed["statements"][0]["node"]
+
+
+def _base_tables(node: Any) -> Iterator[Ast]:
+    """every reference to a table of GLUE_DB_NAME, including within sub queries"""
+    if isinstance(node, dict):
+        if (
+            node.get("type") == "BASE_TABLE"
+            and node.get("schema_name", "").lower() == fg.GLUE_DB_NAME
+        ):
+            yield node
+        for value in node.values():
+            yield from _base_tables(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _base_tables(value)
+
+
+def _joined_tables(from_table: Optional[Ast]) -> Iterator[Ast]:
+    """tables joined in the outermost from clause"""
+    if not from_table:
+        return
+    if from_table["type"] == "BASE_TABLE":
+        yield from_table
+    elif from_table["type"] == "JOIN":
+        yield from _joined_tables(from_table["left"])
+        yield from _joined_tables(from_table["right"])
+
+
+def _conjuncts(where: Optional[Ast]) -> List[Ast]:
+    if not where:
+        return []
+    if where.get("type") == "CONJUNCTION_AND":
+        return [term for child in where["children"] for term in _conjuncts(child)]
+    return [where]
+
+
+def _ref_terms(ref: Ast, conjuncts: Sequence[Ast]) -> List[Ast]:
+    """conjuncts over only the partition columns of the table referred by ref"""
+    names = {ref["table_name"].lower(), ref.get("alias", "").lower()} - {""}
+    terms = []
+    for conjunct in conjuncts:
+        columns = list(_column_refs(conjunct))
+        if columns and all(
+            col[-1].lower() in PARTITION_COLS
+            and (len(col) == 1 or col[-2].lower() in names)
+            for col in columns
+        ):
+            terms.append(conjunct)
+    return terms
+
+
+def _column_refs(node: Any) -> Iterator[List[str]]:
+    if isinstance(node, dict):
+        if node.get("class") == "COLUMN_REF":
+            yield node["column_names"]
+            return
+        if "class" in node and node["class"] not in PREDICATE_CLASSES:
+            # eg functions or sub queries, not evaluated during pruning
+            yield ["?"]
+            return
+        for value in node.values():
+            yield from _column_refs(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _column_refs(value)
+
+
+def _prune(files: List[DataFile], ref_terms: Sequence[List[Ast]]) -> List[DataFile]:
+    """
+    files of the partitions satisfying the terms of any of the references,
+    evaluated by DuckDB over a table of the partition columns
+    """
+    if any(not terms for terms in ref_terms):
+        return files
+
+    import pyarrow as pa
+
+    partitions = pa.table(
+        {col: [getattr(f, col) for f in files] for col in PARTITION_COLS}
+    ).append_column("file", pa.array(range(len(files))))
+    selected = set()
+    conn = _connect()
+    try:
+        conn.register("partitions", partitions)
+        for terms in ref_terms:
+            result = conn.execute(_partition_query(conn, terms)).fetchall()
+            selected.update(row[0] for row in result)
+    finally:
+        conn.close()
+    return [f for i, f in enumerate(files) if i in selected]
+
+
+def _partition_query(conn: duckdb.DuckDBPyConnection, terms: Sequence[Ast]) -> str:
+    template = conn.execute(
+        "SELECT json_serialize_sql('SELECT file FROM partitions WHERE true')"
+    ).fetchone()[0]
+    parsed = json.loads(template)
+    children = [_unqualified(term) for term in terms]
+    where: Ast = children[0]
+    if len(children) > 1:
+        where = {
+            "class": "CONJUNCTION",
+            "type": "CONJUNCTION_AND",
+            "alias": "",
+            "query_location": 0,
+            "children": children,
+        }
+    parsed["statements"][0]["node"]["where_clause"] = where
+    return conn.execute(
+        "SELECT json_deserialize_sql(?::JSON)", [json.dumps(parsed)]
+    ).fetchone()[0]
+
+
+def _unqualified(node: Any) -> Any:
+    if isinstance(node, dict):
+        if node.get("class") == "COLUMN_REF":
+            return {**node, "column_names": node["column_names"][-1:]}
+        return {key: _unqualified(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_unqualified(value) for value in node]
+    return node
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+from datetime import date, datetime
+from decimal import Decimal
+from os.path import getsize
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Sequence
+
+from . import bloom
+
+if TYPE_CHECKING:
+    import pyarrow.parquet as pq
+
+# manifest of a FG version, maintained by the lambda on every upload commit
+# {
+#   "partitions": {
+#     "y=2019/m=07/d=13": {
+#       "files": [
+#         {"key": s3 key, "size": bytes, "etag": etag, "rows": count,
+#          "time_min": epoch, "time_max": epoch,
+#          "columns": {col: {"min": v, "max": v, "nulls": count}},
+#          "bucket": hash bucket of its entity keys,
+#          "bloom": {"key": s3 key, "size": bytes} of the filter of its keys},
+#          the last two only for FGs with an entity key,
+#          the filter is a sidecar object, fetched only for candidate files
+#       ],
+#       "hash": content hash of the partition rows, see fg.upload_fg
+#     }
+#   }
+# }
+Manifest = Dict[str, Any]
+FileEntry = Dict[str, Any]
+
+PARTITIONS_KEY: str = "partitions"
+FILES_KEY: str = "files"
+HASH_KEY: str = "hash"
+BLOOM_SUFFIX: str = ".bloom"
+
+
+def file_entry(
+    key: str,
+    local_path: str,
+    size: int,
+    time_col: str,
+    entity_key: Optional[str] = None,
+    bucket: Optional[int] = None,
+) -> FileEntry:
+    """
+    Manifest entry of the local parquet file to be committed at the s3 key,
+    statistics come from its footer, so only top level primitive columns
+    carry min and max.
+    For files of an entity key bucket, the bloom filter of their keys is written
+    to 'local_bloom_path', to be committed at the 'bloom_key' the entry refers to.
+    """
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_metadata(local_path)
+    columns = _column_stats(metadata)
+    time_stats = columns.get(time_col, {})
+    entry = {
+        "key": key,
+        "size": size,
+        "rows": metadata.num_rows,
+        "time_min": time_stats.get("min"),
+        "time_max": time_stats.get("max"),
+        "columns": columns,
+    }
+    if entity_key is not None:
+        keys = pq.read_table(local_path, columns=[entity_key]).column(0)
+        bloom_path = local_bloom_path(local_path)
+        with open(bloom_path, "wb") as f:
+            f.write(bloom.BloomFilter.of(keys.to_pylist()).to_bytes())
+        entry["bucket"] = bucket
+        entry["bloom"] = {"key": bloom_key(key), "size": getsize(bloom_path)}
+    return entry
+
+
+def bloom_key(key: str) -> str:
+    """
+    key of the bloom filter sidecar of the file at key, in the same folder,
+    its '_' prefix hides it from athena, as from hive
+    """
+    folder, _, name = key.rpartition("/")
+    return f"{folder}/_{name}{BLOOM_SUFFIX}" if folder else f"_{name}{BLOOM_SUFFIX}"
+
+
+def local_bloom_path(local_path: str) -> str:
+    return local_path + BLOOM_SUFFIX
+
+
+def files(
+    manifest: Manifest, partitions: Optional[Sequence[str]] = None
+) -> List[FileEntry]:
+    """entries of all files of the partitions, all partitions if absent"""
+    found = manifest.get(PARTITIONS_KEY, {})
+    names = sorted(found) if partitions is None else partitions
+    return [entry for name in names for entry in found.get(name, {}).get(FILES_KEY, [])]
+
+
+def prune_by_time(
+    entries: Sequence[FileEntry], start: int, end: int
+) -> List[FileEntry]:
+    """files whose time_col range may intersect [start, end), in time_col_unit"""
+    return [entry for entry in entries if _may_overlap(entry, start, end)]
+
+
+def bloom_candidates(
+    entries: Sequence[FileEntry],
+    keys: Sequence[Any],
+    entity_key: str,
+    num_buckets: int,
+) -> List[str]:
+    """
+    keys of the bloom filters worth fetching for 'prune_by_keys',
+    of the files which may hold any of the entity keys by their bucket and key range
+    """
+    buckets = _buckets(keys, num_buckets)
+    return [
+        entry["bloom"]["key"]
+        for entry in entries
+        if "bloom" in entry and _candidates(entry, keys, buckets, entity_key)
+    ]
+
+
+def prune_by_keys(
+    entries: Sequence[FileEntry],
+    keys: Sequence[Any],
+    entity_key: str,
+    num_buckets: int,
+    blooms: Optional[Mapping[str, bloom.BloomFilter]] = None,
+) -> List[FileEntry]:
+    """
+    files which may hold any of the entity keys,
+    going by their bucket, key range and bloom filter,
+    where present in blooms, by bloom key, see 'bloom_candidates'
+    """
+    buckets = _buckets(keys, num_buckets)
+    kept = []
+    for entry in entries:
+        candidates = _candidates(entry, keys, buckets, entity_key)
+        keys_bloom = (blooms or {}).get(entry.get("bloom", {}).get("key"))
+        if keys_bloom is not None:
+            candidates = [k for k in candidates if keys_bloom.might_contain(k)]
+        if candidates:
+            kept.append(entry)
+    return kept
+
+
+def total_bytes(entries: Sequence[FileEntry]) -> int:
+    return sum(entry["size"] for entry in entries)
+
+
+def _buckets(keys: Sequence[Any], num_buckets: int) -> Dict[int, List[Any]]:
+    buckets: Dict[int, List[Any]] = {}
+    for key in keys:
+        buckets.setdefault(bloom.bucket(key, num_buckets), []).append(key)
+    return buckets
+
+
+def _candidates(
+    entry: FileEntry,
+    keys: Sequence[Any],
+    buckets: Dict[int, List[Any]],
+    entity_key: str,
+) -> List[Any]:
+    """the keys the file may hold by its bucket and key range"""
+    candidates = buckets.get(entry["bucket"], []) if "bucket" in entry else keys
+    key_stats = entry.get("columns", {}).get(entity_key, {})
+    return [k for k in candidates if _may_hold(key_stats, k)]
+
+
+def _may_overlap(entry: FileEntry, start: int, end: int) -> bool:
+    time_min, time_max = entry.get("time_min"), entry.get("time_max")
+    if time_min is None or time_max is None:
+        return True
+    return time_min < end and time_max >= start
+
+
+def _may_hold(stats: Dict[str, Any], key: Any) -> bool:
+    low, high = stats.get("min"), stats.get("max")
+    if low is None or high is None:
+        return True
+    try:
+        return low <= key <= high
+    except TypeError:
+        # eg int keys looked up in a string column
+        return True
+
+
+def _column_stats(metadata: pq.FileMetaData) -> Dict[str, Dict[str, Any]]:
+    stats: Dict[str, Dict[str, Any]] = {}
+    for group in range(metadata.num_row_groups):
+        row_group = metadata.row_group(group)
+        for i in range(row_group.num_columns):
+            chunk = row_group.column(i)
+            name = chunk.path_in_schema
+            if "." in name:
+                # nested column leaves
+                continue
+            _merge_chunk_stats(stats.setdefault(name, {"nulls": 0}), chunk.statistics)
+    # merged as parquet typed values, eg decimals, before rendering them to json
+    for col in stats.values():
+        for bound in ["min", "max"]:
+            if bound in col:
+                col[bound] = _json_value(col[bound])
+    return stats
+
+
+def _merge_chunk_stats(col: Dict[str, Any], statistics: Any) -> None:
+    if statistics is None:
+        col["nulls"] = None
+        return
+
+    if col["nulls"] is not None and statistics.has_null_count:
+        col["nulls"] += statistics.null_count
+    if statistics.has_min_max:
+        low, high = statistics.min, statistics.max
+        col["min"] = low if col.get("min") is None else min(col["min"], low)
+        col["max"] = high if col.get("max") is None else max(col["max"], high)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, Decimal):
+        # exact, unlike a float
+        return str(value)
+    return value
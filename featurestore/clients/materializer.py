@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+)
+
+from . import (
+    aws_glue,
+    aws_s3,
+    fg,
+    manifest_utils,
+    online_store,
+    parquet_utils,
+    schema_utils,
+)
+
+if TYPE_CHECKING:
+    from pandas import DataFrame as Pandas_df
+
+WATERMARK_DIR: str = os.environ.get(
+    "FEATURESTORE_WATERMARK_DIR", os.path.expanduser("~/.featurestore/watermarks")
+)
+
+MAX_WORKERS: int = 4
+MEMORY_BUDGET_BYTES: int = 512 * 1024 * 1024
+# in memory pandas size relative to the compressed parquet on s3
+PARQUET_EXPANSION: int = 4
+
+# partition folder 'y=%Y/m=%m/d=%d' -> {file key -> etag}
+Watermark = Dict[str, Dict[str, str]]
+# (partition folder, [(file key, size, etag)])
+PartitionFiles = Tuple[str, Sequence[Tuple[str, int, str]]]
+Sink = Callable[["Pandas_df"], None]
+
+
+def materialize(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    key_col: str,
+    sink: Sink,
+    consumer: str,
+    state_dir: str = WATERMARK_DIR,
+    max_workers: int = MAX_WORKERS,
+    memory_budget_bytes: int = MEMORY_BUDGET_BYTES,
+) -> int:
+    """
+    Feeds the sink the latest row per key_col of every committed partition file
+    which is new or changed since the previous run of this consumer.
+    Partitions are processed in parallel, while the estimated memory of those in
+    flight stays within memory_budget_bytes.
+    The consumer's watermark is persisted after each partition is sunk,
+    so a crashed run resumes from the partitions left pending.
+    Returns the number of partitions sunk.
+    """
+    schema = fg.read_schema(client, app, entity, version)
+    time_col = schema[schema_utils.SCHEMA_TIME_COL]
+    path = _watermark_path(state_dir, client, app, entity, version, consumer)
+    watermark = _load_watermark(path)
+    committed = _committed_files(client, app, entity, version)
+    pending = _pending_partitions(watermark, committed)
+    reserve = _memory_gate(memory_budget_bytes)
+    lock = threading.Lock()
+
+    def run(item: PartitionFiles) -> None:
+        partition, files = item
+        with reserve(sum(size for _, size, _ in files) * PARQUET_EXPANSION):
+            df = parquet_utils.read_keys(fg.S3_BUCKET, [key for key, _, _ in files])
+            sink(latest_per_key(df, key_col, time_col))
+
+        with lock:
+            watermark.setdefault(partition, {}).update({k: e for k, _, e in files})
+            _save_watermark(path, watermark)
+        logging.info(f"Materialized {len(files)} files of {partition} for {consumer}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(run, pending))
+
+    return len(pending)
+
+
+def online_sink(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    key_col: str,
+    path: str = online_store.ONLINE_STORE_PATH,
+) -> Sink:
+    """sink upserting into the online store at path"""
+    schema = fg.read_schema(client, app, entity, version)
+    name = online_store.fg_ref(client, app, entity, version)
+
+    def sink(df: Pandas_df) -> None:
+        online_store.write_features(
+            online_store.connect(path),
+            name,
+            key_col,
+            schema[schema_utils.SCHEMA_TIME_COL],
+            schema[schema_utils.SCHEMA_TIME_UNIT],
+            df,
+        )
+
+    return sink
+
+
+def latest_per_key(pandas_df: Pandas_df, key_col: str, time_col: str) -> Pandas_df:
+    latest = pandas_df.sort_values(time_col, kind="stable")
+    return latest.drop_duplicates(key_col, keep="last").reset_index(drop=True)
+
+
+def _committed_files(
+    client: str, app: str, entity: str, version: str
+) -> Dict[str, List[Tuple[str, int, str]]]:
+    manifest = fg.read_manifest(client, app, entity, version)
+    if manifest is not None:
+        return {
+            partition: [
+                (entry["key"], entry["size"], entry["etag"])
+                for entry in manifest_utils.files(manifest, [partition])
+            ]
+            for partition in manifest[manifest_utils.PARTITIONS_KEY]
+        }
+
+    # files reach the prod prefix only through the lambda upload commit
+    files: Dict[str, List[Tuple[str, int, str]]] = {}
+    # one listing per year folder, concurrently
+    years = fg.partition_prefixes(client, app, entity, version)
+    for key, size, etag, _ in aws_s3.iter_sharded(fg.S3_BUCKET, years):
+        matches = aws_glue.PARTITION_RE.search("/" + key)
+        if matches:
+            partition = matches.group(0).lstrip("/")
+            files.setdefault(partition, []).append((key, size, etag))
+    return files
+
+
+def _pending_partitions(
+    watermark: Watermark, committed: Dict[str, List[Tuple[str, int, str]]]
+) -> List[PartitionFiles]:
+    pending: List[PartitionFiles] = []
+    for partition in sorted(committed):
+        seen = watermark.get(partition, {})
+        fresh = [f for f in committed[partition] if seen.get(f[0]) != f[2]]
+        if fresh:
+            pending.append((partition, fresh))
+    return pending
+
+
+def _watermark_path(
+    state_dir: str, client: str, app: str, entity: str, version: str, consumer: str
+) -> str:
+    name = online_store.fg_ref(client, app, entity, version)
+    return os.path.join(state_dir, f"{name}.{consumer}.json")
+
+
+def _load_watermark(path: str) -> Watermark:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_watermark(path: str, watermark: Watermark) -> None:
+    # atomic rename, a crash leaves either the old or the new watermark
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, path)
+
+
+def _memory_gate(budget_bytes: int) -> Callable[[int], ContextManager[None]]:
+    """
+    reservations block until their bytes fit within the budget,
+    one larger than the whole budget waits to run alone
+    """
+    cond = threading.Condition()
+    used = [0]
+
+    @contextmanager
+    def reserve(size: int) -> Iterator[None]:
+        size = min(size, budget_bytes)
+        with cond:
+            cond.wait_for(lambda: used[0] + size <= budget_bytes)
+            used[0] += size
+        try:
+            yield
+        finally:
+            with cond:
+                used[0] -= size
+                cond.notify_all()
+
+    return reserve
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Sequence
+
+from . import codec, fg, ist_utils, schema_utils, str_utils
+
+if TYPE_CHECKING:
+    from pandas import DataFrame as Pandas_df
+
+ONLINE_STORE_PATH: str = os.environ.get(
+    "FEATURESTORE_ONLINE_PATH", "/tmp/featurestore-online.db"
+)
+
+# sqlite caps the host parameters per statement
+LOOKUP_BATCH_SIZE: int = 500
+MMAP_SIZE_BYTES: int = 1024 * 1024 * 1024
+BUSY_TIMEOUT_MS: int = 30000
+# the stored key of each row, while writing
+KEY_COL: str = "__entity_key__"
+
+DDL = [
+    "CREATE TABLE IF NOT EXISTS feature_groups ("
+    " fg TEXT PRIMARY KEY, key_col TEXT NOT NULL, columns BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS features ("
+    " fg TEXT NOT NULL, entity_key TEXT NOT NULL, value BLOB NOT NULL,"
+    " event_ms INTEGER NOT NULL, written_ms INTEGER NOT NULL,"
+    " PRIMARY KEY (fg, entity_key)) WITHOUT ROWID",
+]
+
+# an older event never replaces a newer one
+UPSERT = (
+    "INSERT INTO features (fg, entity_key, value, event_ms, written_ms)"
+    " VALUES (?, ?, ?, ?, ?)"
+    " ON CONFLICT (fg, entity_key) DO UPDATE SET"
+    " value = excluded.value, event_ms = excluded.event_ms,"
+    " written_ms = excluded.written_ms"
+    " WHERE excluded.event_ms >= features.event_ms"
+)
+
+
+class OnlineRow(NamedTuple):
+    """
+    latest feature values of an entity,
+    event_ms is the epoch millis of its time_col,
+    written_ms the epoch millis when it was written to the online store
+    """
+
+    values: Dict[str, Any]
+    event_ms: int
+    written_ms: int
+
+
+_local = threading.local()
+
+
+def fg_ref(client: str, app: str, entity: str, version: str) -> str:
+    """name of a FG in the online store, same as its Glue table"""
+    return str_utils.sanitise(f"{client}_{app}_{entity}_{version}")
+
+
+def entity_key(key: Any) -> str:
+    """
+    The key as stored, ints and strs only, so a key matches however it was typed:
+    numpy scalars as their python value, and integral floats as ints,
+    like the keys of an int column with nulls, which pandas reads as floats.
+    """
+    if hasattr(key, "item"):
+        # numpy scalar
+        key = key.item()
+    if isinstance(key, float) and key.is_integer():
+        key = int(key)
+    if isinstance(key, bool) or not isinstance(key, (int, str)):
+        raise ValueError(f"Entity key {key!r} must be an int or str")
+    return str(key)
+
+
+def connect(path: str = ONLINE_STORE_PATH) -> sqlite3.Connection:
+    """
+    Connection to the online store at path, cached per thread,
+    the db is created if absent, and runs in WAL mode
+    so that readers never block on the materializing writer.
+    """
+    connections = _local.__dict__.setdefault("connections", {})
+    if path not in connections:
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+        # concurrent materializing writers queue up instead of failing
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        for ddl in DDL:
+            conn.execute(ddl)
+        connections[path] = conn
+    return connections[path]
+
+
+def write_features(
+    conn: sqlite3.Connection,
+    fg_name: str,
+    key_col: str,
+    time_col: str,
+    time_col_unit: str,
+    pandas_df: Pandas_df,
+) -> int:
+    """
+    Upserts the latest row per key_col of the pandas Df, keyed by 'entity_key',
+    rows older than those already present are ignored,
+    as are rows without a key.
+    Columns may only ever be appended to those of earlier writes.
+    Returns the number of distinct keys offered.
+    """
+    columns = [col for col in pandas_df.columns if col != key_col]
+    keyed = pandas_df[pandas_df[key_col].notna()]
+    if len(keyed) < len(pandas_df):
+        logging.warning(f"Skipped {len(pandas_df) - len(keyed)} rows without a key")
+    keys = keyed[key_col].map(entity_key)
+    latest = keyed.assign(**{KEY_COL: keys}).sort_values(time_col)
+    latest = latest.drop_duplicates(KEY_COL, keep="last")
+    events = latest[time_col].map(lambda t: ist_utils.to_epoch_millis(t, time_col_unit))
+    written_ms = ist_utils.current_epoch_millis()
+    rows = [
+        (fg_name, key, codec.encode(list(values)), event_ms, written_ms)
+        for (key, *values), event_ms in zip(
+            latest[[KEY_COL] + columns].itertuples(index=False), events
+        )
+    ]
+
+    with _transaction(conn):
+        _register_columns(conn, fg_name, key_col, columns)
+        conn.executemany(UPSERT, rows)
+
+    logging.info(f"Wrote {len(rows)} keys of {fg_name} to the online store")
+    return len(rows)
+
+
+def get_online_features(
+    fg_refs: Sequence[str], entity_keys: Sequence[Any], path: str = ONLINE_STORE_PATH
+) -> Dict[str, List[Optional[OnlineRow]]]:
+    """
+    Batch lookup of the latest features of each entity key in every fg ref,
+    refs are as named by 'fg_ref'.
+    Keys match those written with the same 'entity_key', eg 1 matches 1.0.
+    Returns, per fg ref, rows aligned with entity_keys, None for absent keys.
+    """
+    conn = connect(path)
+    keys = [entity_key(key) for key in entity_keys]
+    return {ref: _lookup(conn, ref, keys) for ref in fg_refs}
+
+
+def materialize_online(
+    client: str,
+    app: str,
+    entity: str,
+    version: str,
+    key_col: str,
+    start: fg.Moment,
+    end: fg.Moment,
+    path: str = ONLINE_STORE_PATH,
+) -> int:
+    """
+    Loads the latest row per key_col, within [start, end), of the offline FG
+    into the online store at path.
+    Returns the number of distinct keys offered.
+    """
+    result = fg.read_features(client, app, entity, version, start, end)
+    if result is None or result[0] is None:
+        raise ValueError(f"Failed to read {client}/{app}/{entity}/{version}")
+
+    schema = fg.read_schema(client, app, entity, version)
+    return write_features(
+        connect(path),
+        fg_ref(client, app, entity, version),
+        key_col,
+        schema[schema_utils.SCHEMA_TIME_COL],
+        schema[schema_utils.SCHEMA_TIME_UNIT],
+        result[0],
+    )
+
+
+def _lookup(
+    conn: sqlite3.Connection, fg_name: str, keys: Sequence[str]
+) -> List[Optional[OnlineRow]]:
+    columns = _columns(conn, fg_name)
+    found: Dict[str, OnlineRow] = {}
+    for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        batch = keys[i : i + LOOKUP_BATCH_SIZE]  # noqa: E203
+        marks = ", ".join("?" * len(batch))
+        cursor = conn.execute(
+            "SELECT entity_key, value, event_ms, written_ms FROM features"
+            f" WHERE fg = ? AND entity_key IN ({marks})",
+            [fg_name] + batch,
+        )
+        for key, value, event_ms, written_ms in cursor:
+            found[key] = OnlineRow(_decode(columns, value), event_ms, written_ms)
+
+    return [found.get(key) for key in keys]
+
+
+def _decode(columns: Sequence[str], value: bytes) -> Dict[str, Any]:
+    values = codec.decode(value)
+    # rows written before columns were appended lack the new ones
+    values.extend([None] * (len(columns) - len(values)))
+    return dict(zip(columns, values))
+
+
+def _columns(conn: sqlite3.Connection, fg_name: str) -> Sequence[str]:
+    row = conn.execute(
+        "SELECT columns FROM feature_groups WHERE fg = ?", [fg_name]
+    ).fetchone()
+    return codec.decode(row[0]) if row else []
+
+
+def _register_columns(
+    conn: sqlite3.Connection, fg_name: str, key_col: str, columns: Sequence[str]
+) -> None:
+    row = conn.execute(
+        "SELECT columns FROM feature_groups WHERE fg = ?", [fg_name]
+    ).fetchone()
+    if row:
+        existing = codec.decode(row[0])
+        assert (
+            existing == list(columns)[: len(existing)]
+        ), f"Columns of {fg_name} changed from {existing} to {columns}"
+
+    conn.execute(
+        "INSERT OR REPLACE INTO feature_groups (fg, key_col, columns) VALUES (?, ?, ?)",
+        [fg_name, key_col, codec.encode(list(columns))],
+    )
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import functools
+import operator
+import os
+import struct
+import tempfile
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence
+
+from . import aws_s3
+from .partition_utils import FILTER_OPS, Filter
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pandas import DataFrame as Pandas_df
+
+FOOTER_READ_BYTES: int = 64 * 1024
+PARQUET_MAGIC: bytes = b"PAR1"
+
+COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def read_keys(
+    bucket: str,
+    keys: Sequence[str],
+    columns: Sequence[str] = None,
+    filters: Sequence[Filter] = None,
+) -> Pandas_df:
+    """
+    Downloads the parquet files at keys and loads them into a single pandas Df,
+    projecting columns, all if absent,
+    and keeping only rows matching all the (column, op, value) filters,
+    a None value matching the null rows, as 'partition_utils.filter_predicate'.
+    Columns added to the FG after a file was written are null in its rows.
+    """
+    from pandas import DataFrame, concat
+
+    frames: List[Pandas_df] = [_read_key(bucket, key, columns, filters) for key in keys]
+    if not frames:
+        return DataFrame(columns=columns)
+    return concat(frames, ignore_index=True)
+
+
+def _read_key(
+    bucket: str, key: str, columns: Sequence[str], filters: Sequence[Filter]
+) -> Pandas_df:
+    path = download_key(bucket, key)
+    try:
+        return _read_file(path, columns, filters)
+    finally:
+        os.remove(path)
+
+
+def _read_file(
+    path: str, columns: Sequence[str] = None, filters: Sequence[Filter] = None
+) -> Pandas_df:
+    import pyarrow.parquet as pq
+    from pandas import DataFrame, read_parquet
+
+    present = set(pq.read_schema(path).names)
+    missing = [item for item in filters or [] if item[0] not in present]
+    # a column added after the file was written is null in all its rows
+    if not all(_null_matches(op, value) for _, op, value in missing):
+        return DataFrame(columns=columns)
+
+    df = read_parquet(
+        path,
+        columns=None if columns is None else [c for c in columns if c in present],
+        filters=_expression([item for item in filters or [] if item[0] in present]),
+    )
+    return df if columns is None else df.reindex(columns=list(columns))
+
+
+def _expression(filters: Sequence[Filter]) -> Optional[pc.Expression]:
+    """the filters and-ed into a pyarrow expression, None if there are none"""
+    import pyarrow.compute as pc
+
+    terms = [_term(pc.field(col), op, value) for col, op, value in filters]
+    return functools.reduce(operator.and_, terms) if terms else None
+
+
+def _term(field: pc.Expression, op: str, value: Any) -> pc.Expression:
+    import pyarrow.compute as pc
+
+    assert op in FILTER_OPS, f"unsupported filter op {op}"
+    if op in {"in", "not in"}:
+        values = [v for v in value if v is not None]
+        matched = field.isin(values) if values else pc.scalar(False)
+        if len(values) < len(value):
+            matched = matched | field.is_null()
+        # as in sql, null is never 'not in' a list
+        return matched if op == "in" else ~matched & field.is_valid()
+    if value is None:
+        assert op in {"=", "!="}, f"unsupported filter op {op} for None"
+        return field.is_null() if op == "=" else field.is_valid()
+    # null compares to no value, as in sql
+    return COMPARISONS[op](field, value)
+
+
+def _null_matches(op: str, value: Any) -> bool:
+    """if a null row matches the filter"""
+    if op == "in":
+        return None in value
+    return op == "=" and value is None
+
+
+def download_key(bucket: str, key: str) -> str:
+    """
+    downloads the s3 object to a new local file, unique to the call,
+    so concurrent reads of a key never share one, the caller removes it
+    :param bucket:
+    :param key:
+    :return: local file path
+    """
+    fd, tmp_file = tempfile.mkstemp(suffix="-" + os.path.basename(key))
+    os.close(fd)
+    try:
+        aws_s3.save_as(bucket, key, tmp_file)
+    except Exception:
+        os.remove(tmp_file)
+        raise
+    return tmp_file
+
+
+def read_schema(bucket: str, key: str) -> pa.Schema:
+    """
+    arrow schema from the footer of the parquet file,
+    fetched with ranged gets of the file tail, without downloading the file
+    :param bucket:
+    :param key:
+    :return:
+    """
+    tail, size = aws_s3.read_range(bucket, key, f"bytes=-{FOOTER_READ_BYTES}")
+    assert tail[-4:] == PARQUET_MAGIC, f"{key} is not a parquet file"
+
+    # file ends with the footer, its 4 byte little endian length and the magic
+    footer_len = struct.unpack("<I", tail[-8:-4])[0]
+    needed = footer_len + 8
+    assert needed + len(PARQUET_MAGIC) <= size, f"{key} has a corrupt footer"
+    if needed > len(tail):
+        head_range = f"bytes={size - needed}-{size - len(tail) - 1}"
+        head, _ = aws_s3.read_range(bucket, key, head_range)
+        tail = head + tail
+
+    return footer_schema(tail[-needed:])
+
+
+def footer_schema(footer: bytes) -> pa.Schema:
+    """arrow schema of the parquet footer, including its length and magic suffix"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    return pq.read_schema(pa.BufferReader(PARQUET_MAGIC + footer))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+from datetime import date, timedelta
+from typing import Any, List, Sequence, Tuple
+
+from . import ist_utils
+
+Filter = Tuple[str, str, Any]
+
+FILTER_OPS = {"=", "!=", "<", "<=", ">", ">=", "in", "not in"}
+
+
+def partition_days(start_secs: int, end_secs: int) -> Sequence[date]:
+    """
+    IST days touched by the half open epoch range [start_secs, end_secs)
+    :param start_secs:
+    :param end_secs:
+    :return: days in ascending order
+    """
+    assert start_secs < end_secs, f"empty time range [{start_secs}, {end_secs})"
+
+    first = ist_utils.to_datetime(start_secs).date()
+    last = ist_utils.to_datetime(end_secs - 1).date()
+    count = (last - first).days + 1
+    return [first + timedelta(days=i) for i in range(count)]
+
+
+def partition_suffixes(start_secs: int, end_secs: int) -> Sequence[str]:
+    """
+    's3' partition folders in 'y=%Y/m=%m/d=%d' format,
+    covering the epoch range [start_secs, end_secs)
+    """
+    days = partition_days(start_secs, end_secs)
+    return [day.strftime("y=%Y/m=%m/d=%d") for day in days]
+
+
+def partition_predicate(start_secs: int, end_secs: int, alias: str = "") -> str:
+    """
+    Minimal sql predicate over the y/m/d partition columns,
+    selecting only the partitions covering the epoch range [start_secs, end_secs).
+    Fully covered years and months collapse into a single term.
+    The columns are qualified by the table alias, if supplied.
+    """
+    days = partition_days(start_secs, end_secs)
+    q = _qualifier(alias)
+    terms: List[str] = []
+    for year in range(days[0].year, days[-1].year + 1):
+        year_days = [day for day in days if day.year == year]
+        if len(year_days) == _days_in_year(year):
+            terms.append(f"{q}y = '{year:04d}'")
+        else:
+            terms.extend(_month_terms(year, year_days, q))
+
+    return terms[0] if len(terms) == 1 else "(" + " OR ".join(terms) + ")"
+
+
+def partition_upto_predicate(end_secs: int, alias: str = "") -> str:
+    """
+    Sql predicate over the y/m/d partition columns,
+    selecting all the partitions up to the one containing end_secs - 1,
+    the columns are qualified by the table alias, if supplied
+    """
+    last = ist_utils.to_datetime(end_secs - 1).date()
+    y, m, d = f"{last.year:04d}", f"{last.month:02d}", f"{last.day:02d}"
+    q = _qualifier(alias)
+    return (
+        f"({q}y < '{y}' OR ({q}y = '{y}' AND {q}m < '{m}')"
+        f" OR ({q}y = '{y}' AND {q}m = '{m}' AND {q}d <= '{d}'))"
+    )
+
+
+def filter_predicate(filters: Sequence[Filter]) -> str:
+    """
+    Renders (column, op, value) tuples into a conjunctive sql predicate,
+    'in' and 'not in' expect a sequence of values.
+    A None value, or one in the sequence, matches the null rows as IS NULL.
+    """
+    return " AND ".join(map(_filter_term, filters))
+
+
+def sql_literal(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+
+    escaped = str(value).replace("'", "''")
+    return f"'{escaped}'"
+
+
+def _filter_term(item: Filter) -> str:
+    col, op, value = item
+    assert op in FILTER_OPS, f"unsupported filter op {op}"
+
+    if op in {"in", "not in"}:
+        return _in_term(col, op, value)
+    if value is None:
+        # null never compares equal, a None value selects the null rows
+        assert op in {"=", "!="}, f"unsupported filter op {op} for None"
+        return f"{col} IS NULL" if op == "=" else f"{col} IS NOT NULL"
+
+    return f"{col} {op} {sql_literal(value)}"
+
+
+def _in_term(col: str, op: str, value: Sequence[Any]) -> str:
+    values = [v for v in value if v is not None]
+    term = f"{col} {op.upper()} ({', '.join(map(sql_literal, values))})"
+    if len(values) == len(value):
+        return term
+    if op == "in":
+        return f"({term} OR {col} IS NULL)" if values else f"{col} IS NULL"
+    return f"({term} AND {col} IS NOT NULL)" if values else f"{col} IS NOT NULL"
+
+
+def _qualifier(alias: str) -> str:
+    return f"{alias}." if alias else ""
+
+
+def _month_terms(year: int, year_days: Sequence[date], q: str) -> Sequence[str]:
+    full_months: List[int] = []
+    terms: List[str] = []
+    for month in sorted({day.month for day in year_days}):
+        month_days = [day.day for day in year_days if day.month == month]
+        if len(month_days) == calendar.monthrange(year, month)[1]:
+            full_months.append(month)
+        else:
+            terms.append(_day_range_term(year, month, month_days[0], month_days[-1], q))
+
+    if full_months:
+        terms.insert(0, _month_range_term(year, full_months[0], full_months[-1], q))
+    return terms
+
+
+def _month_range_term(year: int, first: int, last: int, q: str) -> str:
+    if first == last:
+        return f"({q}y = '{year:04d}' AND {q}m = '{first:02d}')"
+    return f"({q}y = '{year:04d}' AND {q}m BETWEEN '{first:02d}' AND '{last:02d}')"
+
+
+def _day_range_term(year: int, month: int, first: int, last: int, q: str) -> str:
+    prefix = f"{q}y = '{year:04d}' AND {q}m = '{month:02d}'"
+    if first == last:
+        return f"({prefix} AND {q}d = '{first:02d}')"
+    return f"({prefix} AND {q}d BETWEEN '{first:02d}' AND '{last:02d}')"
+
+
+def _days_in_year(year: int) -> int:
+    return 366 if calendar.isleap(year) else 365
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sqlite3
+from contextlib import closing
+from hashlib import sha1
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from . import ist_utils
+
+QUERY_HISTORY_PATH: str = os.environ.get(
+    "FEATURESTORE_QUERY_HISTORY", "/tmp/featurestore-queries.db"
+)
+
+# athena bills scanned bytes per TB, rounded up to 10MB per query
+ATHENA_USD_PER_TB: float = 5.0
+ATHENA_MIN_BILLED_BYTES: int = 10 * 1024 * 1024
+
+DDL = (
+    "CREATE TABLE IF NOT EXISTS queries ("
+    " query_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, query TEXT NOT NULL,"
+    " state TEXT, scanned_bytes INTEGER NOT NULL, engine_ms INTEGER NOT NULL,"
+    " queue_ms INTEGER NOT NULL, unpruned_tables TEXT NOT NULL,"
+    " at_ms INTEGER NOT NULL)"
+)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+# a partition predicate, and the table or alias qualifying its column, if any
+_PARTITION_RE = re.compile(
+    r"(?:\b(\w+)\s*\.\s*|(?<![\w.]))\"?\b[ymd]\"?\s*(?:=|<|>|!=|<>|\bin\b|\bbetween\b)",
+    re.I,
+)
+# a table read, as [db.]table [[AS] alias]
+_TABLE_RE = re.compile(
+    r"\b(?:from|join)\s+\"?(\w+)\"?(?:\s*\.\s*\"?(\w+)\"?)?(?:\s+(?:as\s+)?(\w+))?",
+    re.I,
+)
+_CTE_RE = re.compile(r"\b(\w+)\s+as\s*\(", re.I)
+_SUBQUERY_RE = re.compile(r"\s*(?:select|with)\b", re.I)
+# words which may follow a table, but are not its alias
+_CLAUSE_WORDS = frozenset(
+    {
+        "where",
+        "on",
+        "using",
+        "join",
+        "inner",
+        "left",
+        "right",
+        "full",
+        "outer",
+        "cross",
+        "natural",
+        "group",
+        "order",
+        "limit",
+        "having",
+        "union",
+        "intersect",
+        "except",
+        "window",
+        "tablesample",
+    }
+)
+
+
+class FingerprintStats(NamedTuple):
+    """scans of all the recorded runs of queries sharing a fingerprint"""
+
+    fingerprint: str
+    query: str
+    runs: int
+    scanned_bytes: int
+    max_scanned_bytes: int
+    avg_engine_ms: float
+    cost_usd: float
+
+
+class UnprunedQuery(NamedTuple):
+    """a query over FG tables without any y/m/d partition predicate"""
+
+    query_id: str
+    query: str
+    tables: List[str]
+    scanned_bytes: int
+
+
+def fingerprint(query: str) -> str:
+    """
+    id of the query shape, the same for queries differing only in
+    literals, in list lengths, whitespace or case
+    """
+    return sha1(normalise(query).encode("utf-8")).hexdigest()[:16]
+
+
+def normalise(query: str) -> str:
+    shape = _STRING_RE.sub("?", query)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _LIST_RE.sub("(?)", shape)
+    return _SPACE_RE.sub(" ", shape).strip().rstrip(";").lower()
+
+
+def unpruned_tables(query: str, db: str) -> List[str]:
+    """
+    FG tables of db read by the query without a predicate on their
+    y/m/d partition columns, ie which athena scans whole.
+    Unqualified tables are taken to be in db, the query's default database,
+    other than the query's own CTEs.
+    A predicate prunes the table its column is qualified by, by name or alias,
+    an unqualified one prunes the table of its (sub)query, if it reads only one.
+    """
+    shape = _STRING_RE.sub("?", query)
+    ctes = {name.lower() for name in _CTE_RE.findall(shape)}
+    scopes = _scopes(shape)
+
+    # table -> its names in predicates, ie itself and its aliases
+    tables: Dict[str, Set[str]] = {}
+    reads: Dict[int, List[str]] = {}
+    for match in _TABLE_RE.finditer(shape):
+        first, second, alias = match.groups()
+        table_db, table = (first, second) if second else (db, first)
+        if not second and first.lower() in ctes:
+            continue
+        reads.setdefault(scopes[match.start()], []).append(table)
+        if table_db.lower() != db.lower():
+            continue
+        names = tables.setdefault(table, {table.lower()})
+        if alias and alias.lower() not in _CLAUSE_WORDS:
+            names.add(alias.lower())
+
+    pruned = set()
+    for match in _PARTITION_RE.finditer(shape):
+        qualifier = (match.group(1) or "").lower()
+        scope_reads = reads.get(scopes[match.start()], [])
+        if qualifier:
+            pruned.update(t for t, names in tables.items() if qualifier in names)
+        elif len(scope_reads) == 1:
+            pruned.add(scope_reads[0])
+    return sorted(table for table in tables if table not in pruned)
+
+
+def cost_usd(scanned_bytes: int) -> float:
+    billed = max(scanned_bytes, ATHENA_MIN_BILLED_BYTES)
+    return billed / 1024**4 * ATHENA_USD_PER_TB
+
+
+def record(
+    query_id: str,
+    query: str,
+    statistics: Dict[str, Any],
+    db: str,
+    state: Optional[str] = None,
+    path: str = QUERY_HISTORY_PATH,
+) -> None:
+    """
+    adds the statistics athena reported for a completed query to the history,
+    as returned in the status of 'read_fg'
+    """
+    row = (
+        query_id,
+        fingerprint(query),
+        query,
+        state,
+        statistics.get("DataScannedInBytes", 0),
+        statistics.get("EngineExecutionTimeInMillis", 0),
+        statistics.get("QueryQueueTimeInMillis", 0),
+        ",".join(unpruned_tables(query, db)),
+        ist_utils.current_epoch_millis(),
+    )
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO queries VALUES (?,?,?,?,?,?,?,?,?)", row)
+
+
+def heaviest(limit: int = 10, path: str = QUERY_HISTORY_PATH) -> List[FingerprintStats]:
+    """query fingerprints by the total bytes their runs scanned, heaviest first"""
+    sql = (
+        "SELECT fingerprint, MAX(query), COUNT(*), SUM(scanned_bytes),"
+        " MAX(scanned_bytes), AVG(engine_ms) FROM queries"
+        " GROUP BY fingerprint ORDER BY SUM(scanned_bytes) DESC LIMIT ?"
+    )
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(sql, (limit,)).fetchall()
+    return [FingerprintStats(*row, cost_usd=cost_usd(row[3])) for row in rows]
+
+
+def unpruned(limit: int = 10, path: str = QUERY_HISTORY_PATH) -> List[UnprunedQuery]:
+    """queries which scanned whole FGs, by bytes scanned, heaviest first"""
+    sql = (
+        "SELECT query_id, query, unpruned_tables, scanned_bytes FROM queries"
+        " WHERE unpruned_tables != '' ORDER BY scanned_bytes DESC LIMIT ?"
+    )
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(sql, (limit,)).fetchall()
+    return [
+        UnprunedQuery(query_id, query, tables.split(","), scanned)
+        for query_id, query, tables, scanned in rows
+    ]
+
+
+def report(limit: int = 10, path: str = QUERY_HISTORY_PATH) -> str:
+    """printable summary of the heaviest and the unpruned queries"""
+    lines = ["Heaviest query fingerprints:"]
+    lines.extend(
+        f"  {s.fingerprint} runs={s.runs} scanned={_mb(s.scanned_bytes)}"
+        f" max={_mb(s.max_scanned_bytes)} avg_engine_ms={s.avg_engine_ms:.0f}"
+        f" cost=${s.cost_usd:.4f} : {_abbreviate(s.query)}"
+        for s in heaviest(limit, path)
+    )
+    lines.append("Queries without y/m/d predicates:")
+    lines.extend(
+        f"  {q.query_id} tables={','.join(q.tables)} scanned={_mb(q.scanned_bytes)}"
+        f" : {_abbreviate(q.query)}"
+        for q in unpruned(limit, path)
+    )
+    return "\n".join(lines)
+
+
+def _scopes(shape: str) -> List[int]:
+    """
+    the (sub)query of each position of the query, as the offset
+    of the parenthesis opening it, -1 for the outermost
+    """
+    scopes, opened = [], []
+    for i, char in enumerate(shape):
+        if char == "(":
+            is_query = _SUBQUERY_RE.match(shape, i + 1) is not None
+            opened.append(i if is_query else None)
+        elif char == ")" and opened:
+            opened.pop()
+        scopes.append(next((o for o in reversed(opened) if o is not None), -1))
+    return scopes
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute(DDL)
+    return conn
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 ** 2:.1f}MB"
+
+
+def _abbreviate(query: str, width: int = 80) -> str:
+    shape = _SPACE_RE.sub(" ", query).strip()
+    return shape if len(shape) <= width else shape[: width - 3] + "..."
@@ -5,6 +5,24 @@ from typing import Any, Dict
 Schema = Dict[str, Any]
 SCHEMA_TIME_COL: str = "__time_col__"
 SCHEMA_TIME_UNIT: str = "__time_col_unit__"
+# set if the FG table projects its partitions, instead of registering them in Glue
+SCHEMA_PROJECTED: str = "__partition_projection__"
+# set if the FG files are hash bucketed by the entity key column
+SCHEMA_ENTITY_KEY: str = "__entity_key__"
+SCHEMA_NUM_BUCKETS: str = "__num_buckets__"
+# columns added to the FG within its version, oldest first, see evolve
+SCHEMA_REVISIONS: str = "__revisions__"
+META_KEYS = frozenset(
+    {
+        SCHEMA_TIME_COL,
+        SCHEMA_TIME_UNIT,
+        SCHEMA_PROJECTED,
+        SCHEMA_ENTITY_KEY,
+        SCHEMA_NUM_BUCKETS,
+        SCHEMA_REVISIONS,
+    }
+)
+PARTITION_COLS = frozenset({"y", "m", "d"})
 
 
 def validate(schema: Schema, time_col: str, time_col_unit: str) -> bool:
@@ -21,16 +39,39 @@ def validate(schema: Schema, time_col: str, time_col_unit: str) -> bool:
     headers = set(schema.keys())
     assert time_col in headers, f"{time_col} absent from data-frame"
     assert schema[time_col] in {"int", "bigint"}, f"non numeric epoch in frame"
-    for c in ["y", "m", "d"]:
+    for c in sorted(PARTITION_COLS):
         assert c not in headers, f"Data-Frame has a column named {c}"
 
     return True  # for easy testing
 
 
+def validate_entity_key(schema: Schema, entity_key: str, num_buckets: int) -> bool:
+    assert entity_key in schema, f"{entity_key} absent from data-frame"
+    assert num_buckets >= 1, f"num_buckets must be positive, not {num_buckets}"
+
+    return True  # for easy testing
+
+
+def evolve(expected_schema: Schema, added: Schema, at_ms: int) -> Schema:
+    """
+    the schema with the added columns appended, and the revision recorded,
+    existing columns cannot be removed, renamed or retyped
+    """
+    assert added, "No columns to add"
+    for col, col_type in added.items():
+        assert col not in expected_schema, f"{col} already in schema"
+        assert col not in META_KEYS | PARTITION_COLS, f"Reserved column name {col}"
+        assert col_type, f"Missing type of {col}"
+
+    revisions = list(expected_schema.get(SCHEMA_REVISIONS, []))
+    revisions.append({"at_ms": at_ms, "added": dict(added)})
+    evolved = dict(expected_schema, **added)
+    evolved[SCHEMA_REVISIONS] = revisions
+    return evolved
+
+
 def match(expected_schema: Schema, actual_schema: Schema) -> bool:
-    expected_cols = set(expected_schema.keys()).difference(
-        {SCHEMA_TIME_COL, SCHEMA_TIME_UNIT}
-    )
+    expected_cols = set(expected_schema.keys()).difference(META_KEYS)
     actual_cols = set(actual_schema.keys())
 
     common_cols = expected_cols & actual_cols
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from . import codec, online_store
+
+CONTENT_TYPE_CODEC: str = "application/x-featurestore"
+CONTENT_TYPE_JSON: str = "application/json"
+
+BATCH_WINDOW_MS: float = 1.0
+MAX_BATCH_KEYS: int = 2000
+CACHE_SIZE: int = 100000
+CACHE_TTL_SECS: float = 60.0
+LATENCY_SAMPLES: int = 10000
+
+# (fg ref, entity key)
+CacheKey = Tuple[str, str]
+# (fg ref, entity keys, future resolved with the rows aligned to the keys)
+Lookup = Tuple[str, List[str], "asyncio.Future[List[Any]]"]
+
+
+class FeatureServer:
+    """
+    Http front of the online store.
+    POST /features with a codec (or json) body {"fgs": [refs], "keys": [keys]},
+    responds with a codec body {ref: [[values, event_ms, written_ms] or None]},
+    rows aligned with the keys.
+    Concurrent lookups are coalesced into one store read per batch window,
+    and recent rows are served from an in process LRU.
+    GET /metrics responds with counters and latency quantiles in prometheus text.
+    """
+
+    def __init__(
+        self,
+        path: str = online_store.ONLINE_STORE_PATH,
+        batch_window_ms: float = BATCH_WINDOW_MS,
+        max_batch_keys: int = MAX_BATCH_KEYS,
+        cache_size: int = CACHE_SIZE,
+        cache_ttl_secs: float = CACHE_TTL_SECS,
+    ):
+        self.path = path
+        self.batch_window_secs = batch_window_ms / 1000
+        self.max_batch_keys = max_batch_keys
+        self.cache_size = cache_size
+        self.cache_ttl_secs = cache_ttl_secs
+        self.cache: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self.queue: "asyncio.Queue[Lookup]" = asyncio.Queue()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.counters: Dict[str, int] = {
+            "requests": 0,
+            "errors": 0,
+            "keys": 0,
+            "cache_hits": 0,
+            "batches": 0,
+        }
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._handle, host, port)
+        batcher = asyncio.ensure_future(self._batch_loop())
+        logging.info(f"Serving features from {self.path} on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def lookup(
+        self, fg_refs: Sequence[str], entity_keys: Sequence[Any]
+    ) -> Dict[str, List[Any]]:
+        keys = [online_store.entity_key(key) for key in entity_keys]
+        self.counters["keys"] += len(keys) * len(fg_refs)
+        results = await asyncio.gather(*[self._lookup_fg(ref, keys) for ref in fg_refs])
+        return dict(zip(fg_refs, results))
+
+    def metrics(self) -> str:
+        lines = [
+            f"featurestore_{name}_total {value}"
+            for name, value in self.counters.items()
+        ]
+        ordered = sorted(self.latencies)
+        for quantile in [0.5, 0.99]:
+            value = ordered[int(quantile * (len(ordered) - 1))] if ordered else 0.0
+            lines.append(
+                f'featurestore_request_latency_seconds{{quantile="{quantile}"}} {value}'
+            )
+        return "\n".join(lines) + "\n"
+
+    async def _lookup_fg(self, fg_ref: str, keys: List[str]) -> List[Any]:
+        now = time.monotonic()
+        rows: List[Any] = [self._cached((fg_ref, key), now) for key in keys]
+        missing = [key for key, row in zip(keys, rows) if row is _MISS]
+        self.counters["cache_hits"] += len(keys) - len(missing)
+        if missing:
+            future = asyncio.get_event_loop().create_future()
+            await self.queue.put((fg_ref, missing, future))
+            fetched = dict(zip(missing, await future))
+            rows = [
+                fetched[key] if row is _MISS else row for key, row in zip(keys, rows)
+            ]
+        return rows
+
+    def _cached(self, cache_key: CacheKey, now: float) -> Any:
+        hit = self.cache.get(cache_key)
+        if hit is None or now - hit[0] > self.cache_ttl_secs:
+            return _MISS
+        self.cache.move_to_end(cache_key)
+        return hit[1]
+
+    def _cache_put(self, cache_key: CacheKey, row: Any, now: float) -> None:
+        self.cache[cache_key] = (now, row)
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window_secs
+            while sum(len(item[1]) for item in batch) < self.max_batch_keys:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch: List[Lookup]) -> None:
+        self.counters["batches"] += 1
+        by_fg: Dict[str, List[str]] = {}
+        for fg_ref, keys, _ in batch:
+            by_fg.setdefault(fg_ref, []).extend(keys)
+
+        loop = asyncio.get_event_loop()
+        try:
+            found = await loop.run_in_executor(None, self._read_store, by_fg)
+        except Exception as ex:
+            for _, _, future in batch:
+                future.set_exception(ex)
+            return
+
+        now = time.monotonic()
+        for fg_ref, rows in found.items():
+            for key, row in rows.items():
+                self._cache_put((fg_ref, key), row, now)
+        for fg_ref, keys, future in batch:
+            future.set_result([found[fg_ref][key] for key in keys])
+
+    def _read_store(self, by_fg: Dict[str, List[str]]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        for fg_ref, keys in by_fg.items():
+            unique = list(dict.fromkeys(keys))
+            rows = online_store.get_online_features([fg_ref], unique, self.path)[fg_ref]
+            found[fg_ref] = {key: _wire_row(row) for key, row in zip(unique, rows)}
+        return found
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError as ex:
+                    # the rest of the stream cannot be framed, so the connection ends
+                    self.counters["errors"] += 1
+                    body = str(ex).encode("utf-8")
+                    writer.write(_http_response("400 Bad Request", "text/plain", body))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                status, content_type, body = await self._respond(*request)
+                writer.write(_http_response(status, content_type, body))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(
+        self, method: str, target: str, headers: Dict[str, str], body: bytes
+    ) -> Tuple[str, str, bytes]:
+        if method == "GET" and target == "/metrics":
+            return "200 OK", "text/plain", self.metrics().encode("utf-8")
+        if method != "POST" or target != "/features":
+            return "404 Not Found", "text/plain", b"not found"
+
+        started = time.perf_counter()
+        self.counters["requests"] += 1
+        try:
+            query = _decode_body(headers, body)
+            result = await self.lookup(query["fgs"], query["keys"])
+            return "200 OK", CONTENT_TYPE_CODEC, codec.encode(result)
+        except Exception as ex:
+            self.counters["errors"] += 1
+            logging.exception("Failed to serve features")
+            return "400 Bad Request", "text/plain", str(ex).encode("utf-8")
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+_MISS = object()
+
+
+def _wire_row(row: Optional[online_store.OnlineRow]) -> Optional[List[Any]]:
+    return None if row is None else [row.values, row.event_ms, row.written_ms]
+
+
+def _decode_body(headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    if headers.get("content-type", "").startswith(CONTENT_TYPE_JSON):
+        return json.loads(body)
+    return codec.decode(body)
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    parts = request_line.decode("latin-1").split(" ", 2)
+    if len(parts) != 3:
+        raise ValueError(f"Malformed request line {request_line!r}")
+    method, target, _ = parts
+    headers: Dict[str, str] = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = await reader.readexactly(int(headers.get("content-length", "0")))
+    return method, target, headers, body
+
+
+def _http_response(status: str, content_type: str, body: bytes) -> bytes:
+    head = (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def main(argv: Sequence[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve online features over http")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=online_store.ONLINE_STORE_PATH)
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch-keys", type=int, default=MAX_BATCH_KEYS)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    parser.add_argument("--cache-ttl-secs", type=float, default=CACHE_TTL_SECS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format="%(asctime)s - %(message)s",
+        level=logging.INFO,
+        datefmt="%d-%b-%y %H:%M:%S",
+    )
+
+    async def run() -> None:
+        server = FeatureServer(
+            args.db,
+            args.batch_window_ms,
+            args.max_batch_keys,
+            args.cache_size,
+            args.cache_ttl_secs,
+        )
+        await server.serve(args.host, args.port)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,120 @@
 # -*- coding: utf-8 -*-
 
-import logging
+from __future__ import annotations
+
+import csv
+import gzip
+import os
 import shutil
-from typing import Any, Dict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Dict,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
 
-from pandas import DataFrame as Pandas_df
-from pyspark.sql import SparkSession
-from pyspark.sql.dataframe import DataFrame as Spark_df
+from . import aws_s3, schema_utils, str_utils
 
-from . import aws_s3, str_utils
+if TYPE_CHECKING:
+    from pandas import DataFrame as Pandas_df
+    from pyspark.sql import SparkSession
+    from pyspark.sql.dataframe import DataFrame as Spark_df
+    from pyspark.sql.types import StructType
 
 Schema = Dict[str, Any]
+# a hive schema, eg a FG schema.json, or a glue column list [{"Name", "Type"}]
+SchemaHint = Union[Mapping[str, str], Sequence[Mapping[str, str]]]
 
-TMP_TABLE_NAME: str = "tmp_tbl"
 SPARK_WAREHOUSE: str = "/tmp/tmp-spark"
 
+SPARK_PROFILE_ENV: str = "FEATURESTORE_SPARK_PROFILE"
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+COPY_BUFFER_BYTES: int = 8 * 1024 * 1024
+
+_ARROW_CONF = {
+    "spark.sql.execution.arrow.pyspark.enabled": "true",
+    "spark.sql.execution.arrow.pyspark.fallback.enabled": "true",
+}
+
+# named spark session settings, as spark conf key -> value
+PROFILES: Dict[str, Dict[str, str]] = {
+    # the original single core session, light enough for lambda and ci hosts
+    "local": {"spark.master": "local"},
+    "multicore": {
+        "spark.master": "local[*]",
+        "spark.driver.memory": "4g",
+        "spark.sql.shuffle.partitions": "8",
+        **_ARROW_CONF,
+    },
+    "large": {
+        "spark.master": "local[*]",
+        "spark.driver.memory": "16g",
+        "spark.sql.shuffle.partitions": "64",
+        "spark.sql.execution.arrow.maxRecordsPerBatch": "50000",
+        **_ARROW_CONF,
+    },
+}
+DEFAULT_PROFILE: str = "local"
+
+_profile: str = os.environ.get(SPARK_PROFILE_ENV, DEFAULT_PROFILE)
+
+
+def set_profile(name: str, conf: Optional[Dict[str, str]] = None) -> None:
+    """
+    Selects the named profile, registering it with conf if given,
+    for sessions created from now on.
+    Settings like driver memory only apply to a new jvm, so any active session
+    is stopped, to be recreated with the profile on next use.
+    """
+    global _profile
+
+    if conf is not None:
+        PROFILES[name] = dict(conf)
+    assert name in PROFILES, f"Unknown spark profile {name}, one of {list(PROFILES)}"
+
+    _profile = name
+    from pyspark.sql import SparkSession
+
+    active = SparkSession.getActiveSession()
+    if active is not None:
+        active.stop()
+
+
+def profile_conf(name: Optional[str] = None) -> Dict[str, str]:
+    """spark conf of the named profile, the selected one if absent"""
+    name = name or _profile
+    assert name in PROFILES, f"Unknown spark profile {name}, one of {list(PROFILES)}"
+    return {"spark.sql.warehouse.dir": SPARK_WAREHOUSE, **PROFILES[name]}
+
 
 def sparkSession() -> SparkSession:
-    return (
-        SparkSession.builder.config("spark.sql.warehouse.dir", SPARK_WAREHOUSE)
-        .master("local")
-        .appName("featurestore")
-        .getOrCreate()
-    )
+    from pyspark.sql import SparkSession
+
+    builder = SparkSession.builder.appName("featurestore")
+    for key, value in profile_conf().items():
+        builder = builder.config(key, value)
+    return builder.getOrCreate()
 
 
 def get_schema(spark_df: Spark_df) -> Schema:
-    try:
-        # remove leftover local spark table if present
-        shutil.rmtree(f"{SPARK_WAREHOUSE}/{TMP_TABLE_NAME}")
-    except Exception:
-        logging.info(
-            f"Failed to clear local spark table {SPARK_WAREHOUSE}/{TMP_TABLE_NAME}"
-        )
-
-    spark_df.write.saveAsTable(TMP_TABLE_NAME, mode="overwrite")
-    spark = sparkSession()
-    desc_tbl = spark.sql(f"DESCRIBE {TMP_TABLE_NAME}")
+    """
+    hive schema of the Spark Df, as "describe table" would list it,
+    read from the Df's own schema, so nothing is written to the warehouse
+    and concurrent calls are safe
+    """
+    return struct_schema(spark_df.schema)
 
+
+def struct_schema(struct: StructType) -> Schema:
+    """hive schema of the struct's fields, with sanitised top level names"""
     schema = [
-        (str_utils.sanitise(r["col_name"]), r["data_type"])
-        for r in desc_tbl.rdd.collect()
+        (str_utils.sanitise(field.name), field.dataType.simpleString())
+        for field in struct.fields
     ]
 
     cols = list(map(lambda x: x[0], schema))
@@ -56,35 +130,70 @@ def parquet2spark(fname: str) -> Spark_df:
     return spark.read.format("parquet").load(fname)
 
 
-def csv2spark(fname: str) -> Spark_df:
+def csv2spark(fname: str, schema: Optional[SchemaHint] = None) -> Spark_df:
+    """
+    Spark Df of the local csv with a header line.
+    Given the schema hint, columns are typed by it in a single parse,
+    split across cores, so rows must not span lines,
+    else the types are inferred with an extra pass over the file.
+    """
     spark = sparkSession()
-    return (
+    reader = (
         spark.read.format("csv")
         .option("header", "true")
-        .option("inferSchema", "true")
-        .option("multiLine", "true")
         .option("quoteMode", "ALL")
         .option("ignoreLeadingWhiteSpace", "true")
         .option("ignoreTrailingWhiteSpace", "true")
-        .load(fname)
     )
+    if schema is not None:
+        columns = csv_schema(_csv_header(fname), schema)
+        return reader.schema(ddl(columns)).load(fname)
+
+    return reader.option("inferSchema", "true").option("multiLine", "true").load(fname)
+
+
+def csv_schema(header: Sequence[str], hint: SchemaHint) -> Schema:
+    """
+    hive schema of the csv columns, in header order, with sanitised names,
+    typed by the hint
+    """
+    types = _hint_types(hint)
+    names = [str_utils.sanitise(col) for col in header]
+    missing = [name for name in names if name not in types]
+    assert not missing, f"CSV columns {missing} absent from the schema"
+    return {name: types[name] for name in names}
 
 
-def pandas2spark(pandas_df: Pandas_df) -> Spark_df:
+def pandas2spark(pandas_df: Pandas_df, schema: Optional[Schema] = None) -> Spark_df:
+    """
+    Spark Df of the pandas Df with sanitised column names,
+    typed by the hive schema, in column order, if given, skipping type inference
+    """
     spark = sparkSession()
-    spark_df = spark.createDataFrame(
-        pandas_df.rename(str_utils.sanitise, axis="columns"), samplingRatio=1.0
-    )
+    renamed = pandas_df.rename(str_utils.sanitise, axis="columns")
+    if schema is not None:
+        return spark.createDataFrame(renamed, schema=ddl(schema), verifySchema=False)
+
+    spark_df = spark.createDataFrame(renamed, samplingRatio=1.0)
     return spark_df
 
 
-def read(fname: str) -> Spark_df:
-    file = _get_file(fname)
+def ddl(schema: Schema) -> str:
+    """spark ddl string of the hive schema, eg "`a` bigint, `b` string" """
+    return ", ".join(f"`{col}` {col_type}" for col, col_type in schema.items())
+
+
+def read(fname: str, schema: Optional[SchemaHint] = None) -> Spark_df:
+    """
+    Spark Df of the local or s3 parquet/csv file,
+    csv may be compressed as ".csv.gz" or ".csv.zst", and typed by the schema hint
+    """
+    base = _strip_compression(fname)
 
-    if fname.endswith(".csv"):
-        return csv2spark(file)
+    if base.endswith(".csv"):
+        return csv2spark(_get_csv_file(fname), schema)
     elif fname.endswith(".parquet"):
-        return parquet2spark(file)
+        return parquet2spark(_get_file(fname))
     else:
         raise ValueError("Unsupported File Format")
 
@@ -103,3 +212,57 @@ def _get_file(fname: str) -> str:
         return tmp_file
     else:
         return fname
+
+
+def _get_csv_file(fname: str) -> str:
+    """
+    local uncompressed copy of the csv, which spark can split across cores,
+    decompressed while streaming from s3, without keeping the compressed file
+    """
+    if not fname.endswith(COMPRESSED_SUFFIXES):
+        return _get_file(fname)
+
+    if fname.startswith("s3"):
+        bucket, key = aws_s3.parse_url(fname)
+        source = aws_s3.get_stream(bucket, key)
+        tmp_file = "/tmp/" + _strip_compression(key).replace("/", "_")
+    else:
+        source = open(fname, "rb")
+        tmp_file = "/tmp/" + _strip_compression(fname).replace("/", "_")
+
+    with source, _decompress(fname, source) as stream, open(tmp_file, "wb") as out:
+        shutil.copyfileobj(stream, out, COPY_BUFFER_BYTES)
+    return tmp_file
+
+
+def _decompress(fname: str, raw: BinaryIO) -> BinaryIO:
+    if fname.endswith(".gz"):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading .zst files needs the zstandard package")
+    return zstandard.ZstdDecompressor().stream_reader(raw)
+
+
+def _strip_compression(fname: str) -> str:
+    for suffix in COMPRESSED_SUFFIXES:
+        if fname.endswith(suffix):
+            return fname[: -len(suffix)]
+    return fname
+
+
+def _csv_header(fname: str) -> Sequence[str]:
+    with open(fname, newline="") as f:
+        return next(csv.reader(f))
+
+
+def _hint_types(hint: SchemaHint) -> Dict[str, str]:
+    if isinstance(hint, Mapping):
+        return {
+            col: col_type
+            for col, col_type in hint.items()
+            if col not in schema_utils.META_KEYS
+        }
+    return {str_utils.sanitise(col["Name"]): col["Type"] for col in hint}
@@ -1,7 +1,13 @@
+import json
 import logging
-from typing import Any, Dict, List, Sequence, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Set, Tuple
 
 import boto3
+from botocore.exceptions import ClientError
 
 Args = Dict[str, Any]
 Response = Dict[str, Any]
@@ -19,6 +25,22 @@ PAYLOAD_KEY: str = "payload"
 QUERY_ID_KEY: str = "query_id"
 QUERY_STATUS_KEY: str = "query_status"
 S3_PATH_KEY: str = "s3_path"
+QUERY_KEY: str = "query"
+STATISTICS_KEY: str = "statistics"
+MANIFEST_KEY: str = "manifest"
+MANIFEST_PATH_KEY: str = "path"
+MANIFEST_HASHES_KEY: str = "hashes"
+HASH_KEY: str = "hash"
+UPLOADS_KEY: str = "uploads"
+NAME_KEY: str = "name"
+PARTITIONS_KEY: str = "partitions"
+FILES_KEY: str = "files"
+GC_PREFIX_KEY: str = "prefix"
+GC_BUCKET_KEY: str = "bucket"
+GC_OLDER_THAN_KEY: str = "older_than_ms"
+GC_TABLE_KEY: str = "table"
+TRACE_ID_KEY: str = "trace_id"
+SPANS_KEY: str = "spans"
 
 STATUS_OK = "OK"
 STATUS_ERROR = "ERROR"
@@ -26,12 +48,57 @@ STATUS_ERROR = "ERROR"
 ACTION_CREATE: str = "CREATE"
 ACTION_CREATE_PARTITION: str = "CREATE_PARTITION"
 ACTION_UPLOAD: str = "UPLOAD"
+ACTION_UPLOAD_MANY: str = "UPLOAD_MANY"
 ACTION_DUMP: str = "DUMP"
 ACTION_DUMP_STATUS: str = "DUMP_STATUS"
+ACTION_GC: str = "GC"
+ACTION_EVOLVE: str = "EVOLVE"
 
 S3_BUCKET: str = "data-lake"
 S3_STAGE_BUCKET: str = S3_BUCKET
 
+# concurrent commits to a FG version race on its manifest
+MANIFEST_WRITE_ATTEMPTS: int = 5
+# concurrent evolves of a FG version race on its glue table and schema
+SCHEMA_WRITE_ATTEMPTS: int = 5
+SCHEMA_REVISIONS_KEY: str = "__revisions__"
+WRITE_CONFLICT_CODES = frozenset(
+    {
+        "PreconditionFailed",
+        "ConditionalRequestConflict",
+        "ConcurrentModificationException",
+    }
+)
+
+# FGs committed concurrently by an UPLOAD_MANY
+UPLOAD_MANY_WORKERS: int = 8
+
+# limits of a single s3 delete_objects and glue batch_update_partition call
+S3_DELETE_BATCH: int = 1000
+GLUE_UPDATE_BATCH: int = 100
+
+# fields of a glue get_table response accepted by update_table
+TABLE_INPUT_KEYS = frozenset(
+    {
+        "Name",
+        "Description",
+        "Owner",
+        "Retention",
+        "StorageDescriptor",
+        "PartitionKeys",
+        "TableType",
+        "Parameters",
+    }
+)
+
+# stage timings of the current invocation, returned to the client
+_spans: List[Dict[str, Any]] = []
+
+# boto3 clients by service, shared by the threads of an invocation and
+# reused by later invocations of a warm container
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
 
 logging.basicConfig(
     format="%(asctime)s - %(message)s", level=logging.INFO, datefmt="%d-%b-%y %H:%M:%S"
@@ -48,8 +115,11 @@ def handler(event, context) -> Response:
         ACTION_CREATE: _create_fg,
         ACTION_CREATE_PARTITION: _add_partition,
         ACTION_UPLOAD: _upload_fg,
+        ACTION_UPLOAD_MANY: _upload_many,
         ACTION_DUMP: _dump_fg,
         ACTION_DUMP_STATUS: _dump_fg_status,
+        ACTION_GC: _gc,
+        ACTION_EVOLVE: _evolve_fg,
     }
     action_name = event.get(ACTION_KEY)
     action = switcher.get(action_name)
@@ -61,16 +131,48 @@ def handler(event, context) -> Response:
     if not args:
         return _error_response(f"Missing Args {event}")
 
-    result = action(args)
+    trace_id = event.get(TRACE_ID_KEY)
+    _spans.clear()
+    with _timed(f"lambda.{action_name}"):
+        result = action(args)
+
+    logging.info(f"Trace {trace_id} spans {_spans}")
+    result[TRACE_ID_KEY] = trace_id
+    result[SPANS_KEY] = list(_spans)
     return result
 
 
+@contextmanager
+def _timed(name: str) -> Iterator[Dict[str, float]]:
+    """times the enclosed stage, yielding its counters to fill"""
+    counters: Dict[str, float] = {}
+    started = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        secs = time.perf_counter() - started
+        _spans.append({"name": name, "secs": secs, "counters": counters})
+
+
 def _glue() -> Any:
-    return boto3.client("glue")
+    return _client("glue")
 
 
 def _athena() -> Any:
-    return boto3.client("athena")
+    return _client("athena")
+
+
+def _s3() -> Any:
+    return _client("s3")
+
+
+def _client(service: str) -> Any:
+    # clients are thread safe, but creating them from the default session is not
+    with _clients_lock:
+        client = _clients.get(service)
+        if client is None:
+            client = _clients[service] = boto3.client(service)
+    return client
 
 
 def _extract_glue_params(args: Dict[str, Any]) -> Tuple[Lambda_params, Schema, Paths]:
@@ -85,31 +187,192 @@ def _extract_glue_params(args: Dict[str, Any]) -> Tuple[Lambda_params, Schema, P
 def _create_fg(args: Dict[str, Any]) -> Response:
     try:
         params, schema, paths = _extract_glue_params(args)
-        _s3_copy(*paths[0])
-        result = _glue().create_table(**params)
+        with _timed("lambda.s3_copy") as counters:
+            _s3_copy(*paths[0])
+            counters["files"] = 1
+        with _timed("lambda.glue_create_table") as counters:
+            result = _glue().create_table(**params)
+            counters["retries"] = _retries(result)
         return _action_status(result)
     except Exception as ex:
         message = f"Failed to create table : Bad Args {args}"
         return _error_response(message, ex)
 
 
-def _upload_fg(args: Dict[str, Any]) -> Response:
+def _evolve_fg(args: Dict[str, Any]) -> Response:
+    """
+    appends the columns to the glue table, then adds them to the schema,
+    so uploads with the columns are accepted only once athena can read them,
+    both conditional on being unchanged since read, so concurrent evolves
+    keep each other's columns
+    """
     try:
         params, schema, paths = _extract_glue_params(args)
-        for path in paths:
-            _s3_copy(*path)
+        result = _glue_add_columns(params)
+        if _http_ok(result):
+            _update_schema(paths[0][1], schema[SCHEMA_REVISIONS_KEY][-1])
+        return _action_status(result)
+    except Exception as ex:
+        message = f"Failed to evolve table : Bad Args {args}"
+        return _error_response(message, ex)
 
-        result = _glue().batch_create_partition(**params)
+
+def _glue_add_columns(params: Lambda_params) -> Dict[str, Any]:
+    db, name = params["DatabaseName"], params["TableName"]
+    with _timed("lambda.glue_update_table") as counters:
+        for attempt in range(SCHEMA_WRITE_ATTEMPTS):
+            counters["conflicts"] = attempt
+            table = _glue().get_table(DatabaseName=db, Name=name)["Table"]
+            table_input = {k: v for k, v in table.items() if k in TABLE_INPUT_KEYS}
+            columns = table_input["StorageDescriptor"]["Columns"]
+            known = {col["Name"] for col in columns}
+            # a retry finds its columns already added
+            columns.extend(col for col in params["Columns"] if col["Name"] not in known)
+            try:
+                result = _glue().update_table(
+                    DatabaseName=db,
+                    TableInput=table_input,
+                    VersionId=table["VersionId"],
+                )
+            except ClientError as ex:
+                if not _write_conflict(ex):
+                    raise
+                continue
+            counters["columns"] = len(columns) - len(known)
+            counters["retries"] = _retries(result)
+            return result
+
+    raise RuntimeError(f"Gave up updating contended table {db}.{name}")
+
+
+def _update_schema(key: str, revision: Dict[str, Any]) -> None:
+    """
+    adds the columns of the revision, and the revision, to the schema at key,
+    conditional on it being unchanged since read, retrying on conflicts
+    """
+    with _timed("lambda.schema") as counters:
+        for attempt in range(SCHEMA_WRITE_ATTEMPTS):
+            counters["retries"] = attempt
+            response = _s3().get_object(Bucket=S3_BUCKET, Key=key)
+            schema = json.loads(response["Body"].read())
+            _merge_schema(schema, revision)
+            try:
+                _put_json(key, schema, response["ETag"])
+                logging.info(f"Updated schema {key} with {revision}")
+                return
+            except ClientError as ex:
+                if not _write_conflict(ex):
+                    raise
+
+    raise RuntimeError(f"Gave up updating contended schema {key}")
+
+
+def _merge_schema(schema: Schema, revision: Dict[str, Any]) -> None:
+    for col, kind in revision["added"].items():
+        if schema.get(col, kind) != kind:
+            raise ValueError(f"{col} already in schema as {schema[col]}")
+    schema.update(revision["added"])
+    revisions = schema.setdefault(SCHEMA_REVISIONS_KEY, [])
+    # a retry finds its revision already recorded
+    if revision not in revisions:
+        revisions.append(revision)
+
+
+def _upload_fg(args: Dict[str, Any]) -> Response:
+    try:
+        params, schema, paths = _extract_glue_params(args)
+        manifest = args.get(MANIFEST_KEY)
+        with _timed("lambda.s3_copy") as counters:
+            for path in paths:
+                _s3_copy(*path)
+            counters["files"] = len(paths)
+            if manifest:
+                counters["bytes"] = _manifest_bytes(manifest[PARTITIONS_KEY])
+
+        # FG tables projecting their partitions have none to add,
+        # the others may be moved to the commit folder of the upload
+        result = (
+            _glue_add_partitions(params, relocate=True)
+            if params
+            else _projected_response()
+        )
+        if manifest and _http_ok(result):
+            _update_manifest(
+                manifest[MANIFEST_PATH_KEY],
+                manifest[PARTITIONS_KEY],
+                manifest.get(MANIFEST_HASHES_KEY) or {},
+            )
+        if _http_ok(result):
+            _s3_delete(S3_STAGE_BUCKET, [stage_path for stage_path, _ in paths])
         return _action_status(result)
     except Exception as ex:
         message = f"Failed to update partition : Bad Args {args}"
         return _error_response(message, ex)
 
 
+def _upload_many(args: Dict[str, Any]) -> Response:
+    """
+    commits each FG of the uploads like an UPLOAD,
+    with the status of each by its name in the payload
+    """
+    try:
+        uploads = args[UPLOADS_KEY]
+        with ThreadPoolExecutor(max_workers=UPLOAD_MANY_WORKERS) as pool:
+            results = list(pool.map(_upload_fg, uploads))
+        statuses = {
+            upload[NAME_KEY]: {k: v for k, v in result.items() if k != "exception"}
+            for upload, result in zip(uploads, results)
+        }
+        failed = any(status[STATUS_KEY] != STATUS_OK for status in statuses.values())
+        return {
+            STATUS_KEY: STATUS_ERROR if failed else STATUS_OK,
+            PAYLOAD_KEY: statuses,
+        }
+    except Exception as ex:
+        message = f"Failed to upload FGs : Bad Args {args}"
+        return _error_response(message, ex)
+
+
+def _gc(args: Dict[str, Any]) -> Response:
+    """
+    deletes the objects under the prefix, older than the cutoff,
+    except those the manifest lists or under a location of the table partitions
+    """
+    try:
+        params = args[PARAMS_KEY]
+        bucket, prefix = params[GC_BUCKET_KEY], params[GC_PREFIX_KEY]
+        manifest = args.get(MANIFEST_KEY)
+        keep = _manifest_keys(manifest[MANIFEST_PATH_KEY]) if manifest else set()
+        locations = _partition_locations(bucket, params.get(GC_TABLE_KEY))
+
+        with _timed("lambda.gc") as counters:
+            garbage = []
+            pages = _s3().get_paginator("list_objects_v2")
+            for page in pages.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    key = obj["Key"]
+                    at_ms = obj["LastModified"].timestamp() * 1000
+                    if (
+                        at_ms < params[GC_OLDER_THAN_KEY]
+                        and key not in keep
+                        and not key.startswith(locations)
+                    ):
+                        garbage.append(key)
+                        counters["bytes"] = counters.get("bytes", 0) + obj["Size"]
+            _s3_delete(bucket, garbage)
+            counters["files"] = len(garbage)
+
+        logging.info(f"Deleted {len(garbage)} objects under {bucket}/{prefix}")
+        return {STATUS_KEY: STATUS_OK, PAYLOAD_KEY: {"deleted": len(garbage)}}
+    except Exception as ex:
+        message = f"Failed to GC : Bad Args {args}"
+        return _error_response(message, ex)
+
+
 def _add_partition(args: Dict[str, Any]) -> Response:
     params = args.get(PARAMS_KEY)
     try:
-        result = _glue().batch_create_partition(**params)
+        result = _glue_add_partitions(params)
         return _action_status(result)
     except Exception as ex:
         message = f"Failed to update partition : Bad Args {args}"
@@ -119,7 +382,9 @@ def _add_partition(args: Dict[str, Any]) -> Response:
 def _dump_fg(args: Dict[str, Any]) -> Response:
     params = args.get(PARAMS_KEY)
     try:
-        result = _athena().start_query_execution(**params)
+        with _timed("lambda.athena_start") as counters:
+            result = _athena().start_query_execution(**params)
+            counters["retries"] = _retries(result)
         return _action_status(result)
     except Exception as ex:
         message = f"Failed to start athena query : Bad Args {params}"
@@ -147,12 +412,179 @@ def _error_response(message, ex=None) -> Response:
 
 
 def _s3_copy(stage_path: str, prod_path: str) -> None:
-    s3 = boto3.resource("s3")
     stage = {"Bucket": S3_STAGE_BUCKET, "Key": stage_path}
-    prod = s3.Bucket(S3_BUCKET)
-    prod.copy(stage, prod_path)
+    _s3().copy(stage, S3_BUCKET, prod_path)
+
+    logging.info(f"Copied {stage} to {S3_BUCKET}/{prod_path}")
+
+
+def _glue_add_partitions(
+    params: Lambda_params, relocate: bool = False
+) -> Dict[str, Any]:
+    """
+    creates the partitions, and with relocate,
+    swaps the location of those which exist to the given one
+    """
+    with _timed("lambda.glue_add_partitions") as counters:
+        result = _glue().batch_create_partition(**params)
+        counters["partitions"] = len(params["PartitionInputList"])
+        counters["retries"] = _retries(result)
+        if relocate:
+            existing = {
+                tuple(error["PartitionValues"])
+                for error in result.get("Errors", [])
+                if error["ErrorDetail"]["ErrorCode"] == "AlreadyExistsException"
+            }
+            moves = [
+                {"PartitionValueList": p["Values"], "PartitionInput": p}
+                for p in params["PartitionInputList"]
+                if tuple(p["Values"]) in existing
+            ]
+            result["Errors"] = [
+                error
+                for error in result.get("Errors", [])
+                if tuple(error["PartitionValues"]) not in existing
+            ] + _glue_update_partitions(params, moves)
+            counters["relocated"] = len(moves)
+    return result
+
+
+def _glue_update_partitions(
+    params: Lambda_params, moves: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    errors = []
+    for i in range(0, len(moves), GLUE_UPDATE_BATCH):
+        response = _glue().batch_update_partition(
+            DatabaseName=params["DatabaseName"],
+            TableName=params["TableName"],
+            Entries=moves[i : i + GLUE_UPDATE_BATCH],  # noqa: E203
+        )
+        errors.extend(response.get("Errors", []))
+    return errors
+
+
+def _partition_locations(bucket: str, table: str = None) -> Tuple[str, ...]:
+    """key prefixes of the locations of the partitions of the 'db.table'"""
+    if not table:
+        return ()
+    db, name = table.split(".", 1)
+    root = f"s3://{bucket}/"
+    locations = []
+    pages = _glue().get_paginator("get_partitions")
+    for page in pages.paginate(DatabaseName=db, TableName=name):
+        for partition in page["Partitions"]:
+            location = partition["StorageDescriptor"]["Location"]
+            if location.startswith(root):
+                locations.append(location[len(root) :].rstrip("/") + "/")  # noqa: E203
+    return tuple(locations)
+
+
+def _s3_delete(bucket: str, keys: Sequence[str]) -> None:
+    for i in range(0, len(keys), S3_DELETE_BATCH):
+        batch = keys[i : i + S3_DELETE_BATCH]  # noqa: E203
+        _s3().delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
+
+
+def _projected_response() -> Dict[str, Any]:
+    return {"ResponseMetadata": {"HTTPStatusCode": 200}, "Errors": []}
+
+
+def _retries(response: Dict[str, Any]) -> int:
+    return response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+
+def _manifest_bytes(partitions: Dict[str, List[Dict[str, Any]]]) -> int:
+    return sum(entry["size"] for entries in partitions.values() for entry in entries)
+
+
+def _update_manifest(
+    key: str,
+    partitions: Dict[str, List[Dict[str, Any]]],
+    hashes: Dict[str, str] = None,
+) -> None:
+    """
+    merges the committed files, and the content hashes of their partitions,
+    into the manifest at key,
+    conditional on it being unchanged since read, retrying on conflicts
+    """
+    with _timed("lambda.manifest") as counters:
+        for entries in partitions.values():
+            for entry in entries:
+                head = _s3().head_object(Bucket=S3_BUCKET, Key=entry["key"])
+                entry["etag"] = head["ETag"]
+                counters["files"] = counters.get("files", 0) + 1
+
+        for attempt in range(MANIFEST_WRITE_ATTEMPTS):
+            counters["retries"] = attempt
+            manifest, etag = _get_manifest(key)
+            _merge_manifest(manifest, partitions, hashes or {})
+            try:
+                _put_json(key, manifest, etag)
+                logging.info(f"Updated manifest {key} with {list(partitions)}")
+                return
+            except ClientError as ex:
+                if not _write_conflict(ex):
+                    raise
+
+    raise RuntimeError(f"Gave up updating contended manifest {key}")
+
+
+def _manifest_keys(key: str) -> Set[str]:
+    manifest, _ = _get_manifest(key)
+    entries = [
+        entry
+        for partition in manifest[PARTITIONS_KEY].values()
+        for entry in partition[FILES_KEY]
+    ]
+    # and the bloom filter sidecars of the files
+    blooms = {entry["bloom"]["key"] for entry in entries if "bloom" in entry}
+    return {entry["key"] for entry in entries} | blooms
+
+
+def _get_manifest(key: str) -> Tuple[Dict[str, Any], str]:
+    try:
+        response = _s3().get_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] == "NoSuchKey":
+            return {PARTITIONS_KEY: {}}, ""
+        raise
+    return json.loads(response["Body"].read()), response["ETag"]
+
+
+def _put_json(key: str, body: Dict[str, Any], etag: str) -> None:
+    # create only if absent, else overwrite only the version read
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    _s3().put_object(
+        Bucket=S3_BUCKET,
+        Key=key,
+        Body=json.dumps(body),
+        ContentType="application/json; charset=utf-8",
+        **condition,
+    )
+
+
+def _write_conflict(ex: ClientError) -> bool:
+    return ex.response["Error"]["Code"] in WRITE_CONFLICT_CODES
+
 
-    logging.info(f"Copied {stage} to {prod}")
+def _merge_manifest(
+    manifest: Dict[str, Any],
+    partitions: Dict[str, List[Dict[str, Any]]],
+    hashes: Dict[str, str],
+) -> None:
+    for name, entries in partitions.items():
+        partition = manifest[PARTITIONS_KEY].setdefault(name, {FILES_KEY: []})
+        if name in hashes:
+            # the upload holds the whole partition, which now points to its files
+            partition[FILES_KEY] = entries
+            partition[HASH_KEY] = hashes[name]
+        else:
+            keys = {entry["key"] for entry in entries}
+            kept = [f for f in partition[FILES_KEY] if f["key"] not in keys]
+            partition[FILES_KEY] = kept + entries
 
 
 def _http_ok(response: Dict[str, Any]) -> bool:
@@ -175,6 +607,8 @@ def _query_results(query_id: str) -> Dict[str, Any]:
         QUERY_STATUS_KEY: query_status,
         S3_PATH_KEY: status_response.get(S3_PATH_KEY),
         SCHEMA_KEY: metadata_response.get(SCHEMA_KEY),
+        QUERY_KEY: status_response.get(QUERY_KEY),
+        STATISTICS_KEY: status_response.get(STATISTICS_KEY),
     }
 
 
@@ -182,16 +616,23 @@ def _query_success(status: str) -> bool:
     return "SUCCEEDED" == status
 
 
-def _query_status(query_id: str) -> Dict[str, str]:
-    response = _athena().get_query_execution(QueryExecutionId=query_id)
+def _query_status(query_id: str) -> Dict[str, Any]:
+    with _timed("lambda.athena_status") as counters:
+        response = _athena().get_query_execution(QueryExecutionId=query_id)
+        statistics = response.get("QueryExecution", {}).get("Statistics", {})
+        counters["queue_ms"] = statistics.get("QueryQueueTimeInMillis", 0)
+        counters["engine_ms"] = statistics.get("EngineExecutionTimeInMillis", 0)
+        counters["retries"] = _retries(response)
 
     logging.info(response)
     if _http_ok(response):
+        execution = response["QueryExecution"]
         return {
-            QUERY_STATUS_KEY: response["QueryExecution"]["Status"]["State"],
-            S3_PATH_KEY: response["QueryExecution"]["ResultConfiguration"][
-                "OutputLocation"
-            ],
+            QUERY_STATUS_KEY: execution["Status"]["State"],
+            S3_PATH_KEY: execution["ResultConfiguration"]["OutputLocation"],
+            QUERY_KEY: execution.get("Query"),
+            # bytes scanned, engine, queue, planning and processing millis
+            STATISTICS_KEY: statistics,
         }
     else:
         return _error_response(response)
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+# Load test of the feature server, start it first with
+#   featurestore-serve --port 8080 --db /tmp/featurestore-online.db
+# then
+#   python3 samples/serving_load.py --fg business_user_activity_v0001 --keys u1 u2
+
+import argparse
+import asyncio
+import random
+import time
+
+from featurestore.clients import codec
+
+
+async def _client(host, port, fg, keys, batch, deadline, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    while time.perf_counter() < deadline:
+        body = codec.encode({"fgs": [fg], "keys": random.sample(keys, batch)})
+        head = (
+            "POST /features HTTP/1.1\r\n"
+            "Content-Type: application/x-featurestore\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        started = time.perf_counter()
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            if line.lower().startswith("content-length"):
+                length = int(line.split(":")[1])
+        codec.decode(await reader.readexactly(length))
+        latencies.append(time.perf_counter() - started)
+    writer.close()
+
+
+async def _run(args):
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+    batch = min(args.batch, len(args.keys))
+    await asyncio.gather(
+        *[
+            _client(
+                args.host, args.port, args.fg, args.keys, batch, deadline, latencies
+            )
+            for _ in range(args.concurrency)
+        ]
+    )
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fg", required=True)
+    parser.add_argument("--keys", nargs="+", required=True)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    latencies = sorted(asyncio.run(_run(args)))
+    count = len(latencies)
+    print(f"requests    : {count}")
+    if not count:
+        print("no request completed, is the server up?")
+        return
+    print(f"throughput  : {count / args.duration:.0f} req/s")
+    print(f"p50 latency : {latencies[count // 2] * 1000:.3f} ms")
+    print(f"p99 latency : {latencies[int(count * 0.99)] * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
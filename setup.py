@@ -5,8 +5,15 @@ setup(
     version="0.1.3",
     packages=["featurestore/clients"],
     include_package_data=True,
-    python_requires="~=3.5",
-    install_requires=["boto3", "botocore", "pandas", "pytz", "pyspark"],
+    python_requires=">=3.7",
+    install_requires=["boto3", "botocore", "pandas", "pyarrow", "pytz", "pyspark"],
+    extras_require={"zstd": ["zstandard"], "local": ["duckdb"]},
+    entry_points={
+        "console_scripts": [
+            "featurestore-serve=featurestore.clients.serving:main",
+            "featurestore-backfill=featurestore.clients.backfill:main",
+        ]
+    },
     description="A python sdk to create and upload Feature-Groups within AWS",
     url="https://github.com/saswata-dutta/aws-feature-store",
     author="Saswata Dutta",
@@ -0,0 +1,40 @@
+import pyarrow as pa
+import pytest
+
+from featurestore.clients import arrow_utils
+
+
+def test_hive_schema():
+    arrow_schema = pa.schema(
+        [
+            ("User Id", pa.int64()),
+            ("score", pa.float32()),
+            ("name", pa.dictionary(pa.int32(), pa.string())),
+            ("amount", pa.decimal128(12, 2)),
+            ("ts", pa.timestamp("ms")),
+            ("tags", pa.list_(pa.string())),
+            ("attrs", pa.map_(pa.string(), pa.int32())),
+            ("point", pa.struct([("x", pa.float64()), ("y", pa.float64())])),
+        ]
+    )
+
+    assert arrow_utils.hive_schema(arrow_schema) == {
+        "user_id": "bigint",
+        "score": "float",
+        "name": "string",
+        "amount": "decimal(12,2)",
+        "ts": "timestamp",
+        "tags": "array<string>",
+        "attrs": "map<string,int>",
+        "point": "struct<x:double,y:double>",
+    }
+
+
+def test_hive_schema_duplicate_after_sanitise():
+    with pytest.raises(AssertionError):
+        arrow_utils.hive_schema(pa.schema([("a b", pa.int8()), ("a_b", pa.int8())]))
+
+
+def test_hive_type_unsupported():
+    with pytest.raises(ValueError):
+        arrow_utils.hive_type(pa.time32("s"))
@@ -0,0 +1,51 @@
+from featurestore.clients import asof_utils
+
+REF = asof_utils.FeatureRef("cli", "app", "user", "v1", "uid", ["score"], 3600)
+
+# 2019-07-13 00:00:00 IST
+DAY_START = 1562956200
+
+
+def test_feature_alias():
+    assert asof_utils.feature_alias(REF, "score") == "user_v1__score"
+
+
+def test_finer_unit():
+    assert asof_utils.finer_unit("s", "ms") == "ms"
+    assert asof_utils.finer_unit("ns", "us") == "ns"
+
+
+def test_scaled():
+    assert asof_utils.scaled("t.ts", "s", "ms") == "(t.ts * 1000)"
+    assert asof_utils.scaled("t.ts", "ms", "ms") == "t.ts"
+
+
+def test_asof_query():
+    resolved = [(REF, "feature_store.cli_app_user_v1", "ets", "s")]
+    query = asof_utils.asof_query(
+        "stage.spine", "ts", "ms", (DAY_START, DAY_START + 60), resolved
+    )
+
+    assert query == (
+        "WITH spine AS (SELECT * FROM stage.spine),\n"
+        "f0 AS (SELECT s.spine_row_id, t.score, row_number() OVER ("
+        "PARTITION BY s.spine_row_id ORDER BY (t.ets * 1000) DESC) AS asof_rank"
+        " FROM spine s JOIN feature_store.cli_app_user_v1 t ON s.uid = t.uid"
+        " WHERE (t.y = '2019' AND t.m = '07' AND t.d BETWEEN '12' AND '13')"
+        " AND (t.ets * 1000) <= s.ts AND (t.ets * 1000) > s.ts - 3600000)\n"
+        "SELECT spine.*, f0.score AS user_v1__score FROM spine\n"
+        "LEFT JOIN f0 ON spine.spine_row_id = f0.spine_row_id AND f0.asof_rank = 1;"
+    )
+
+
+def test_asof_query_unbounded_age():
+    ref = REF._replace(max_age_secs=None)
+    resolved = [(ref, "feature_store.cli_app_user_v1", "ets", "s")]
+    query = asof_utils.asof_query(
+        "stage.spine", "ts", "s", (DAY_START, DAY_START + 60), resolved
+    )
+
+    assert (
+        "WHERE (t.y < '2019' OR (t.y = '2019' AND t.m < '07')"
+        " OR (t.y = '2019' AND t.m = '07' AND t.d <= '13')) AND t.ets <= s.ts)"
+    ) in query
@@ -1,3 +1,6 @@
+import gzip
+import io
+
 from featurestore.clients import aws_glue
 
 
@@ -8,3 +11,100 @@ def test_extract_y_m_d():
     assert data_folder == "s3://bucket/a/b/c/d/"
     assert partition_folder == "s3://bucket/a/b/c/d/y=2019/m=01/d=21/"
     assert ymd == ["2019", "01", "21"]
+
+
+def test_create_table_params_csv():
+    params = aws_glue.create_table_params(
+        "db", "tbl", "s3://bucket/a/", {"id": "bigint"}, data_format="csv"
+    )
+
+    table = params["TableInput"]
+    assert table["Parameters"] == {"skip.header.line.count": "1"}
+    assert table["StorageDescriptor"]["Columns"] == [{"Name": "id", "Type": "bigint"}]
+    assert table["StorageDescriptor"]["Parameters"]["classification"] == "csv"
+
+
+def test_create_table_params_projection():
+    projection = aws_glue.projection_properties("s3://bucket/a/", (2019, 2021))
+    params = aws_glue.create_table_params(
+        "db", "tbl", "s3://bucket/a/", {"id": "bigint"}, projection=projection
+    )
+
+    props = params["TableInput"]["Parameters"]
+    assert props["projection.enabled"] == "true"
+    assert props["projection.y.range"] == "2019,2021"
+    assert props["projection.d.digits"] == "2"
+    assert props["storage.location.template"] == "s3://bucket/a/y=${y}/m=${m}/d=${d}/"
+    assert params["TableInput"]["PartitionKeys"] == aws_glue.PARTITION_KEYS
+
+
+def test_discover_partitions(monkeypatch):
+    tree = {
+        "root/": ["root/y=2019/", "root/y=2020/", "root/_tmp/"],
+        "root/y=2019/": ["root/y=2019/m=12/"],
+        "root/y=2020/": ["root/y=2020/m=01/", "root/y=2020/m=02/"],
+        "root/y=2019/m=12/": ["root/y=2019/m=12/d=31/"],
+        "root/y=2020/m=01/": ["root/y=2020/m=01/d=02/", "root/y=2020/m=01/d=01/"],
+        "root/y=2020/m=02/": [],
+    }
+    monkeypatch.setattr(aws_glue.aws_s3, "ls_prefixes", lambda _, p: iter(tree[p]))
+
+    result = aws_glue.discover_partitions("bucket", "root/", max_workers=4)
+
+    assert result == [
+        "root/y=2019/m=12/d=31/",
+        "root/y=2020/m=01/d=01/",
+        "root/y=2020/m=01/d=02/",
+    ]
+
+
+def test_add_partitions_batches_in_order(monkeypatch):
+    calls = []
+
+    class FakeGlue:
+        def batch_create_partition(self, **params):
+            calls.append(len(params["PartitionInputList"]))
+            return {"Errors": [], "first": params["PartitionInputList"][0]["Values"]}
+
+    monkeypatch.setattr(aws_glue, "_glue", lambda: FakeGlue())
+    paths = [f"s3://b/t/y=2019/m=01/d={d:02d}/" for d in range(1, 31)] * 7
+
+    responses = aws_glue.add_partitions("db", "tbl", paths, max_workers=3)
+
+    assert sorted(calls) == [12, 99, 99]
+    firsts = [r["first"][2] for r in responses]
+    assert firsts == ["01", "10", "19"]
+
+
+def test_register_table_compressed_csv(monkeypatch):
+    body = gzip.compress(b"id,name\n1,a\n2,b\n")
+    created = []
+    monkeypatch.setattr(aws_glue.aws_s3, "get_stream", lambda b, k: io.BytesIO(body))
+    monkeypatch.setattr(
+        aws_glue, "create_table", lambda *args, **kwargs: created.append((args, kwargs))
+    )
+
+    aws_glue.register_table("db", "tbl", "s3://bucket/a/y=2019/m=01/d=21/x.csv.gz")
+
+    ((args, kwargs),) = created
+    assert args == ("db", "tbl", "s3://bucket/a/", {"id": "bigint", "name": "string"})
+    assert kwargs == {"data_format": aws_glue.FORMAT_CSV}
+
+
+def test_register_table_passes_schema_hint(monkeypatch):
+    hint = [{"Name": "id", "Type": "bigint"}]
+    reads, created = [], []
+    monkeypatch.setattr(
+        aws_glue.spark_utils, "read", lambda path, schema: reads.append(schema)
+    )
+    monkeypatch.setattr(aws_glue.spark_utils, "get_schema", lambda df: {"id": "bigint"})
+    monkeypatch.setattr(
+        aws_glue, "create_table", lambda *args, **kwargs: created.append(args)
+    )
+
+    aws_glue.register_table(
+        "db", "tbl", "s3://bucket/a/y=2019/m=01/d=21/x.csv", True, hint
+    )
+
+    assert reads == [hint]
+    assert created == [("db", "tbl", "s3://bucket/a/", {"id": "bigint"})]
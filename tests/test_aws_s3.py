@@ -1,3 +1,5 @@
+import threading
+
 from featurestore.clients import aws_s3
 
 
@@ -7,3 +9,70 @@ def test_parse_url():
 
     assert bucket == "bucket"
     assert key == "a/b/c/d/y=2019/m=01/d=21/some.file"
+
+
+def _page(*keys):
+    return {
+        "Contents": [
+            {"Key": k, "Size": 1, "ETag": k, "LastModified": None} for k in keys
+        ]
+    }
+
+
+def test_iter_objects_is_lazy(monkeypatch):
+    fetched = []
+
+    def pages(bucket, prefix, start_after, delimiter):
+        for page in [_page("a/", "a/1", "a/2"), _page("a/3")]:
+            fetched.append(page)
+            yield page
+
+    monkeypatch.setattr(aws_s3, "_pages", pages)
+
+    objects = aws_s3.iter_objects("bucket", "a/")
+
+    assert next(objects) == aws_s3.S3Object("a/1", 1, "a/1", None)
+    assert len(fetched) == 1
+    assert [x.key for x in objects] == ["a/2", "a/3"]
+
+
+def test_iter_sharded(monkeypatch):
+    shards = {
+        "y=2019/": [_page("y=2019/1")],
+        "y=2020/": [_page("y=2020/1", "y=2020/2")],
+    }
+    monkeypatch.setattr(aws_s3, "_pages", lambda b, prefix, s, d: iter(shards[prefix]))
+
+    keys = [x.key for x in aws_s3.iter_sharded("bucket", list(shards))]
+
+    assert sorted(keys) == ["y=2019/1", "y=2020/1", "y=2020/2"]
+
+
+def test_exists_lists_one_key(monkeypatch):
+    calls = []
+
+    class Client:
+        def list_objects_v2(self, **params):
+            calls.append(params)
+            return {"KeyCount": 1 if params["Prefix"] == "a/" else 0}
+
+    monkeypatch.setattr(aws_s3, "_client", Client)
+
+    assert aws_s3.exists("bucket", "a/")
+    assert not aws_s3.exists("bucket", "b/")
+    assert calls[0] == {"Bucket": "bucket", "Prefix": "a/", "MaxKeys": 1}
+
+
+def test_s3_resource_per_thread():
+    def resource_twice():
+        return aws_s3._s3(), aws_s3._s3()
+
+    main = resource_twice()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(resource_twice()))
+    thread.start()
+    thread.join()
+
+    assert main[0] is main[1]
+    assert other[0][0] is other[0][1]
+    assert main[0] is not other[0][0]
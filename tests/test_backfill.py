@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pandas as pd
+
+from featurestore.clients import backfill, schema_utils
+
+FG_SCHEMA = {
+    "ts": "bigint",
+    schema_utils.SCHEMA_TIME_COL: "ts",
+    schema_utils.SCHEMA_TIME_UNIT: "s",
+}
+
+
+def _day_df(day: date) -> pd.DataFrame:
+    # noon UTC is within the same IST day
+    noon = int(pd.Timestamp(day).tz_localize("UTC").timestamp()) + 12 * 3600
+    return pd.DataFrame({"day": [day.isoformat()], "ts": [noon]})
+
+
+def test_token_bucket_limits_rate():
+    now, sleeps = [0.0], []
+
+    def sleep(secs):
+        sleeps.append(secs)
+        now[0] += secs
+
+    bucket = backfill.TokenBucket(2.0, clock=lambda: now[0], sleep=sleep)
+    for _ in range(5):
+        bucket.acquire()
+
+    # the first is the initial burst, the rest wait half a second each
+    assert sleeps == [0.5] * 4
+    assert now[0] == 2.0
+
+
+def test_day_tasks():
+    assert backfill.day_tasks(date(2020, 2, 28), date(2020, 3, 1)) == [
+        "2020-02-28",
+        "2020-02-29",
+        "2020-03-01",
+    ]
+
+
+def test_backfill_resumes_from_state(tmp_path, monkeypatch):
+    state_path = str(tmp_path / "state.json")
+    backfill.save_state(state_path, {"done": ["2020-01-01"], "failed": []})
+    uploads = []
+
+    def upload_fg(client, app, entity, version, df):
+        uploads.append(df["day"][0])
+        return df["day"][0] != "2020-01-03", {}
+
+    monkeypatch.setattr(backfill.fg, "upload_fg", upload_fg)
+    monkeypatch.setattr(backfill.fg, "read_schema", lambda *ref: FG_SCHEMA)
+    monkeypatch.setattr(backfill, "_executor", ThreadPoolExecutor)
+    load = backfill.day_loader(_day_df)
+    tasks = backfill.day_tasks(date(2020, 1, 1), date(2020, 1, 4))
+
+    result = backfill.backfill(
+        "c", "a", "e", "v1", tasks, load, state_path, 2, uploads_per_sec=1000
+    )
+
+    assert sorted(uploads) == ["2020-01-02", "2020-01-03", "2020-01-04"]
+    assert sorted(result.uploaded) == ["2020-01-02", "2020-01-04"]
+    assert result.skipped == ["2020-01-01"]
+    assert result.failed == ["2020-01-03"]
+    assert backfill.load_state(state_path) == {
+        "done": ["2020-01-01", "2020-01-02", "2020-01-04"],
+        "failed": ["2020-01-03"],
+    }
+
+
+def test_file_tasks_group_partition_folders(tmp_path):
+    day_dir = tmp_path / "dt=2020-01-01"
+    day_dir.mkdir()
+    pd.DataFrame({"ts": [1]}).to_parquet(day_dir / "part-0.parquet", index=False)
+    pd.DataFrame({"ts": [2]}).to_parquet(day_dir / "part-1.parquet", index=False)
+    pd.DataFrame({"ts": [3]}).to_csv(tmp_path / "2020-01-02.csv", index=False)
+
+    tasks = backfill.file_tasks(str(tmp_path))
+
+    assert tasks == [str(tmp_path / "2020-01-02.csv"), str(day_dir)]
+    assert sorted(backfill.read_file(str(day_dir))["ts"]) == [1, 2]
+
+
+def test_backfill_fails_tasks_sharing_a_day(tmp_path, monkeypatch):
+    uploads = []
+    monkeypatch.setattr(
+        backfill.fg, "upload_fg", lambda *ref_df: uploads.append(ref_df) or (True, {})
+    )
+    monkeypatch.setattr(backfill.fg, "read_schema", lambda *ref: FG_SCHEMA)
+    monkeypatch.setattr(backfill, "_executor", ThreadPoolExecutor)
+    files = {"a.csv": date(2020, 1, 1), "b.csv": date(2020, 1, 1)}
+
+    result = backfill.backfill(
+        "c",
+        "a",
+        "e",
+        "v1",
+        sorted(files),
+        lambda task: _day_df(files[task]),
+        str(tmp_path / "state.json"),
+        1,
+        uploads_per_sec=1000,
+    )
+
+    assert result.uploaded == ["a.csv"]
+    assert result.failed == ["b.csv"]
+    assert len(uploads) == 1
@@ -0,0 +1,25 @@
+from featurestore.clients import bloom
+
+
+def test_no_false_negatives_and_few_false_positives():
+    keys = range(0, 20000, 2)
+    keys_bloom = bloom.BloomFilter.of(keys, fp_rate=0.01)
+
+    assert all(keys_bloom.might_contain(key) for key in keys)
+    false_positives = sum(keys_bloom.might_contain(key) for key in range(1, 20000, 2))
+    assert false_positives < 200
+
+
+def test_round_trips_as_bytes():
+    keys_bloom = bloom.BloomFilter.of(["u1", "u2"])
+
+    decoded = bloom.BloomFilter.from_bytes(keys_bloom.to_bytes())
+
+    assert decoded.bits == keys_bloom.bits
+    assert decoded.might_contain("u1") and decoded.might_contain("u2")
+
+
+def test_bucket_is_stable():
+    assert bloom.bucket(7, 8) == bloom.bucket("7", 8) == bloom.bucket(7.0, 8)
+    assert bloom.bucket("u1", 8) == 3
+    assert sorted({bloom.bucket(key, 4) for key in range(100)}) == [0, 1, 2, 3]
@@ -0,0 +1,51 @@
+import pytest
+
+from featurestore.clients import aws_s3, catalog
+
+LAYOUT = {
+    "feature_store/": ["cli/"],
+    "feature_store/cli/": ["app/", "app2/"],
+    "feature_store/cli/app/": ["user/"],
+    "feature_store/cli/app2/": ["txn/"],
+}
+# a version exists only once its schema.json does
+FILES = {
+    "feature_store/cli/app/user/schema/": [
+        "v10/schema.json",
+        "v2/schema.json",
+        "v1/schema.json",
+        "v3/partial.json",
+    ],
+}
+
+
+@pytest.fixture
+def layout(monkeypatch):
+    def ls_prefixes(bucket, prefix):
+        return iter([prefix + it for it in LAYOUT.get(prefix, [])])
+
+    def ls_files(bucket, prefix):
+        return [prefix + it for it in FILES.get(prefix, [])]
+
+    monkeypatch.setattr(aws_s3, "ls_prefixes", ls_prefixes)
+    monkeypatch.setattr(aws_s3, "ls_files", ls_files)
+    yield
+    catalog._index.clear()
+
+
+def test_natural_key():
+    versions = ["v10", "v2", "v0001", "1.10", "1.9"]
+
+    result = sorted(versions, key=catalog.natural_key)
+
+    assert result == ["1.9", "1.10", "v0001", "v2", "v10"]
+
+
+def test_list_feature_groups(layout):
+    assert catalog.list_feature_groups(refresh=True) == [("cli", "app", "user")]
+
+
+def test_list_versions(layout):
+    assert catalog.list_versions("cli", "app", "user") == ["v1", "v2", "v10"]
+    assert catalog.latest_version("cli", "app", "user") == "v10"
+    assert catalog.latest_version("cli", "app2", "txn") is None
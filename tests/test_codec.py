@@ -0,0 +1,24 @@
+from featurestore.clients import codec
+
+
+def _roundtrip(value):
+    return codec.decode(codec.encode(value))
+
+
+def test_scalars():
+    for value in [None, True, False, 0, 1, -1, 2**70, -(2**70), 1.5, "héllo"]:
+        assert _roundtrip(value) == value
+
+
+def test_nested():
+    value = {"ids": [1, -2, 3], "attrs": {"a": "x", "b": None}, "raw": b"\x00\x01"}
+    assert _roundtrip(value) == value
+
+
+def test_tuple_decodes_as_list():
+    assert _roundtrip((1, "a")) == [1, "a"]
+
+
+def test_compact_small_ints():
+    assert len(codec.encode(63)) == 2
+    assert len(codec.encode([1, 2, 3])) == 8
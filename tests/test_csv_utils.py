@@ -0,0 +1,22 @@
+from featurestore.clients import arrow_utils, csv_utils
+
+
+def test_sample_schema_drops_partial_line():
+    sample = b"id,score,name,ts\n1,2.5,a,2019-07-13 10:00:00\n2,3.5,b,2019-07-1"
+
+    schema = arrow_utils.hive_schema(csv_utils.sample_schema(sample))
+
+    assert schema == {
+        "id": "bigint",
+        "score": "double",
+        "name": "string",
+        "ts": "timestamp",
+    }
+
+
+def test_sample_schema_complete_file():
+    sample = b"id,flag\n1,true\n2,"
+
+    schema = arrow_utils.hive_schema(csv_utils.sample_schema(sample, complete=True))
+
+    assert schema == {"id": "bigint", "flag": "boolean"}
@@ -0,0 +1,263 @@
+import pandas as pd
+import pytest
+
+from featurestore.clients import fg
+
+
+def test_content_hash():
+    df = pd.DataFrame({"id": [1, 2], "tags": [["a"], ["b", "c"]]})
+
+    assert fg._content_hash(df) == fg._content_hash(df.copy())
+    assert fg._content_hash(df) != fg._content_hash(df.iloc[::-1])
+    assert fg._content_hash(df) != fg._content_hash(df.rename(columns={"id": "k"}))
+
+
+def test_assert_folder_absent_allows_retries(monkeypatch):
+    metas = {"p/a.parquet": {fg.CONTENT_HASH_META: "h1"}}
+    monkeypatch.setattr(fg.aws_s3, "ls_files", lambda bucket, prefix: list(metas))
+    monkeypatch.setattr(fg.aws_s3, "metadata", lambda bucket, key: metas[key])
+    monkeypatch.setattr(fg.aws_s3, "exists", lambda bucket, prefix: bool(metas))
+
+    fg._assert_folder_absent_s3("bucket", "p/", "h1")
+    with pytest.raises(AssertionError):
+        fg._assert_folder_absent_s3("bucket", "p/", "h2")
+    with pytest.raises(AssertionError):
+        fg._assert_folder_absent_s3("bucket", "p/")
+
+
+def test_upload_fg_skips_committed_partitions(monkeypatch):
+    df = pd.DataFrame({"id": [1, 2], "ts": [1561939200, 1561939201]})
+    part = fg._groupby_time(df, "ts", "s")
+    (suffix,) = part.groups
+    committed = {
+        "partitions": {suffix: {"hash": fg._content_hash(part.get_group(suffix))}}
+    }
+    schema = {
+        "id": "bigint",
+        "ts": "bigint",
+        "__time_col__": "ts",
+        "__time_col_unit__": "s",
+    }
+
+    monkeypatch.setattr(
+        fg, "_get_pandas_schema", lambda _: {"id": "bigint", "ts": "bigint"}
+    )
+    monkeypatch.setattr(fg, "_download_schema", lambda *_: schema)
+    monkeypatch.setattr(fg, "read_manifest", lambda *_: committed)
+    monkeypatch.setattr(fg, "_upload_df", None)
+    monkeypatch.setattr(fg, "_invoke_lambda", None)
+
+    success, _ = fg.upload_fg("c", "a", "e", "v1", df)
+
+    assert success
+
+
+def _patch_upload_many(monkeypatch, schemas):
+    invocations = []
+
+    def invoke(action, args):
+        invocations.append((action, args))
+        statuses = {
+            upload[fg.NAME_KEY]: {fg.STATUS_KEY: fg.STATUS_OK}
+            for upload in args[fg.UPLOADS_KEY]
+        }
+        return True, {fg.STATUS_KEY: fg.STATUS_OK, fg.PAYLOAD_KEY: statuses}
+
+    monkeypatch.setattr(
+        fg, "_get_pandas_schema", lambda _: {"id": "bigint", "ts": "bigint"}
+    )
+    monkeypatch.setattr(
+        fg,
+        "_download_schema",
+        lambda c, a, entity, v: dict(
+            schemas[entity], __time_col__="ts", __time_col_unit__="s"
+        ),
+    )
+    monkeypatch.setattr(fg, "read_manifest", lambda *_: None)
+    monkeypatch.setattr(
+        fg,
+        "_upload_df",
+        lambda _df, c, a, e, v, suffix, *_, **__: ([(f"stage/{e}", f"prod/{e}")], []),
+    )
+    monkeypatch.setattr(fg, "_invoke_lambda_args", invoke)
+    return invocations
+
+
+def test_upload_many_commits_in_one_invocation(monkeypatch):
+    df = pd.DataFrame({"id": [1, 2], "ts": [1561939200, 1561939201]})
+    invocations = _patch_upload_many(
+        monkeypatch,
+        {
+            "e1": {"id": "bigint", "ts": "bigint"},
+            "e2": {"id": "string", "ts": "bigint"},
+        },
+    )
+
+    e1, e2 = ("c", "a", "e1", "v1"), ("c", "a", "e2", "v1")
+    results = fg.upload_many([(e1, df), (e2, df)])
+
+    assert results[e1][0] and not results[e2][0]
+    ((action, args),) = invocations
+    assert action == fg.ACTION_UPLOAD_MANY
+    (upload,) = args[fg.UPLOADS_KEY]
+    assert upload[fg.NAME_KEY] == fg.table_name(*e1)
+    assert upload[fg.PATHS_KEY] == [("stage/e1", "prod/e1")]
+    assert fg.upload_many([(e1, df), (e1, df)]) == {e1: (False, {})}
+
+
+def test_upload_many_splits_payloads_over_the_limit(monkeypatch):
+    df = pd.DataFrame({"id": [1, 2], "ts": [1561939200, 1561939201]})
+    entities = ["e1", "e2", "e3"]
+    invocations = _patch_upload_many(
+        monkeypatch, {e: {"id": "bigint", "ts": "bigint"} for e in entities}
+    )
+    refs = [("c", "a", e, "v1") for e in entities]
+    assert all(ok for ok, _ in fg.upload_many([(r, df) for r in refs]).values())
+    ((_, args),) = invocations
+    sizes = [len(fg.json_ser(upload)) for upload in args[fg.UPLOADS_KEY]]
+    invocations.clear()
+
+    # room for two FGs' commits per invocation, not three
+    monkeypatch.setattr(fg, "UPLOAD_MANY_MAX_PAYLOAD_BYTES", sum(sizes[:2]))
+    results = fg.upload_many([(r, df) for r in refs])
+
+    assert all(ok for ok, _ in results.values())
+    assert [
+        [upload[fg.NAME_KEY] for upload in args[fg.UPLOADS_KEY]]
+        for _, args in invocations
+    ] == [[fg.table_name(*r) for r in refs[:2]], [fg.table_name(*refs[2])]]
+
+
+def test_upload_df_copy_free_writes_commit_folder(tmp_path, monkeypatch):
+    df = pd.DataFrame({"id": [1, 2], "ts": [1561939200, 1561939201]})
+    pq = str(tmp_path / "part-0.parquet")
+    df.to_parquet(pq)
+    uploaded = []
+
+    class S3Obj:
+        def __init__(self, bucket, key):
+            self.bucket, self.key = bucket, key
+
+        def upload_file(self, path, ExtraArgs):
+            uploaded.append((self.bucket, self.key))
+
+    monkeypatch.setattr(fg, "_assert_folder_absent_s3", lambda *_: None)
+    monkeypatch.setattr(fg, "_encode_parquet", lambda *_: [(None, pq)])
+    monkeypatch.setattr(fg.aws_s3, "metadata", lambda bucket, key: None)
+    monkeypatch.setattr(fg.aws_s3, "handle", S3Obj)
+
+    suffix = "y=2019/m=07/d=01"
+    paths, entries = fg._upload_df(
+        df, "c", "a", "e", "v1", suffix, "ts", {}, None, "h" * 64, copy_free=True
+    )
+
+    prefix = f"{fg.S3_ROOT}/c/a/e/data/v1/_commits/{'h' * 64}/{suffix}"
+    assert paths == []
+    assert uploaded == [(fg.S3_BUCKET, f"{prefix}/{'h' * 16}-00000.parquet")]
+    assert [entry["key"] for entry in entries] == [uploaded[0][1]]
+
+    params = fg._glue_add_partition_params(
+        "c", "a", "e", "v1", [suffix], {"id": "bigint"}, {suffix: "h" * 64}
+    )
+    (partition,) = params["PartitionInputList"]
+    assert (
+        partition["StorageDescriptor"]["Location"] == f"s3://{fg.S3_BUCKET}/{prefix}/"
+    )
+
+
+def test_partition_prefixes_skip_commits(monkeypatch):
+    prefix = fg.data_prefix("c", "a", "e", "v1")
+    folders = [f"{prefix}_commits/", f"{prefix}y=2019/", f"{prefix}y=2020/"]
+    monkeypatch.setattr(fg.aws_s3, "ls_prefixes", lambda bucket, p: folders)
+
+    assert fg.partition_prefixes("c", "a", "e", "v1") == folders[1:]
+
+
+def test_evolve_fg_updates_metadata_only(monkeypatch):
+    schema = {"id": "bigint", "ts": "bigint", "__time_col__": "ts"}
+    staged, invocations = [], []
+    monkeypatch.setattr(fg, "_download_schema", lambda *_: schema)
+    monkeypatch.setattr(fg, "_upload_schema", lambda s, obj: staged.append(s))
+    monkeypatch.setattr(
+        fg, "_invoke_lambda", lambda *args: invocations.append(args) or (True, {})
+    )
+
+    success, _ = fg.evolve_fg("c", "a", "e", "v1", {"Score Now": "double"})
+
+    assert success
+    ((action, params, evolved, paths),) = invocations
+    assert action == fg.ACTION_EVOLVE
+    assert params["Columns"] == [{"Name": "score_now", "Type": "double"}]
+    assert staged == [evolved] and evolved["score_now"] == "double"
+    ((_, prod_path),) = paths
+    assert prod_path == fg._s3_schema_path(fg.S3_ROOT, "c", "a", "e", "v1")
+
+
+def test_athena_asof_join_keeps_spine_until_query_ends(monkeypatch):
+    events = []
+    statuses = iter(["RUNNING", "RUNNING", "SUCCEEDED"])
+
+    class S3Obj:
+        def __init__(self, bucket, key):
+            self.key = key
+
+        def delete(self):
+            events.append(("delete_spine", self.key))
+
+    monkeypatch.setattr(fg, "_upload_spine", lambda spine, folder: None)
+    monkeypatch.setattr(fg.aws_s3, "handle", S3Obj)
+    monkeypatch.setattr(fg.aws_glue, "create_table", lambda *_, **__: None)
+    monkeypatch.setattr(
+        fg.aws_glue, "delete_table", lambda db, t: events.append(("delete_table",))
+    )
+    monkeypatch.setattr(fg, "dump_fg", lambda q: (True, "q1", "", {}))
+    monkeypatch.setattr(fg, "_pause", lambda secs: None)
+    monkeypatch.setattr(
+        fg,
+        "_query_status",
+        lambda q: events.append(("poll",)) or {fg.QUERY_STATUS_KEY: next(statuses)},
+    )
+    monkeypatch.setattr(
+        fg,
+        "read_fg",
+        lambda q: (
+            pd.DataFrame({fg.asof_utils.ROW_ID_COL: [1, 0], "v": [2, 1]}),
+            {fg.QUERY_STATUS_KEY: "SUCCEEDED"},
+        ),
+    )
+
+    spine = pd.DataFrame({"uid": [1, 2], "ts": [10, 20]})
+    df, _ = fg._athena_asof_join(spine, [], "ts", "s", (10, 21))
+
+    assert df["v"].tolist() == [1, 2]
+    assert [e[0] for e in events] == ["poll"] * 3 + ["delete_table", "delete_spine"]
+    assert events[-1][1].endswith("/spine.parquet")
+
+
+def test_read_athena_returns_status_on_failure(monkeypatch):
+    monkeypatch.setattr(fg, "dump_fg", lambda q: (True, "q1", "", {}))
+    monkeypatch.setattr(fg, "read_fg", lambda q: None)
+
+    df, status = fg._read_athena("select 1")
+
+    assert df is None
+    assert status[fg.QUERY_ID_KEY] == "q1"
+    assert status[fg.ENGINE_KEY] == fg.ENGINE_ATHENA
+
+
+def test_read_fg_removes_downloaded_result(tmp_path, monkeypatch):
+    result = tmp_path / "q1.csv"
+    monkeypatch.setattr(fg, "_pause", lambda secs: None)
+    monkeypatch.setattr(
+        fg,
+        "_query_status",
+        lambda q: {fg.QUERY_STATUS_KEY: "SUCCEEDED", fg.S3_PATH_KEY: "s3://b/q1.csv"},
+    )
+    monkeypatch.setattr(
+        fg, "_download_from_s3", lambda url: result.write_text("a\n1\n") and str(result)
+    )
+
+    df, _ = fg.read_fg("q1")
+
+    assert df["a"].tolist() == [1]
+    assert not result.exists()
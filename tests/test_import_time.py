@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ["boto3", "botocore", "numpy", "pandas", "pyarrow", "pyspark"]
+# generous, cold imports of the heavy modules alone take seconds
+IMPORT_BUDGET_SECS = 0.5
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=REPO_ROOT,
+    )
+
+
+def test_import_skips_heavy_modules():
+    code = (
+        "import sys\n"
+        "import featurestore.clients.fg, featurestore.clients.catalog\n"
+        "import featurestore.clients.serving, featurestore.clients.materializer\n"
+        "import featurestore.clients.backfill\n"
+        f"print([m for m in {HEAVY_MODULES} if m in sys.modules])"
+    )
+
+    assert _run(code).stdout.strip() == "[]"
+
+
+def test_import_time_budget():
+    stderr = _run("import featurestore.clients.fg", "-X", "importtime").stderr
+
+    # lines are "import time: self [us] | cumulative | module"
+    cumulative = {
+        fields[2].strip(): int(fields[1])
+        for fields in (line.split("|") for line in stderr.splitlines())
+        if len(fields) == 3 and fields[1].strip().isdigit()
+    }
+    assert cumulative["featurestore.clients.fg"] / 1e6 < IMPORT_BUDGET_SECS
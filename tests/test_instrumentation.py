@@ -0,0 +1,98 @@
+import io
+import json
+
+import pytest
+
+from featurestore.clients import fg, instrumentation
+
+
+@pytest.fixture
+def collector():
+    collector = instrumentation.MemoryCollector()
+    instrumentation.add_exporter(collector)
+    yield collector
+    instrumentation.remove_exporter(collector)
+
+
+def test_spans_nest_within_trace(collector):
+    with instrumentation.span("outer", trace_id="t1") as outer:
+        with instrumentation.span("inner", table="x"):
+            instrumentation.count("rows", 3)
+            instrumentation.count("rows", 2)
+        assert instrumentation.trace_id() == "t1"
+
+    (inner,) = collector.by_name("inner")
+    assert inner.trace_id == "t1"
+    assert inner.parent_id == outer.span_id
+    assert inner.counters == {"rows": 5}
+    assert inner.attrs == {"table": "x"}
+    assert outer.parent_id is None
+    assert instrumentation.trace_id() is None
+
+
+def test_span_records_error(collector):
+    with pytest.raises(ValueError):
+        with instrumentation.span("failing"):
+            raise ValueError("boom")
+
+    assert collector.by_name("failing")[0].error == "ValueError"
+
+
+def test_traced_and_record(collector):
+    @instrumentation.traced("fn")
+    def fn():
+        instrumentation.record("remote", 0.5, {"bytes": 10})
+        return 1
+
+    assert fn() == 1
+
+    (remote,) = collector.by_name("remote")
+    (traced,) = collector.by_name("fn")
+    assert remote.secs == 0.5
+    assert remote.counters == {"bytes": 10}
+    assert remote.parent_id == traced.span_id
+
+
+def test_prometheus_text():
+    exporter = instrumentation.PrometheusExporter(prefix="fs")
+    instrumentation.add_exporter(exporter)
+    try:
+        for _ in range(2):
+            with instrumentation.span("upload"):
+                instrumentation.count("bytes", 100)
+    finally:
+        instrumentation.remove_exporter(exporter)
+
+    text = exporter.text()
+    assert 'fs_span_seconds_count{span="upload"} 2' in text
+    assert 'fs_span_errors_total{span="upload"} 0' in text
+    assert 'fs_bytes_total{span="upload"} 200.0' in text
+
+
+def test_invoke_lambda_propagates_trace(monkeypatch, collector):
+    sent = {}
+
+    def invoke(endpoint, payload):
+        sent.update(payload)
+        body = {
+            fg.STATUS_KEY: fg.STATUS_OK,
+            fg.SPANS_KEY: [
+                {"name": "lambda.s3_copy", "secs": 0.25, "counters": {"files": 2}}
+            ],
+        }
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "Payload": io.BytesIO(json.dumps(body).encode("utf-8")),
+        }
+
+    monkeypatch.setattr(fg.aws_lambda, "invoke", invoke)
+
+    with instrumentation.span("caller", trace_id="t2"):
+        success, _ = fg._invoke_lambda(fg.ACTION_CREATE_PARTITION, {})
+
+    assert success
+    assert sent[fg.TRACE_ID_KEY] == "t2"
+    (copy,) = collector.by_name("lambda.s3_copy")
+    assert copy.trace_id == "t2"
+    assert copy.counters == {"files": 2}
+    assert copy.parent_id == collector.by_name("fg.lambda")[0].span_id
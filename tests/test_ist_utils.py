@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from featurestore.clients import ist_utils
 
 
@@ -5,3 +7,11 @@ def test_to_partition():
     result = ist_utils.to_partition(1562956200)
 
     assert result == "y=2019/m=07/d=13"
+
+
+def test_to_epoch_naive_datetime_is_ist():
+    assert ist_utils.to_epoch(datetime(2019, 7, 13)) == 1562956200
+
+
+def test_from_epoch_secs():
+    assert ist_utils.from_epoch_secs(1562956200, "ms") == 1562956200000
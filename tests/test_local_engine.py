@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from featurestore.clients import fg, local_engine
+
+pytest.importorskip("duckdb")
+
+PREFIX = "feature_store/c/a/e/data/v1"
+
+
+@pytest.fixture
+def cached_fg(tmp_path, monkeypatch):
+    """a FG table t with a file per day, already in the local cache"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    files = []
+    for day in ["01", "02", "03"]:
+        key = f"{PREFIX}/y=2020/m=01/d={day}/part-0.parquet"
+        local = tmp_path / key
+        os.makedirs(local.parent)
+        pq.write_table(pa.table({"id": [1, 2], "v": [int(day)] * 2}), str(local))
+        files.append(local_engine.DataFile(key, 100, "2020", "01", day))
+
+    monkeypatch.setattr(local_engine, "LOCAL_CACHE_PATH", str(tmp_path))
+    monkeypatch.setattr(local_engine, "table_files", lambda table: files)
+    return files
+
+
+def _days(plan, table="t"):
+    return [f.d for f in plan.tables[table]]
+
+
+def test_plan_prunes_partitions(cached_fg):
+    plan = local_engine.plan_query(
+        "select * from feature_store.t where y = '2020' and d in ('01', '03')"
+    )
+
+    assert _days(plan) == ["01", "03"]
+    assert plan.scan_bytes == 200
+
+
+def test_plan_prunes_by_alias(cached_fg):
+    plan = local_engine.plan_query(
+        "select a.id from feature_store.t a join feature_store.t b on a.id = b.id"
+        " where a.d = '01' and b.d >= '03'"
+    )
+
+    assert _days(plan) == ["01", "03"]
+
+
+def test_plan_keeps_all_unless_pruned_by_and(cached_fg):
+    for query in [
+        "select * from feature_store.t where d = '01' or id = 1",
+        "select * from (select * from feature_store.t) where d = '01'",
+        "select * from feature_store.t where id = 1",
+    ]:
+        assert _days(local_engine.plan_query(query)) == ["01", "02", "03"]
+
+
+def test_query_local(cached_fg):
+    df, status = local_engine.query(
+        "select d, sum(v) as total from feature_store.t"
+        " where m = '01' and d > '01' group by d order by d"
+    )
+
+    assert status[fg.ENGINE_KEY] == fg.ENGINE_LOCAL
+    assert status[local_engine.SCANNED_BYTES_KEY] == 200
+    assert df.to_dict("list") == {"d": ["02", "03"], "total": [4, 6]}
+
+
+def test_query_routes_large_scans_to_athena(cached_fg, monkeypatch):
+    monkeypatch.setattr(fg, "dump_fg", lambda sql: (False, "", "", {}))
+
+    _, status = local_engine.query("select * from feature_store.t", 299)
+
+    assert status[fg.ENGINE_KEY] == fg.ENGINE_ATHENA
+
+
+def test_query_local_fills_added_columns(cached_fg, tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    key = f"{PREFIX}/y=2020/m=01/d=04/part-0.parquet"
+    local = tmp_path / key
+    os.makedirs(local.parent)
+    pq.write_table(pa.table({"id": [1], "v": [4], "score": [0.5]}), str(local))
+    cached_fg.append(local_engine.DataFile(key, 100, "2020", "01", "04"))
+
+    df, _ = local_engine.query(
+        "select d, score from feature_store.t where id = 1 order by d"
+    )
+
+    assert df["d"].tolist() == ["01", "02", "03", "04"]
+    assert df["score"].isna().tolist() == [True, True, True, False]
@@ -0,0 +1,103 @@
+import json
+from decimal import Decimal
+
+import pandas as pd
+
+from featurestore.clients import bloom, manifest_utils
+
+
+def _entry(tmp_path, df, name="part-0.parquet"):
+    path = str(tmp_path / name)
+    df.to_parquet(path, index=False)
+    return manifest_utils.file_entry(f"data/{name}", path, 123, "ts")
+
+
+def test_file_entry_stats(tmp_path):
+    df = pd.DataFrame(
+        {
+            "ts": [30, 10, 20],
+            "v": ["b", None, "a"],
+            "x": [1.5, 2.5, 0.5],
+            "amount": [Decimal("10.25"), Decimal("9.50"), Decimal("100.00")],
+        }
+    )
+
+    entry = _entry(tmp_path, df)
+
+    assert entry["key"] == "data/part-0.parquet"
+    assert entry["size"] == 123
+    assert entry["rows"] == 3
+    assert (entry["time_min"], entry["time_max"]) == (10, 30)
+    assert entry["columns"]["v"] == {"nulls": 1, "min": "a", "max": "b"}
+    assert entry["columns"]["x"]["min"] == 0.5
+    assert entry["columns"]["x"]["max"] == 2.5
+    # decimals are exact strings, so the entry fits the lambda's json payload
+    assert entry["columns"]["amount"] == {"nulls": 0, "min": "9.50", "max": "100.00"}
+    assert json.loads(json.dumps(entry))["columns"]["amount"]["max"] == "100.00"
+
+
+def test_files_and_prune_by_time():
+    manifest = {
+        "partitions": {
+            "y=2019/m=07/d=14": {"files": [{"key": "c", "size": 3}]},
+            "y=2019/m=07/d=13": {
+                "files": [
+                    {"key": "a", "size": 1, "time_min": 0, "time_max": 9},
+                    {"key": "b", "size": 2, "time_min": 10, "time_max": 19},
+                ]
+            },
+        }
+    }
+
+    entries = manifest_utils.files(manifest)
+    assert [entry["key"] for entry in entries] == ["a", "b", "c"]
+    assert manifest_utils.total_bytes(entries) == 6
+    assert manifest_utils.files(manifest, ["y=2019/m=07/d=01"]) == []
+
+    pruned = manifest_utils.prune_by_time(entries, 10, 20)
+    # files without time stats are always kept
+    assert [entry["key"] for entry in pruned] == ["b", "c"]
+    assert manifest_utils.prune_by_time(entries, 9, 10)[0]["key"] == "a"
+
+
+def test_prune_by_keys(tmp_path):
+    entries = []
+    for bucket in range(2):
+        keys = [k for k in range(100) if bloom.bucket(k, 2) == bucket]
+        df = pd.DataFrame({"ts": [0] * len(keys), "uid": keys})
+        path = str(tmp_path / f"b{bucket}.parquet")
+        df.to_parquet(path, index=False)
+        entries.append(
+            manifest_utils.file_entry(f"b{bucket}", path, 1, "ts", "uid", bucket)
+        )
+
+    in_first = next(k for k in range(100) if bloom.bucket(k, 2) == 0)
+    in_second = next(k for k in range(100) if bloom.bucket(k, 2) == 1)
+
+    # the sidecars written beside the local files, by their s3 key
+    sidecars = {
+        entry["bloom"]["key"]: bloom.BloomFilter.from_bytes(
+            (tmp_path / f"b{entry['bucket']}.parquet.bloom").read_bytes()
+        )
+        for entry in entries
+    }
+
+    def kept(keys):
+        # only the filters of the candidate files are fetched
+        wanted = manifest_utils.bloom_candidates(entries, keys, "uid", 2)
+        blooms = {key: sidecars[key] for key in wanted}
+        pruned = manifest_utils.prune_by_keys(entries, keys, "uid", 2, blooms)
+        return wanted, [entry["key"] for entry in pruned]
+
+    assert kept([in_first]) == (["_b0.bloom"], ["b0"])
+    assert kept([in_first, in_second]) == (["_b0.bloom", "_b1.bloom"], ["b0", "b1"])
+    # outside the key range of both files
+    assert kept([1000, -1]) == ([], [])
+
+
+def test_bloom_key():
+    key = "feature_store/c/a/e/data/v1/y=2019/m=07/d=13/h-b00001.parquet"
+
+    assert manifest_utils.bloom_key(key) == (
+        "feature_store/c/a/e/data/v1/y=2019/m=07/d=13/_h-b00001.parquet.bloom"
+    )
@@ -0,0 +1,67 @@
+import threading
+
+import pandas as pd
+
+from featurestore.clients import materializer
+
+
+def test_pending_partitions():
+    watermark = {"y=2019/m=07/d=13": {"a": "e1", "b": "e2"}}
+    committed = {
+        "y=2019/m=07/d=13": [("a", 10, "e1"), ("b", 10, "e3")],
+        "y=2019/m=07/d=14": [("c", 10, "e4")],
+        "y=2019/m=07/d=12": [],
+    }
+
+    result = materializer._pending_partitions(watermark, committed)
+
+    assert result == [
+        ("y=2019/m=07/d=13", [("b", 10, "e3")]),
+        ("y=2019/m=07/d=14", [("c", 10, "e4")]),
+    ]
+
+
+def test_pending_partitions_all_seen():
+    watermark = {"y=2019/m=07/d=13": {"a": "e1"}}
+    committed = {"y=2019/m=07/d=13": [("a", 10, "e1")]}
+
+    assert materializer._pending_partitions(watermark, committed) == []
+
+
+def test_latest_per_key():
+    df = pd.DataFrame({"uid": [1, 2, 1], "ts": [20, 5, 10], "v": ["b", "c", "a"]})
+
+    result = materializer.latest_per_key(df, "uid", "ts")
+
+    assert sorted(result.itertuples(index=False)) == [(1, 20, "b"), (2, 5, "c")]
+
+
+def test_watermark_roundtrip(tmp_path):
+    path = str(tmp_path / "state" / "fg.online.json")
+    assert materializer._load_watermark(path) == {}
+
+    materializer._save_watermark(path, {"y=2019/m=07/d=13": {"a": "e1"}})
+
+    assert materializer._load_watermark(path) == {"y=2019/m=07/d=13": {"a": "e1"}}
+
+
+def test_memory_gate_bounds_in_flight_bytes():
+    reserve = materializer._memory_gate(100)
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work(size):
+        with reserve(size):
+            with lock:
+                in_flight[0] += min(size, 100)
+                peak[0] = max(peak[0], in_flight[0])
+            with lock:
+                in_flight[0] -= min(size, 100)
+
+    threads = [threading.Thread(target=work, args=(s,)) for s in [60, 60, 500, 30]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak[0] <= 100
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from featurestore.clients import online_store
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "online.db")
+
+
+def _write(db_path, df):
+    conn = online_store.connect(db_path)
+    return online_store.write_features(conn, "fg", "uid", "ts", "s", df)
+
+
+def test_latest_row_per_key(db_path):
+    df = pd.DataFrame({"uid": [1, 1, 2], "ts": [10, 20, 15], "score": [0.1, 0.2, 0.3]})
+    assert _write(db_path, df) == 2
+
+    result = online_store.get_online_features(["fg"], [1, 2, 3], db_path)["fg"]
+
+    assert result[0].values == {"ts": 20, "score": 0.2}
+    assert result[0].event_ms == 20000
+    assert result[1].values == {"ts": 15, "score": 0.3}
+    assert result[2] is None
+
+
+def test_older_rows_do_not_overwrite(db_path):
+    _write(db_path, pd.DataFrame({"uid": [1], "ts": [20], "score": [0.2]}))
+    _write(db_path, pd.DataFrame({"uid": [1], "ts": [10], "score": [0.1]}))
+
+    result = online_store.get_online_features(["fg"], [1], db_path)["fg"]
+
+    assert result[0].values["score"] == 0.2
+
+
+def test_appended_columns_pad_old_rows(db_path):
+    _write(db_path, pd.DataFrame({"uid": [1], "ts": [20], "score": [0.2]}))
+    _write(db_path, pd.DataFrame({"uid": [2], "ts": [20], "score": [0.3], "n": [4]}))
+
+    result = online_store.get_online_features(["fg"], [1, 2], db_path)["fg"]
+
+    assert result[0].values == {"ts": 20, "score": 0.2, "n": None}
+    assert result[1].values == {"ts": 20, "score": 0.3, "n": 4}
+
+
+def test_changed_columns_rejected(db_path):
+    _write(db_path, pd.DataFrame({"uid": [1], "ts": [20], "score": [0.2]}))
+
+    with pytest.raises(AssertionError):
+        _write(db_path, pd.DataFrame({"uid": [1], "ts": [20], "other": [0.2]}))
+
+
+def test_unknown_fg(db_path):
+    online_store.connect(db_path)
+
+    assert online_store.get_online_features(["nope"], [1], db_path) == {"nope": [None]}
+
+
+def test_keys_match_across_types(db_path):
+    import numpy as np
+
+    # an int key column with nulls is read as floats
+    df = pd.DataFrame({"uid": [1.0, None, 2.0], "ts": [10, 20, 30], "score": [1, 2, 3]})
+    assert _write(db_path, df) == 2
+
+    result = online_store.get_online_features(["fg"], [1, np.int64(2), 2.0], db_path)
+
+    assert [row.values["score"] for row in result["fg"]] == [1, 3, 3]
+    with pytest.raises(ValueError):
+        online_store.get_online_features(["fg"], [1.5], db_path)
+    with pytest.raises(ValueError):
+        online_store.get_online_features(["fg"], [None], db_path)
@@ -0,0 +1,94 @@
+import os
+import shutil
+import struct
+
+import pandas as pd
+import pytest
+
+from featurestore.clients import parquet_utils, partition_utils
+
+
+def test_footer_schema(tmp_path):
+    path = tmp_path / "part-0.parquet"
+    pd.DataFrame({"uid": [1, 2], "name": ["a", "b"]}).to_parquet(path, index=False)
+    data = path.read_bytes()
+    footer_len = struct.unpack("<I", data[-8:-4])[0]
+
+    schema = parquet_utils.footer_schema(data[-(footer_len + 8) :])  # noqa: E203
+
+    assert schema.names == ["uid", "name"]
+    assert str(schema.field("uid").type) == "int64"
+
+
+def test_read_keys_fills_added_columns(tmp_path, monkeypatch):
+    old, new = str(tmp_path / "old.parquet"), str(tmp_path / "new.parquet")
+    pd.DataFrame({"uid": [1, 2]}).to_parquet(old, index=False)
+    pd.DataFrame({"uid": [3], "score": [0.5]}).to_parquet(new, index=False)
+    monkeypatch.setattr(
+        parquet_utils, "download_key", lambda bucket, key: shutil.copy(key, f"{key}.dl")
+    )
+
+    df = parquet_utils.read_keys("bucket", [old, new], ["uid", "score"])
+    filtered = parquet_utils.read_keys(
+        "bucket", [old, new], ["uid", "score"], [("score", ">", 0.1)]
+    )
+
+    assert df["uid"].tolist() == [1, 2, 3]
+    assert df["score"].isna().tolist() == [True, True, False]
+    assert filtered.to_dict("list") == {"uid": [3], "score": [0.5]}
+    # downloads are removed once read
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.parquet", "old.parquet"]
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        [("score", "=", None)],
+        [("score", "!=", None)],
+        [("score", ">", 0.1)],
+        [("score", "in", [0.5, None])],
+        [("score", "not in", [0.5])],
+        [("score", "not in", [0.5, None])],
+        [("name", "=", None), ("uid", "!=", 4)],
+        [("name", "in", [None])],
+        [("name", "not in", ["a"])],
+    ],
+)
+def test_read_keys_filters_match_athena(tmp_path, monkeypatch, filters):
+    """local filters select the rows of the sql predicate athena is sent"""
+    duckdb = pytest.importorskip("duckdb")
+    # the old file predates the score and name columns
+    old, new = str(tmp_path / "old.parquet"), str(tmp_path / "new.parquet")
+    pd.DataFrame({"uid": [1, 2]}).to_parquet(old, index=False)
+    pd.DataFrame(
+        {"uid": [3, 4, 5], "score": [0.5, None, 0.7], "name": ["a", None, "b"]}
+    ).to_parquet(new, index=False)
+    monkeypatch.setattr(
+        parquet_utils, "download_key", lambda bucket, key: shutil.copy(key, f"{key}.dl")
+    )
+
+    local = parquet_utils.read_keys("bucket", [old, new], ["uid"], filters)
+    predicate = partition_utils.filter_predicate(filters)
+    sql = duckdb.sql(
+        f"select uid from read_parquet(['{old}', '{new}'], union_by_name = true)"
+        f" where {predicate}"
+    ).df()
+
+    assert sorted(local["uid"].tolist()) == sorted(sql["uid"].tolist())
+
+
+def test_download_key_unique_per_call(monkeypatch):
+    monkeypatch.setattr(
+        parquet_utils.aws_s3,
+        "save_as",
+        lambda bucket, key, fname: open(fname, "w").write(key),
+    )
+
+    paths = [parquet_utils.download_key("bucket", "a/part-0.parquet") for _ in "ab"]
+
+    try:
+        assert paths[0] != paths[1]
+        assert all(open(path).read() == "a/part-0.parquet" for path in paths)
+    finally:
+        for path in paths:
+            os.remove(path)
@@ -0,0 +1,96 @@
+import pytest
+
+from featurestore.clients import partition_utils
+
+# 2019-07-13 00:00:00 IST
+DAY_START = 1562956200
+DAY_SECS = 86400
+
+
+def test_partition_suffixes():
+    result = partition_utils.partition_suffixes(DAY_START, DAY_START + 2 * DAY_SECS)
+
+    assert result == ["y=2019/m=07/d=13", "y=2019/m=07/d=14"]
+
+
+def test_partition_suffixes_end_exclusive():
+    result = partition_utils.partition_suffixes(DAY_START - 1, DAY_START + DAY_SECS)
+
+    assert result == ["y=2019/m=07/d=12", "y=2019/m=07/d=13"]
+
+
+def test_partition_days_empty_range():
+    with pytest.raises(AssertionError):
+        partition_utils.partition_days(DAY_START, DAY_START)
+
+
+def test_partition_predicate_single_day():
+    result = partition_utils.partition_predicate(DAY_START, DAY_START + 10)
+
+    assert result == "(y = '2019' AND m = '07' AND d = '13')"
+
+
+def test_partition_predicate_day_range():
+    result = partition_utils.partition_predicate(DAY_START, DAY_START + 3 * DAY_SECS)
+
+    assert result == "(y = '2019' AND m = '07' AND d BETWEEN '13' AND '15')"
+
+
+def test_partition_predicate_collapses_months_and_years():
+    # 2018-12-31 IST to 2020-03-01 IST, exclusive
+    start = 1546194600
+    end = 1583001000
+    result = partition_utils.partition_predicate(start, end)
+
+    assert result == (
+        "((y = '2018' AND m = '12' AND d = '31')"
+        " OR y = '2019'"
+        " OR (y = '2020' AND m BETWEEN '01' AND '02'))"
+    )
+
+
+def test_filter_predicate():
+    result = partition_utils.filter_predicate(
+        [("ts", ">=", 10), ("name", "in", ["a", "b'c"]), ("ok", "=", True)]
+    )
+
+    assert result == "ts >= 10 AND name IN ('a', 'b''c') AND ok = true"
+
+
+def test_filter_predicate_none():
+    result = partition_utils.filter_predicate(
+        [
+            ("a", "=", None),
+            ("b", "!=", None),
+            ("c", "in", ["x", None]),
+            ("d", "not in", [1, None]),
+            ("e", "in", [None]),
+        ]
+    )
+
+    assert result == (
+        "a IS NULL AND b IS NOT NULL AND (c IN ('x') OR c IS NULL)"
+        " AND (d NOT IN (1) AND d IS NOT NULL) AND e IS NULL"
+    )
+    with pytest.raises(AssertionError):
+        partition_utils.filter_predicate([("a", "<", None)])
+
+
+def test_filter_predicate_bad_op():
+    with pytest.raises(AssertionError):
+        partition_utils.filter_predicate([("ts", "like", "x")])
+
+
+def test_partition_upto_predicate():
+    result = partition_utils.partition_upto_predicate(DAY_START + 10)
+
+    assert result == (
+        "(y < '2019' OR (y = '2019' AND m < '07')"
+        " OR (y = '2019' AND m = '07' AND d <= '13'))"
+    )
+
+
+def test_partition_predicate_qualified():
+    result = partition_utils.partition_predicate(DAY_START, DAY_START + 10, "t")
+
+    assert result == "(t.y = '2019' AND t.m = '07' AND t.d = '13')"
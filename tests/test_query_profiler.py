@@ -0,0 +1,72 @@
+from featurestore.clients import query_profiler
+
+
+def test_fingerprint_ignores_literals():
+    a = "select * from feature_store.t where y = '2020' and id in (1, 2, 3);"
+    b = "SELECT *  FROM feature_store.t\n WHERE y = '2021' AND id IN (7)"
+
+    assert query_profiler.fingerprint(a) == query_profiler.fingerprint(b)
+    assert query_profiler.fingerprint(a) != query_profiler.fingerprint(
+        "select id from feature_store.t where y = '2020'"
+    )
+
+
+def test_unpruned_tables():
+    pruned = "select * from feature_store.t where (y = '2020' AND m = '01')"
+    whole = "select * from feature_store.t a join feature_store.u b on a.id = b.id"
+    quoted = "select * from feature_store.t where name = 'y = 1'"
+
+    assert query_profiler.unpruned_tables(pruned, "feature_store") == []
+    assert query_profiler.unpruned_tables(whole, "feature_store") == ["t", "u"]
+    assert query_profiler.unpruned_tables(quoted, "feature_store") == ["t"]
+    assert query_profiler.unpruned_tables("select 1", "feature_store") == []
+
+
+def test_unpruned_tables_unqualified_and_aliased():
+    def unpruned(query):
+        return query_profiler.unpruned_tables(query, "feature_store")
+
+    # unqualified tables are in the default database
+    assert unpruned("select * from t") == ["t"]
+    assert unpruned("select * from t where y = '2020'") == []
+    assert unpruned("select * from other.t") == []
+    # predicates bind to the table their column is qualified by
+    joined = "select * from t a join u b on a.id = b.id where a.y = '2020'"
+    assert unpruned(joined) == ["u"]
+    assert unpruned(joined.replace("a.y", "y")) == ["t", "u"]
+    # and unqualified ones to the table of their subquery
+    nested = "select * from t where id in (select id from u where y = '2020')"
+    assert unpruned(nested) == ["t"]
+    asof = (
+        "WITH spine AS (SELECT * FROM stage.spine),"
+        " f0 AS (SELECT s.id FROM spine s JOIN feature_store.t t ON s.id = t.id"
+        " WHERE (t.y = '2019' AND t.m = '07'))"
+        " SELECT spine.* FROM spine LEFT JOIN f0 ON spine.id = f0.id"
+    )
+    assert unpruned(asof) == []
+
+
+def test_heaviest_and_unpruned(tmp_path):
+    path = str(tmp_path / "queries.db")
+    runs = [
+        ("q1", "select * from feature_store.t where y = '2020'", 100),
+        ("q2", "select * from feature_store.t where y = '2021'", 300),
+        ("q3", "select * from feature_store.t", 50),
+    ]
+    for query_id, query, scanned in runs:
+        statistics = {"DataScannedInBytes": scanned, "EngineExecutionTimeInMillis": 10}
+        query_profiler.record(
+            query_id, query, statistics, "feature_store", "SUCCEEDED", path
+        )
+
+    heaviest = query_profiler.heaviest(path=path)
+    assert [(s.runs, s.scanned_bytes, s.max_scanned_bytes) for s in heaviest] == [
+        (2, 400, 300),
+        (1, 50, 50),
+    ]
+    assert heaviest[0].cost_usd == query_profiler.cost_usd(400)
+
+    (unpruned,) = query_profiler.unpruned(path=path)
+    assert unpruned.query_id == "q3"
+    assert unpruned.tables == ["t"]
+    assert "q3" in query_profiler.report(path=path)
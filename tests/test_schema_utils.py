@@ -58,6 +58,12 @@ def test_match():
     assert schema_utils.match(expected_schema, {"name": "string", "ts": "bigint"})
 
 
+def test_match_projected():
+    projected = {**expected_schema, schema_utils.SCHEMA_PROJECTED: True}
+
+    assert schema_utils.match(projected, {"name": "string", "ts": "bigint"})
+
+
 def _match_fail(expected, actual, message):
     with pytest.raises(AssertionError) as err:
         schema_utils.match(expected, actual)
@@ -99,3 +105,35 @@ def test_match_missing_time_col():
         {"ts": "bigint"},
         "Missing ts1 in schema",
     )
+
+
+def test_evolve():
+    evolved = schema_utils.evolve(expected_schema, {"score": "double"}, 1000)
+    twice = schema_utils.evolve(evolved, {"tags": "array<string>"}, 2000)
+
+    assert [c for c in twice if c not in schema_utils.META_KEYS] == [
+        "name",
+        "ts",
+        "score",
+        "tags",
+    ]
+    assert twice[schema_utils.SCHEMA_REVISIONS] == [
+        {"at_ms": 1000, "added": {"score": "double"}},
+        {"at_ms": 2000, "added": {"tags": "array<string>"}},
+    ]
+    assert schema_utils.match(
+        twice,
+        {"name": "string", "ts": "bigint", "score": "double", "tags": "array<string>"},
+    )
+    assert schema_utils.SCHEMA_REVISIONS not in expected_schema
+
+
+def test_evolve_only_adds():
+    for added, message in [
+        ({}, "No columns to add"),
+        ({"name": "int"}, "name already in schema"),
+        ({"y": "string"}, "Reserved column name y"),
+    ]:
+        with pytest.raises(AssertionError) as err:
+            schema_utils.evolve(expected_schema, added, 1000)
+        assert err.value.args[0] == message
@@ -0,0 +1,103 @@
+import asyncio
+
+import pandas as pd
+
+from featurestore.clients import codec, online_store, serving
+
+
+def _store(tmp_path):
+    path = str(tmp_path / "online.db")
+    df = pd.DataFrame({"uid": [1, 2], "ts": [10, 20], "score": [0.1, 0.2]})
+    online_store.write_features(online_store.connect(path), "fg", "uid", "ts", "s", df)
+    return path
+
+
+def test_coalesced_lookups(tmp_path):
+    path = _store(tmp_path)
+
+    async def run():
+        server = serving.FeatureServer(path, batch_window_ms=20)
+        batcher = asyncio.ensure_future(server._batch_loop())
+        results = await asyncio.gather(
+            *[server.lookup(["fg"], [key]) for key in [1, 2, 3, 1]]
+        )
+        batcher.cancel()
+        return server, results
+
+    server, results = asyncio.run(run())
+
+    assert results[0] == {
+        "fg": [[{"ts": 10, "score": 0.1}, 10000, results[0]["fg"][0][2]]]
+    }
+    assert results[1]["fg"][0][0] == {"ts": 20, "score": 0.2}
+    assert results[2] == {"fg": [None]}
+    assert server.counters["batches"] == 1
+
+
+def test_cached_lookups_skip_store(tmp_path):
+    path = _store(tmp_path)
+
+    async def run():
+        server = serving.FeatureServer(path)
+        batcher = asyncio.ensure_future(server._batch_loop())
+        await server.lookup(["fg"], [1, 2])
+        await server.lookup(["fg"], [2, 1])
+        batcher.cancel()
+        return server
+
+    server = asyncio.run(run())
+
+    assert server.counters["batches"] == 1
+    assert server.counters["cache_hits"] == 2
+
+
+def test_http_roundtrip(tmp_path):
+    path = _store(tmp_path)
+    body = codec.encode({"fgs": ["fg"], "keys": [2]})
+
+    async def run():
+        server = serving.FeatureServer(path)
+        batcher = asyncio.ensure_future(server._batch_loop())
+        reader = asyncio.StreamReader()
+        reader.feed_data(
+            b"POST /features HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+        )
+        reader.feed_eof()
+        request = await serving._read_request(reader)
+        response = await server._respond(*request)
+        batcher.cancel()
+        return server, response
+
+    server, (status, content_type, payload) = asyncio.run(run())
+
+    assert status == "200 OK"
+    assert codec.decode(payload)["fg"][0][0] == {"ts": 20, "score": 0.2}
+    assert 'quantile="0.99"' in server.metrics()
+
+
+def test_malformed_request_gets_400(tmp_path):
+    class Writer:
+        def __init__(self):
+            self.data = b""
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+        def close(self):
+            pass
+
+    async def run():
+        server = serving.FeatureServer(_store(tmp_path))
+        reader, writer = asyncio.StreamReader(), Writer()
+        reader.feed_data(b"GARBAGE\r\n\r\n")
+        reader.feed_eof()
+        await server._handle(reader, writer)
+        return server, writer.data
+
+    server, response = asyncio.run(run())
+
+    assert response.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert server.counters["errors"] == 1
@@ -0,0 +1,126 @@
+import gzip
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from pyspark.sql.types import (
+    ArrayType,
+    DecimalType,
+    DoubleType,
+    IntegerType,
+    LongType,
+    MapType,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+
+from featurestore.clients import fg, spark_utils
+
+
+def test_profile_conf():
+    conf = spark_utils.profile_conf("multicore")
+
+    assert conf["spark.master"] == "local[*]"
+    assert conf["spark.sql.execution.arrow.pyspark.enabled"] == "true"
+    assert conf["spark.sql.warehouse.dir"] == spark_utils.SPARK_WAREHOUSE
+    assert spark_utils.profile_conf(spark_utils.DEFAULT_PROFILE) == {
+        "spark.sql.warehouse.dir": spark_utils.SPARK_WAREHOUSE,
+        "spark.master": "local",
+    }
+
+
+def test_profile_conf_unknown():
+    with pytest.raises(AssertionError):
+        spark_utils.profile_conf("missing")
+
+
+def test_ddl():
+    schema = {"uid": "bigint", "tags": "array<string>"}
+
+    assert spark_utils.ddl(schema) == "`uid` bigint, `tags` array<string>"
+
+
+def test_struct_schema():
+    struct = StructType(
+        [
+            StructField("User Id", LongType()),
+            StructField("amount", DecimalType(12, 2)),
+            StructField("tags", ArrayType(StringType())),
+            StructField("attrs", MapType(StringType(), IntegerType())),
+            StructField("point", StructType([StructField("x", DoubleType())])),
+            StructField("ts", TimestampType()),
+        ]
+    )
+
+    assert spark_utils.struct_schema(struct) == {
+        "user_id": "bigint",
+        "amount": "decimal(12,2)",
+        "tags": "array<string>",
+        "attrs": "map<string,int>",
+        "point": "struct<x:double>",
+        "ts": "timestamp",
+    }
+
+
+@pytest.mark.skipif(shutil.which("java") is None, reason="spark needs java")
+def test_get_schema_concurrent():
+    # distinct columns per Df, so a schema read from a shared temp table,
+    # as "describe table" once did, would mix up the Dfs of other threads
+    frames = [
+        pd.DataFrame({f"c{i}_{j}": [j] for j in range(20)}).assign(name="x")
+        for i in range(16)
+    ]
+    expected = [
+        {**{f"c{i}_{j}": "bigint" for j in range(20)}, "name": "string"}
+        for i in range(16)
+    ]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(5):
+            assert list(pool.map(fg._get_pandas_schema, frames)) == expected
+
+
+def test_csv_schema_from_fg_schema():
+    fg_schema = {
+        "user_id": "bigint",
+        "score": "double",
+        "ts": "bigint",
+        "__time_col__": "ts",
+        "__time_col_unit__": "s",
+    }
+
+    result = spark_utils.csv_schema(["ts", "User Id", "score"], fg_schema)
+
+    assert list(result.items()) == [
+        ("ts", "bigint"),
+        ("user_id", "bigint"),
+        ("score", "double"),
+    ]
+
+
+def test_csv_schema_from_glue_columns():
+    columns = [
+        {"Name": "user_id", "Type": "bigint"},
+        {"Name": "name", "Type": "string"},
+    ]
+
+    assert spark_utils.csv_schema(["name"], columns) == {"name": "string"}
+    with pytest.raises(AssertionError):
+        spark_utils.csv_schema(["name", "extra"], columns)
+
+
+def test_get_csv_file_decompresses_gz(tmp_path):
+    content = b"id,name\n1,a\n2,b\n"
+    fname = str(tmp_path / "data.csv.gz")
+    with gzip.open(fname, "wb") as f:
+        f.write(content)
+
+    local = spark_utils._get_csv_file(fname)
+
+    assert local.endswith("data.csv")
+    with open(local, "rb") as f:
+        assert f.read() == content
+    assert spark_utils._csv_header(local) == ["id", "name"]